@@ -0,0 +1,3 @@
+"""
+Benchmarks of the processing stages on synthetic inputs, see benchmarks.run
+"""
@@ -0,0 +1,166 @@
+"""
+Synthetic inputs at a configurable scale: sonic raw files, an EddyPro essentials file, DSAA grids, and stand-ins
+for the EddyPro and footprint model executables so the subprocess paths run without the Windows binaries
+"""
+
+import json
+import os
+import sys
+from configparser import ConfigParser
+
+import numpy as np
+import pandas as pd
+
+from core.grd import write_grd
+
+# hours of sonic data, sampling rate, minutes per raw file, half-hours of met data, grids and their size
+SCALES = {'tiny': dict(sonic_hours=1, sonic_hz=10, file_minutes=20, met_periods=48, n_grids=24, grid_size=40),
+          'small': dict(sonic_hours=6, sonic_hz=10, file_minutes=60, met_periods=48 * 14, n_grids=96, grid_size=150),
+          'medium': dict(sonic_hours=24, sonic_hz=20, file_minutes=60, met_periods=48 * 92, n_grids=480,
+                         grid_size=150),
+          'large': dict(sonic_hours=24 * 7, sonic_hz=20, file_minutes=60, met_periods=48 * 365, n_grids=2400,
+                        grid_size=150)}
+START = pd.Timestamp('2018-07-01 00:00')
+SONIC_FORMAT = {'SONIC': {'parse_dates': [0]}}
+PLOT_SETTINGS = {name: {'ylim': ylim, 'style': '-', 'params': {'linewidth': 1}, 'label': name,
+                        'y_ticks': list(np.linspace(*ylim, 5))}
+                 for name, ylim in [('wind_speed', [0, 10]), ('wind_dir', [0, 360]), ('T', [0, 40]),
+                                    ('rh_air', [0, 100]), ('H', [-100, 400])]}
+
+# stand-ins, same console output and files as the real programs as far as the pipeline looks at them
+EDDYPRO_RP = '''#!{python}
+import configparser, os, sys
+project = configparser.ConfigParser(interpolation=None)
+project.optionxform = str
+project.read(sys.argv[1])
+data_path = project.get('RawProcess_General', 'data_path')
+out_path = project.get('Project', 'out_path')
+rows = []
+for period_file in sorted(os.listdir(data_path)):
+    print('Re-calculating', period_file, flush=True)
+    rows.append('{{}},{{}},90.0,2.0,0.3,-50.0,10.0,1.2,0.4,298.15,60.0\\n'.format(
+        period_file[:10], period_file[11:16].replace('-', ':')))
+with open(os.path.join(out_path, 'eddypro_ADV_essentials_2019-11-03T120000_adv.csv'), 'w') as essentials:
+    essentials.write('date,time,wind_dir,wind_speed,u*,L,H,rho_air,var(v),t_air,rh_air\\n')
+    essentials.writelines(rows)
+print('Note: done', flush=True)
+sys.stdin.read()
+'''
+EDDYPRO_FCC = '''#!{python}
+import sys
+print('Note: nothing to correct', flush=True)
+sys.stdin.read()
+'''
+CFTP01 = '''#!{python}
+import sys
+with open('02metdata.dat') as met_data:
+    rows = met_data.readlines()[1:]
+for row in rows:
+    time_stamp = row.split('\\t')[0]
+    open(time_stamp + '.grd', 'w').close()
+    print('ouput file', time_stamp, flush=True)
+print('ok, please press any key', flush=True)
+sys.stdin.read()
+'''
+
+
+def make_stand_in(path: str, script: str):
+    with open(path, 'w') as stand_in:
+        stand_in.write(script.format(python=sys.executable))
+    os.chmod(path, 0o755)
+    return path
+
+
+def make_sonic_raw(raw_dir: str, *, sonic_hours: int, sonic_hz: int, file_minutes: int, **_):
+    os.makedirs(raw_dir, exist_ok=True)
+    rng = np.random.default_rng(0)
+    rows_per_file = file_minutes * 60 * sonic_hz
+    n_bytes = n_rows = 0
+    for n in range(sonic_hours * 60 // file_minutes):
+        time_index = START + pd.to_timedelta(np.arange(n * rows_per_file, (n + 1) * rows_per_file) / sonic_hz, 's')
+        raw = pd.DataFrame({'time': time_index}).assign(
+            **{column: rng.normal(mean, 1., rows_per_file).round(3)
+               for column, mean in [('u', 2.), ('v', 0.), ('w', 0.), ('T_sonic', 298.)]})
+        raw_path = os.path.join(raw_dir, 'sonic_{:0>4d}.csv'.format(n))
+        raw.to_csv(raw_path, index=False)
+        n_bytes += os.path.getsize(raw_path)
+        n_rows += len(raw)
+    return n_rows, n_bytes
+
+
+def make_essentials(result_dir: str, *, met_periods: int, **_):
+    os.makedirs(result_dir, exist_ok=True)
+    rng = np.random.default_rng(1)
+    periods = START + pd.to_timedelta(np.arange(1, met_periods + 1) * 30, 'min')
+    essentials = pd.DataFrame({'date': periods.strftime('%Y-%m-%d'),
+                               'time': periods.strftime('%H:%M'),
+                               'wind_dir': rng.uniform(0., 360., met_periods).round(2),
+                               'wind_speed': rng.uniform(.5, 6., met_periods).round(3),
+                               'u*': rng.uniform(.1, .6, met_periods).round(3),
+                               'L': (rng.choice([-1, 1], met_periods) * rng.uniform(5., 500., met_periods)).round(2),
+                               'H': rng.uniform(-50., 300., met_periods).round(2),
+                               'rho_air': 1.2,
+                               'var(v)': rng.uniform(.05, 1., met_periods).round(4),
+                               't_air': rng.uniform(285., 305., met_periods).round(2),
+                               'rh_air': rng.uniform(30., 95., met_periods).round(2)})
+    result_path = os.path.join(result_dir, 'eddypro_ADV_essentials_2019-11-03T120000_adv.csv')
+    essentials.to_csv(result_path, index=False)
+    return result_path
+
+
+def make_grd_dir(grd_dir: str, *, n_grids: int, grid_size: int, **_):
+    os.makedirs(grd_dir, exist_ok=True)
+    y, x = np.mgrid[0:grid_size, 0:grid_size]
+    rng = np.random.default_rng(2)
+    grd_paths = []
+    for n, time_stamp in enumerate(START + pd.to_timedelta(np.arange(1, n_grids + 1) * 30, 'min')):
+        cx, cy = rng.uniform(.2, .8, 2) * grid_size
+        grid = np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * (grid_size / 15) ** 2))
+        grd_paths.append(os.path.join(grd_dir, '{:%y%m%d%H%M}.grd'.format(time_stamp)))
+        write_grd(grd_paths[-1], grid / grid.sum(), (0., 5. * (grid_size - 1)), (0., 5. * (grid_size - 1)))
+    return grd_paths
+
+
+def make_config(work_dir: str, scale: dict) -> ConfigParser:
+    """
+    Project config over the fixture directories of work_dir, formats.json is written to the working directory
+    """
+    end = START + pd.Timedelta(hours=scale['sonic_hours'])
+    with open('formats.json', 'w') as fmt:
+        json.dump(SONIC_FORMAT, fmt)
+    with open(os.path.join(work_dir, 'plots.json'), 'w') as pcs:
+        json.dump({'plot_settings': PLOT_SETTINGS}, pcs)
+    grid_extent = 5. * (scale['grid_size'] - 1)
+    config = ConfigParser()
+    config.read_dict({'Project': {'Project_Name': 'benchmark',
+                                  'CPU_Cores': str(os.cpu_count() or 1),
+                                  'Data_Periods_Start': str(START),
+                                  'Data_Periods_End': str(end - pd.Timedelta('30min')),
+                                  'Data_Averaging_Interval': '30min'},
+                      'Sonic': {'Raw_Data_Directory': os.path.join(work_dir, 'raw'),
+                                'Converted_Data_Output_Directory': os.path.join(work_dir, 'split'),
+                                'Raw_Data_Format_Code': 'SONIC',
+                                'Raw_Data_Initial': 'sonic',
+                                'Raw_Data_Extension': '.csv'},
+                      'Eddy_Pro': {'Eddy_Pro_Binaries_Directory': os.path.join(work_dir, 'bin'),
+                                   'Eddy_Pro_Configuration_Path': os.path.join(work_dir, 'ADV.eddypro'),
+                                   'Keep_Eddy_Pro_Logs': '',
+                                   'Idle_Timeout': '60'},
+                      'Footprint': {'Eddy_Pro_Results_Directory': os.path.join(work_dir, 'epr'),
+                                    'Footprint_Model_Path': os.path.join(work_dir, 'bin', 'cftp01.exe'),
+                                    'Footprint_Data_Output_Directory': os.path.join(work_dir, 'fp'),
+                                    'LegacyParameters': '3,0.05,{0},{0},5,{1},{1}'.format(grid_extent,
+                                                                                        grid_extent / 2),
+                                    'Idle_Timeout': '60'},
+                      'TimeSeries_Plot': {'Plot_Data_Directory': os.path.join(work_dir, 'epr'),
+                                          'Plots_Output_Directory': os.path.join(work_dir, 'plots'),
+                                          'Plot_Configurations_Path': os.path.join(work_dir, 'plots.json')}})
+    os.makedirs(os.path.join(work_dir, 'bin'), exist_ok=True)
+    make_stand_in(os.path.join(work_dir, 'bin', 'eddypro_rp.exe'), EDDYPRO_RP)
+    make_stand_in(os.path.join(work_dir, 'bin', 'eddypro_fcc.exe'), EDDYPRO_FCC)
+    make_stand_in(os.path.join(work_dir, 'bin', 'cftp01.exe'), CFTP01)
+    with open(os.path.join(work_dir, 'ADV.eddypro'), 'w') as epc:
+        epc.write('[Project]\nfile_name={}\nout_path={}\nproject_id=ADV\n[RawProcess_General]\ndata_path={}\n'.format(
+            os.path.join(work_dir, 'ADV.eddypro'), os.path.join(work_dir, 'epr_run'), os.path.join(work_dir, 'split')))
+    os.makedirs(os.path.join(work_dir, 'epr_run'), exist_ok=True)
+    return config
@@ -0,0 +1,214 @@
+"""
+Times the processing stages on synthetic inputs and appends one JSON line per stage to a results file, e.g.
+
+    python -m benchmarks.run --scale small --results benchmarks.jsonl
+
+every stage runs in a fresh process, so its peak memory is its own
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from time import localtime, perf_counter, process_time, strftime
+from unittest.mock import patch
+
+os.environ.setdefault('MPLBACKEND', 'Agg')  # before anything imports pyplot
+
+import pandas as pd
+
+from benchmarks import fixtures
+from util.logger import peak_rss_mb
+
+# setup(work_dir, config, scale) returns the state passed to run(state), run returns (items, bytes) processed
+Case = namedtuple('Case', ['name', 'unit', 'setup', 'run'])
+
+
+def _setup_sonic(work_dir, config, scale):
+    n_rows, n_bytes = fixtures.make_sonic_raw(config['Sonic']['Raw_Data_Directory'], **scale)
+    return config, n_rows, n_bytes
+
+
+def _run_raw_split(state):
+    from core.rawcvt import SonicRawConverter
+    config, n_rows, n_bytes = state
+    with patch('builtins.input', return_value=''):  # the file list is confirmed by hand otherwise
+        SonicRawConverter(config=config).convert_sonic_data()
+    return n_rows, n_bytes
+
+
+def _run_raw_stream(state):
+    from core.rawcvt import SonicRawConverter
+    config, n_rows, n_bytes = state
+    with patch('builtins.input', return_value=''):
+        SonicRawConverter(config=config).stream_sonic_data()
+    return n_rows, n_bytes
+
+
+def _setup_period_files(work_dir, config, scale):
+    split_dir = config['Sonic']['Converted_Data_Output_Directory']
+    os.makedirs(split_dir, exist_ok=True)
+    for start_time in fixtures.START + pd.to_timedelta(range(0, 30 * scale['met_periods'], 30), 'min'):
+        open(os.path.join(split_dir, '{:%Y-%m-%d_%H-%M}.csv'.format(start_time)), 'w').close()
+    return config, scale['met_periods']
+
+
+def _run_turb_stats(state):
+    from core.epproxy import EPProxy
+    config, n_periods = state
+    EPProxy(config=config).modify_and_run()
+    return n_periods, 0
+
+
+def _setup_essentials(work_dir, config, scale):
+    result_path = fixtures.make_essentials(config['Footprint']['Eddy_Pro_Results_Directory'], **scale)
+    return config, scale['met_periods'], os.path.getsize(result_path)
+
+
+def _run_fp_classic(state):
+    from core.cftpp import FpGrdGeneratorClassic
+    config, n_periods, n_bytes = state
+    FpGrdGeneratorClassic(config=config).initialize_and_run()
+    return n_periods, n_bytes
+
+
+def _run_fp_native(state):
+    from core.fp import FpGrdGeneratorNative
+    config, n_periods, n_bytes = state
+    FpGrdGeneratorNative(config=config).initialize_and_run()
+    return n_periods, n_bytes
+
+
+def _run_plot_summary(state):
+    from core.plot import TimeSeriesPlotter
+    config, n_periods, n_bytes = state
+    TimeSeriesPlotter(config=config).plot_summary()
+    return n_periods, n_bytes
+
+
+def _run_plot_daily(state):
+    from core.plot import TimeSeriesPlotter
+    config, n_periods, n_bytes = state
+    TimeSeriesPlotter(config=config).plot_daily_ts()
+    return n_periods, n_bytes
+
+
+def _setup_grds(work_dir, config, scale):
+    grd_paths = fixtures.make_grd_dir(os.path.join(work_dir, 'grd'), **scale)
+    return work_dir, grd_paths, sum(os.path.getsize(grd_path) for grd_path in grd_paths)
+
+
+def _run_grid_average(state):
+    from res._fptools import grid_average
+    work_dir, grd_paths, n_bytes = state
+    hour_groups = {}
+    for grd_path in grd_paths:  # e.g. '1807010030.grd', grouped by hour of day
+        hour_groups.setdefault(os.path.basename(grd_path)[6:8], []).append(grd_path)
+    grid_average(hour_groups, os.path.join(work_dir, 'grd_average'))
+    return len(grd_paths), n_bytes
+
+
+def _run_stack_average(state):
+    from core.stack import GrdStack
+    work_dir, grd_paths, n_bytes = state
+    stack = GrdStack(os.path.join(work_dir, 'stack'))
+    stack.import_grd_dir(os.path.join(work_dir, 'grd'))
+    for positions in stack.group_positions(stack.time_index.hour).values():
+        stack.average(positions)
+    return len(grd_paths), n_bytes
+
+
+def _run_levels(state):
+    from core.level import write_grd_levels
+    work_dir, grd_paths, n_bytes = state
+    write_grd_levels(grd_paths)
+    return len(grd_paths), n_bytes
+
+
+CASES = [Case('raw_split', 'rows', _setup_sonic, _run_raw_split),
+         Case('raw_stream', 'rows', _setup_sonic, _run_raw_stream),
+         Case('turb_stats', 'periods', _setup_period_files, _run_turb_stats),
+         Case('fp_classic', 'periods', _setup_essentials, _run_fp_classic),
+         Case('fp_native', 'periods', _setup_essentials, _run_fp_native),
+         Case('plot_summary', 'periods', _setup_essentials, _run_plot_summary),
+         Case('plot_daily', 'periods', _setup_essentials, _run_plot_daily),
+         Case('grid_average', 'grids', _setup_grds, _run_grid_average),
+         Case('stack_average', 'grids', _setup_grds, _run_stack_average),
+         Case('levels', 'grids', _setup_grds, _run_levels)]
+
+
+def run_case(case_name: str, scale_name: str, work_dir: str) -> dict:
+    case = {case.name: case for case in CASES}[case_name]
+    scale = fixtures.SCALES[scale_name]
+    case_dir = tempfile.mkdtemp(prefix=case_name + '_', dir=work_dir)
+    cwd = os.getcwd()
+    os.chdir(case_dir)  # formats.json is looked up in the working directory
+    try:
+        state = case.setup(case_dir, fixtures.make_config(case_dir, scale), scale)
+        start_time, start_cpu = perf_counter(), process_time()
+        n_items, n_bytes = case.run(state)
+        run_time, cpu_time = perf_counter() - start_time, process_time() - start_cpu
+    finally:
+        os.chdir(cwd)
+    return {'case': case_name,
+            'scale': scale_name,
+            'unit': case.unit,
+            'items': n_items,
+            'seconds': round(run_time, 4),
+            'cpu_seconds': round(cpu_time, 4),  # this process only, workers and children are not included
+            'items_per_s': round(n_items / run_time, 2),
+            'mb': round(n_bytes / 1024 ** 2, 3),
+            'mb_per_s': round(n_bytes / 1024 ** 2 / run_time, 3),
+            'peak_rss_mb': peak_rss_mb(),  # None on Windows
+            'children_peak_rss_mb': peak_rss_mb(children=True)}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def run_suite(scale_name: str, results_path: str, *, case_names=None, work_dir: str = None, isolated=True) -> list:
+    """
+    Runs the cases (all by default) and appends their records to results_path, each in a fresh process
+    unless isolated is False
+    """
+    context = {'commit': _git_commit(), 'python': platform.python_version(), 'platform': platform.platform(),
+               'cpu_count': os.cpu_count(), 'time': strftime('%Y-%m-%d %H:%M:%S', localtime())}
+    records = []
+    with tempfile.TemporaryDirectory(dir=work_dir) as suite_dir:
+        for case_name in case_names or [case.name for case in CASES]:
+            if isolated:
+                with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as executor:
+                    record = executor.submit(run_case, case_name, scale_name, suite_dir).result()
+            else:
+                record = run_case(case_name, scale_name, suite_dir)
+            record.update(context)
+            records.append(record)
+            with open(results_path, 'a') as results:
+                results.write(json.dumps(record) + '\n')
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the processing stages on synthetic inputs')
+    parser.add_argument('--scale', choices=list(fixtures.SCALES), default='small')
+    parser.add_argument('--results', default='benchmarks.jsonl', help='JSON lines file the records are appended to')
+    parser.add_argument('--cases', nargs='*', choices=[case.name for case in CASES])
+    parser.add_argument('--work-dir', help='where the synthetic inputs are written, system temp by default')
+    args = parser.parse_args()
+    for record in run_suite(args.scale, args.results, case_names=args.cases, work_dir=args.work_dir):
+        print('{case:>14}: {seconds:>9.3f} s {items_per_s:>12.1f} {unit}/s {mb_per_s:>9.3f} MB/s '
+              'peak {peak_rss_mb} MB'.format(**record))
+
+
+if __name__ == '__main__':
+    main()
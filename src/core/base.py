@@ -1,6 +1,6 @@
 from configparser import ConfigParser
 
-from util.logger import ConsoleLogger
+from util.logger import ConsoleLogger, logger as default_logger
 
 
 class BaseData:
@@ -9,8 +9,9 @@ class BaseData:
 
 
 class BaseModule:
-    def __init__(self, *, config: ConfigParser):
+    def __init__(self, *, config: ConfigParser, logger: ConsoleLogger = default_logger):
         self._config = config
+        self._logger = logger
         self._parse_config()
 
     def _parse_config(self):
@@ -0,0 +1,94 @@
+"""
+Columnar cache of parsed raw data files, one .npy file per column
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class RawDataCache:
+    def __init__(self, cache_dir: str, raw_format: dict, columns: list = None):
+        self.cache_dir = cache_dir
+        self.columns = columns  # projection applied to every load, None for all columns
+        # the parsed result depends on the format entry as much as on the file itself
+        self._format_hash = hashlib.sha1(json.dumps(raw_format, sort_keys=True).encode()).hexdigest()
+        self._raw_format = raw_format
+
+    def _entry_dir(self, raw_path: str):
+        return os.path.join(self.cache_dir, hashlib.sha1(os.path.abspath(raw_path).encode()).hexdigest())
+
+    def _key(self, raw_path: str):
+        raw_stat = os.stat(raw_path)
+        return {'path': os.path.abspath(raw_path), 'mtime_ns': raw_stat.st_mtime_ns, 'size': raw_stat.st_size,
+                'format': self._format_hash}
+
+    def read(self, raw_path: str) -> pd.DataFrame:
+        key = self._key(raw_path)
+        raw_datum = self.load(raw_path, key)
+        if raw_datum is None:
+            raw_datum = pd.read_csv(raw_path, **self._raw_format)
+            raw_datum.set_index(raw_datum.columns[0], inplace=True)
+            self.store(raw_path, key, raw_datum)
+            if self.columns:
+                raw_datum = raw_datum[self.columns]
+        return raw_datum
+
+    def load(self, raw_path: str, key: dict = None):
+        entry_dir = self._entry_dir(raw_path)
+        try:
+            with open(os.path.join(entry_dir, 'meta.json'), 'r') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta['key'] != (key or self._key(raw_path)):  # file or format changed since cached
+            return None
+        columns = self.columns or meta['columns']
+        nulls = meta.get('nulls', [])
+        data = {column: self._load_array(entry_dir, 'c{}'.format(meta['columns'].index(column)), nulls)
+                for column in columns}  # only projected columns are read
+        index = pd.Index(self._load_array(entry_dir, 'index', nulls), name=meta['index'])
+        return pd.DataFrame(data, index=index, columns=columns)
+
+    @staticmethod
+    def _load_array(entry_dir: str, name: str, nulls: list) -> np.ndarray:
+        values = np.load(os.path.join(entry_dir, name + '.npy'), mmap_mode='r')
+        if name in nulls:  # missing text values, saved as a mask beside the text
+            values = values.astype(object)
+            values[np.load(os.path.join(entry_dir, name + '_na.npy'))] = np.nan
+        return values
+
+    def store(self, raw_path: str, key: dict, raw_datum: pd.DataFrame):
+        entry_dir = self._entry_dir(raw_path)
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            meta_path = os.path.join(entry_dir, 'meta.json')
+            if os.path.exists(meta_path):
+                os.remove(meta_path)  # invalidate before columns are replaced
+            nulls = []
+            arrays = [('index', raw_datum.index)] + [('c{}'.format(n), raw_datum[column])
+                                                     for n, column in enumerate(raw_datum.columns)]
+            for name, values in arrays:
+                values, null_mask = self._to_array(values)
+                np.save(os.path.join(entry_dir, name + '.npy'), values)
+                if null_mask is not None:
+                    np.save(os.path.join(entry_dir, name + '_na.npy'), null_mask)
+                    nulls.append(name)
+            with open(meta_path, 'w') as f:
+                json.dump({'key': key, 'index': raw_datum.index.name, 'columns': list(raw_datum.columns),
+                           'nulls': nulls}, f)
+        except OSError:
+            pass  # cache location not writable, parse again next time
+
+    @staticmethod
+    def _to_array(values):
+        # array to save and mask of missing values if they would not survive it
+        values = np.asarray(values)
+        if values.dtype != object:
+            return values, None
+        # text columns are stored as fixed width unicode, no pickles in the cache, missing values as a mask
+        null_mask = pd.isna(values)
+        return np.where(null_mask, '', values).astype(str), null_mask if null_mask.any() else None
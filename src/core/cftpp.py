@@ -1,12 +1,15 @@
 import os
 import shutil
-import subprocess
+from collections import deque
 
 import pandas as pd
 
 from core.file import get_path, get_paths
+from core.fp import FP_STAGE, read_met_data
+from core.manifest import FpManifest, period_hashes
 from core.modules import FpGrdGenerator
-from util.pgbar import ProgressBar
+from util.metrics import metrics
+from util.supervisor import Supervisor
 
 
 class FpGrdGeneratorClassic(FpGrdGenerator):
@@ -18,8 +21,10 @@ class FpGrdGeneratorClassic(FpGrdGenerator):
         self._epr_dir = fpgc_conf['Eddy_Pro_Results_Directory']
         self._fpm_path = fpgc_conf['Footprint_Model_Path']
         self._fpout_dir = fpgc_conf['Footprint_Data_Output_Directory']
-        self._out_dirs = [self._fpout_dir + '\\proc{}'.format(n) for n in range(self.n_cores)]
+        self._out_dirs = [os.path.join(self._fpout_dir, 'proc{}'.format(n)) for n in range(self.n_cores)]
         self._params = list(map(float, fpgc_conf['LegacyParameters'].split(',')))  # convert param string into floats
+        self._idle_timeout = fpgc_conf.getfloat('Idle_Timeout', fallback=600)  # seconds without output until killed
+        self._chunk_size = fpgc_conf.getint('Classic_Chunk_Size', fallback=24)  # half-hours per model run
 
     def _initialize_fp_model(self):
         @self._logger.log_action('Initializing Footprint Model Parameters')
@@ -34,77 +39,113 @@ class FpGrdGeneratorClassic(FpGrdGenerator):
         def action():
             self._run_fp_model_parallel()
             self._rearrange_and_cleanup()
+            self._check_pending()
 
         action()
 
     def _write_model_params(self):
         for n in range(self.n_cores):
             os.makedirs(self._out_dirs[n], exist_ok=True)
-            with open(self._out_dirs[n] + '\\01paras.dat', mode='w') as param_file:
+            with open(os.path.join(self._out_dirs[n], '01paras.dat'), mode='w') as param_file:
                 param_file.write('{:.1f},{:.2f}, `\n'.format(self._params[0], self._params[1]))  # z_m, z_0
                 param_file.write('{:.1f},{:.1f},{:.1f}, `\n'.format(*self._params[2:5]))  # x_max, y_max, dx
                 param_file.write('100,100,100,100, `\n880e-9, `\n0.145, `\n')  # TODO may alter after checking
-            with open(self._out_dirs[n] + '\\monit.pst', mode='w') as station_file:
+            with open(os.path.join(self._out_dirs[n], 'monit.pst'), mode='w') as station_file:
                 station_file.write('{:.3f},{:.3f},1# \n'.format(*self._params[5:7]))  # x_loc, y_loc
 
     def _convert_met_data(self):
         result_path = get_path(target_dir=self._epr_dir,
                                file_init='eddypro_ADV_essentials',
                                file_ext='adv.csv')
-        order = ['date',
-                 'time',
-                 'wind_dir',
-                 'wind_speed',
-                 'u*',
-                 'L',
-                 'H',
-                 'rho_air',
-                 'var(v)']
-        flux_full = pd.read_csv(result_path,
-                                usecols=order,
-                                parse_dates=[[0, 1]],
-                                na_values=-9999)
-        flux_full.set_index(flux_full.columns[0], inplace=True)
-        flux_full.dropna(inplace=True)
+        flux_full = read_met_data(result_path, extra_cols=['H', 'rho_air'])
         flux_full['key'] = 1
         out_order = ['wind_dir', 'wind_speed', 'sigma_v', 'u*', 'L', 'H', 'rho_air',
                      'key']
-        flux_full['sigma_v'] = flux_full['var(v)'] ** 0.5
         flux_out = flux_full[out_order]
         out_cols = ['wd(deg)', 'U(m/s)', 'Sgm_v', 'u*(m/s)', 'L(m)', 'H(J/m2)', 'rho(kg/m3)',
                     'key(1/0==use ustar & Obu_L /use H_sensible heat)']
         flux_out.columns = out_cols
-        self.total = len(flux_out)
-        seg = self.total // self.n_cores + 1
-        flux_out.to_csv(self._fpout_dir + '\\02metdata.dat', date_format='%y%m%d%H%M',
+        self._write_met_data(flux_out, self._fpout_dir)
+        self._manifest = FpManifest(self._fpout_dir)
+        hashes = period_hashes(flux_out, ('classic', *self._params))
+        todo = self._manifest.pending(hashes).values
+        self._logger.log('[ {} ] of [ {} ] half-hours missing or changed.'.format(todo.sum(), len(todo)))
+        flux_todo, self._hashes_todo = flux_out[todo], hashes[todo]
+        hashes_todo = self._hashes_todo
+        self.total = len(flux_todo)
+        # many small chunks handed to whichever model process is free, a slow chunk no longer holds up a
+        # whole static share of the data
+        self._met_chunks = deque((flux_todo.iloc[n: n + self._chunk_size], hashes_todo.iloc[n: n + self._chunk_size])
+                                 for n in range(0, self.total, self._chunk_size))
+
+    @staticmethod
+    def _write_met_data(met_data: pd.DataFrame, out_dir: str):
+        met_data.to_csv(os.path.join(out_dir, '02metdata.dat'),
+                        date_format='%y%m%d%H%M',
                         index_label='Datetime',
                         sep='\t',
                         float_format='%.3f')
-        for n in range(self.n_cores):
-            nth_out = flux_out.iloc[n * seg: (n + 1) * seg]
-            nth_out.to_csv(self._out_dirs[n] + '\\02metdata.dat',
-                           date_format='%y%m%d%H%M',
-                           index_label='Datetime',
-                           sep='\t',
-                           float_format='%.3f')
 
     def _run_fp_model_parallel(self):
 
         fme_paths = [os.path.join(self._out_dirs[n], 'cftp{}.exe'.format(n)) for n in range(self.n_cores)]
-        processes = []
-        for fme_path in fme_paths:
-            shutil.copyfile(self._fpm_path, fme_path)
-            processes.append(subprocess.Popen(fme_path, cwd=os.path.split(fme_path)[0], stdout=subprocess.PIPE,
-                                              stderr=subprocess.PIPE))
-        fme_pgb = ProgressBar(target=self.total)
-        while processes:
-            for n, process in enumerate(processes):
-                output = process.stdout.readline().decode('utf8').strip()
+        supervisor = Supervisor(idle_timeout=self._idle_timeout)
+
+        def fme_output(n):
+            def on_line(output):
                 if output.startswith('ouput file'):
-                    fme_pgb.update()
-                elif output.startswith('ok, please'):
-                    process.terminate()
-                    processes.pop(n)
+                    fp_meter.add(slot=n)  # one slot per model process
+
+            return on_line
+
+        def run_next_chunk(n):
+            # each model process keeps its directory and exe copy, only the met data is swapped between chunks
+            if not self._met_chunks:
+                return
+            fme_path = fme_paths[n]
+            met_chunk, chunk_hashes = self._met_chunks.popleft()
+            self._write_met_data(met_chunk, os.path.split(fme_path)[0])
+            # the model waits for a key press after 'ok, please...' instead of quitting
+            supervisor.spawn(os.path.basename(fme_path), [fme_path], cwd=os.path.split(fme_path)[0],
+                             on_line=fme_output(n), done_markers=('ok, please',),
+                             on_exit=chunk_done(n, chunk_hashes))
+
+        def chunk_done(n, chunk_hashes):
+            def on_exit(result):
+                if not result.ok:
+                    self._log_exit(result)
+                self._commit_grids(os.path.split(fme_paths[n])[0], chunk_hashes)
+                if result.status != 'failed':  # an exe copy that cannot start leaves the queue to the others
+                    run_next_chunk(n)
+
+            return on_exit
+
+        for n, fme_path in enumerate(fme_paths):
+            shutil.copy(self._fpm_path, fme_path)  # keeps the mode bits of the model exe
+            run_next_chunk(n)
+        with metrics.stage(FP_STAGE, self.n_cores, unit='half-hours', target=self.total) as fp_meter:
+            supervisor.run()
+
+    def _commit_grids(self, out_dir: str, chunk_hashes):
+        # grids of a finished chunk move to the output directory right away, periods without a grid stay pending
+        grd_names = set(os.listdir(out_dir))
+        done = [stem + '.grd' in grd_names for stem in chunk_hashes.index]
+        for stem in chunk_hashes.index[done]:
+            os.replace(os.path.join(out_dir, stem + '.grd'), os.path.join(self._fpout_dir, stem + '.grd'))
+        self._manifest.commit(chunk_hashes[done])
+
+    def _check_pending(self):
+        # hung or failed chunks leave periods without a committed grid, the next run picks them up
+        pending = self._manifest.pending(self._hashes_todo)
+        if pending.any():
+            stems = list(pending.index[pending.values])
+            self._logger.log('[ {} ] half-hours without grids: {}'.format(
+                len(stems), ', '.join(stems[:5]) + (', ...' if len(stems) > 5 else '')))
+            raise RuntimeError('[ {} ] of [ {} ] half-hours failed in the footprint model, CHECK logs!'.format(
+                len(stems), len(pending)))
+
+    def _log_exit(self, result):
+        self._logger.log(str(result))
 
     def _rearrange_and_cleanup(self):
         @self._logger.log_action('Rearranging Footprint Grid Files and Cleaning up')
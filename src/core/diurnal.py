@@ -0,0 +1,121 @@
+"""
+Diurnal statistics: per hour of day, optionally split by month or wind sector, counts, means, quantiles and box
+plot statistics of all variables from one grouping of the data, cached on disk by content
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+QUANTILES = (.05, .25, .5, .75, .95)
+BOX_QUANTILES = (.25, .5, .75)  # always computed, the box is drawn from them
+GROUPINGS = (None, 'month', 'sector')
+
+
+def quantile_name(q: float) -> str:
+    return 'q{:02.0f}'.format(q * 100)  # e.g. 'q05', 'q50'
+
+
+def hourly_means(data: pd.DataFrame, angle_cols=('wind_dir',)) -> pd.DataFrame:
+    """
+    Hourly means, directions in degrees as vector means: 350 and 10 average to 0, not 180
+    """
+    hourly_data = data.resample('h').mean()
+    for column in angle_cols:
+        if column in data:
+            angles = np.radians(data[column])
+            hourly_data[column] = np.degrees(np.arctan2(np.sin(angles).resample('h').mean(),
+                                                        np.cos(angles).resample('h').mean())) % 360
+    return hourly_data
+
+
+def _group_keys(data: pd.DataFrame, by: str = None, sector_width=45.) -> list:
+    keys = [pd.Index(data.index.hour, name='hour')]
+    if by == 'month':
+        keys.insert(0, pd.Index(data.index.month, name='month'))
+    elif by == 'sector':  # sectors centered on multiples of sector_width, north is 0
+        n_sectors = int(round(360 / sector_width))
+        sector = np.floor(data['wind_dir'].values / sector_width + .5) % n_sectors * sector_width
+        keys.insert(0, pd.Index(sector, name='sector'))
+    elif by is not None:
+        raise ValueError('Unknown grouping [{}], one of {}'.format(by, GROUPINGS))
+    return keys
+
+
+def hourly_stats(data: pd.DataFrame, columns=None, *, by: str = None, quantiles=QUANTILES,
+                 sector_width=45.) -> pd.DataFrame:
+    """
+    Statistics of every column per hour of day, and per month or wind sector with by, indexed by
+    (group, hour, variable): count, mean, quantiles, whiskers at the furthest values within 1.5 IQR of the box
+    and the number of outliers beyond them
+    """
+    columns = list(data.select_dtypes('number').columns if columns is None else columns)
+    keys = _group_keys(data, by, sector_width)
+    grouped = data[columns].groupby(keys)
+    qs = sorted(set(quantiles) | set(BOX_QUANTILES))
+
+    stats = grouped.agg(['count', 'mean']).stack(level=0)
+    by_quantile = grouped.quantile(qs)  # rows (group, hour, q)
+    quantile_stats = by_quantile.stack().unstack(-2)
+    quantile_stats.columns = [quantile_name(q) for q in quantile_stats.columns]
+
+    # quartiles of the group of every row, in the order of the group numbers
+    codes = grouped.ngroup()
+    in_group = codes.notna().values  # e.g. rows without wind direction have no sector
+    codes = codes[in_group].values.astype(np.int64)
+    q1 = by_quantile.xs(.25, level=-1).values[codes]
+    q3 = by_quantile.xs(.75, level=-1).values[codes]
+    values = data[columns].values[in_group].astype(np.float64)
+    inside = (values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))
+    within = pd.DataFrame(np.where(inside, values, np.nan), columns=columns).groupby(codes)
+    outliers = pd.DataFrame(~inside & ~np.isnan(values), columns=columns).groupby(codes).sum()
+    box_index = by_quantile.xs(.25, level=-1).index  # group numbers follow it
+    whiskers = pd.concat({'whislo': within.min().set_axis(box_index).stack(),
+                          'whishi': within.max().set_axis(box_index).stack(),
+                          'n_outliers': outliers.set_axis(box_index).stack()}, axis=1)
+
+    stats = pd.concat([stats, quantile_stats, whiskers], axis=1).sort_index()
+    stats.index.names = [key.name for key in keys] + ['variable']
+    stats['count'] = stats['count'].fillna(0).astype(np.int64)
+    stats['n_outliers'] = stats['n_outliers'].fillna(0).astype(np.int64)
+    return stats
+
+
+def box_stats(stats: pd.DataFrame, variable: str, group=None) -> list:
+    """
+    Per hour with values, the statistics of variable as Axes.bxp takes them, group selects the month or sector
+    """
+    selected = stats.xs(variable, level='variable')
+    if group is not None:
+        selected = selected.xs(group, level=0)
+    return [{'label': hour, 'med': row['q50'], 'q1': row['q25'], 'q3': row['q75'], 'mean': row['mean'],
+             'whislo': row['whislo'], 'whishi': row['whishi'], 'fliers': []}
+            for hour, row in selected.iterrows() if row['count']]
+
+
+def cache_path(cache_dir: str, data: pd.DataFrame, params: dict) -> str:
+    digest = hashlib.sha1(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode())
+    return os.path.join(cache_dir, 'hourly_stats_{}.csv'.format(digest.hexdigest()[:16]))
+
+
+def cached_hourly_stats(data: pd.DataFrame, cache_dir: str, columns=None, *, by: str = None, quantiles=QUANTILES,
+                        sector_width=45.) -> pd.DataFrame:
+    """
+    hourly_stats read from cache_dir if computed before for the same data and settings
+    """
+    columns = list(data.select_dtypes('number').columns if columns is None else columns)
+    params = {'by': by, 'quantiles': list(quantiles), 'sector_width': sector_width}
+    keyed = columns + ['wind_dir'] if by == 'sector' and 'wind_dir' not in columns else columns  # all read
+    stats_path = cache_path(cache_dir, data[keyed], params)
+    if os.path.exists(stats_path):
+        return pd.read_csv(stats_path, index_col=[0, 1] if by is None else [0, 1, 2])
+    stats = hourly_stats(data, columns, by=by, quantiles=quantiles, sector_width=sector_width)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = stats_path + '.tmp'
+    stats.to_csv(temp_path)
+    os.replace(temp_path, stats_path)
+    return stats
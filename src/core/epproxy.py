@@ -1,10 +1,13 @@
 import configparser
 import os
-import subprocess
+import re
+import shutil
 
 from core.base import BaseModule
+from core.file import get_paths
 from util.logger import logger
 from util.pgbar import ProgressBar
+from util.supervisor import Supervisor
 
 
 class EPProxy(BaseModule):
@@ -12,43 +15,167 @@ class EPProxy(BaseModule):
         super().__init__(*args, **kwargs)
 
         self.total_files = None
+        self._ep_config = None
+        self._shard_dirs = []
 
     def _parse_config(self):
         epp_conf = self._config['Eddy_Pro']
         self._bin_dir = epp_conf['Eddy_Pro_Binaries_Directory']
         self._epc_path = epp_conf['Eddy_Pro_Configuration_Path']
         self._keep_logs = bool(epp_conf['Keep_Eddy_Pro_Logs'])
+        self._n_shards = epp_conf.getint('Eddy_Pro_Shards', fallback=1)  # 1 runs the project as it is
+        self._idle_timeout = epp_conf.getfloat('Idle_Timeout', fallback=600)  # seconds without output until killed
 
     @logger.log_process('Calculating Turbulence Statistics')
     def modify_and_run(self):
         self._modify_ep_project()
-        self._run_ep()
+        if self._shard_dirs:
+            self._run_ep_sharded()
+            self._merge_shard_results()
+        else:
+            self._run_ep()
+
+    @staticmethod
+    def _read_ep_project(epc_path: str):
+        ep_config = configparser.ConfigParser(interpolation=None)
+        ep_config.optionxform = str  # keep keys as EddyPro wrote them
+        ep_config.read(epc_path)
+        return ep_config
 
     @logger.log_action('Creating metadata and project configs', timed=False)
     def _modify_ep_project(self):
-        ep_config = configparser.ConfigParser()
-        ep_config.read(self._epc_path)
-        self.total_files = len(os.listdir(ep_config.get('RawProcess_General', 'data_path')))
+        self._ep_config = self._read_ep_project(self._epc_path)
+        period_files = sorted(os.listdir(self._ep_config.get('RawProcess_General', 'data_path')))
+        self.total_files = len(period_files)
+        if self._n_shards > 1:
+            self._write_shard_projects(period_files)
+
+    def _write_shard_projects(self, period_files: list):
+        # period files are named 'yyyy-mm-dd_HH-MM.csv', so sorted names are contiguous time ranges
+        self._shard_dirs = []
+        if not period_files:  # nothing to split, EddyPro reports the empty data path itself
+            logger.log('No period files to split into shards, running the project as it is.')
+            return
+        data_path = self._ep_config.get('RawProcess_General', 'data_path')
+        shards_dir = os.path.join(self._ep_config.get('Project', 'out_path'), 'shards')
+        n_shards = min(self._n_shards, len(period_files))
+        shard_size, extra = divmod(len(period_files), n_shards)
+        bounds = [n * shard_size + min(n, extra) for n in range(n_shards + 1)]
+        for n in range(n_shards):
+            shard_dir = os.path.join(shards_dir, 'shard{}'.format(n))
+            shutil.rmtree(shard_dir, ignore_errors=True)  # results of an earlier run
+            os.makedirs(os.path.join(shard_dir, 'data'))
+            os.makedirs(os.path.join(shard_dir, 'out'))
+            for period_file in period_files[bounds[n]:bounds[n + 1]]:
+                src, dst = os.path.join(data_path, period_file), os.path.join(shard_dir, 'data', period_file)
+                try:
+                    os.link(src, dst)  # no copies of the raw data where the file system allows
+                except OSError:
+                    shutil.copyfile(src, dst)
+            shard_config = self._read_ep_project(self._epc_path)
+            shard_config.set('RawProcess_General', 'data_path', os.path.join(shard_dir, 'data'))
+            shard_config.set('Project', 'out_path', os.path.join(shard_dir, 'out'))
+            shard_config.set('Project', 'file_name', self._shard_epc_path(shard_dir))
+            with open(self._shard_epc_path(shard_dir), 'w') as shard_epc:
+                shard_config.write(shard_epc, space_around_delimiters=False)
+            self._shard_dirs.append(shard_dir)
+        logger.log('[ {} ] period files split into [ {} ] shards.'.format(len(period_files), n_shards))
+
+    @staticmethod
+    def _shard_epc_path(shard_dir: str):
+        return os.path.join(shard_dir, 'shard.eddypro')
 
     @logger.log_action('Running EddyPro in background')
     def _run_ep(self):
-        p_rp = subprocess.Popen([os.path.join(self._bin_dir, 'eddypro_rp.exe'), self._epc_path], shell=True,
-                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self._run_ep_projects([self._epc_path])
+
+    @logger.log_action('Running sharded EddyPro in background')
+    def _run_ep_sharded(self):
+        self._run_ep_projects([self._shard_epc_path(shard_dir) for shard_dir in self._shard_dirs])
+
+    def _run_ep_projects(self, epc_paths: list):
+        # rp of every project starts at once, fcc of a project starts as soon as its rp completes
         ep_pgb = ProgressBar(target=self.total_files)
-        while True:  # the program does not quit with a return code, instead it outputs an err/warning and hangs
-            output = p_rp.stdout.readline().decode('utf8').strip()
+        supervisor = Supervisor(idle_timeout=self._idle_timeout)
+
+        def rp_output(output):
             if output.startswith('Re-calculating'):  # indicates valid time period
                 ep_pgb.update()
-            elif output.startswith('Note'):
-                p_rp.terminate()  # manually kill the subprocess
-                break
-        print('rp ended, begin fcc')
-        p_fcc = subprocess.Popen([os.path.join(self._bin_dir, 'eddypro_fcc.exe'), self._epc_path], shell=True,
-                                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        while True:  # the program does not quit with a return code, instead it outputs an err/warning and hangs
-            output = p_fcc.stdout.readline().decode('utf8').strip()
-            if output.startswith('Note'):
-                p_fcc.terminate()  # manually kill the subprocess
-                break
-        print('fcc ended')
+
+        def rp_exit(epc_path):
+            def on_exit(result):
+                self._log_exit(result)
+                if not result.ok:  # hung, failed to start or quit with an error code
+                    return
+                # the programs do not quit with a return code, instead they output an err/warning and hang
+                fcc_args = [os.path.join(self._bin_dir, 'eddypro_fcc.exe'), epc_path]
+                supervisor.spawn('fcc {}'.format(epc_path), fcc_args, done_markers=('Note',), on_exit=self._log_exit)
+
+            return on_exit
+
+        for epc_path in epc_paths:
+            supervisor.spawn('rp {}'.format(epc_path), [os.path.join(self._bin_dir, 'eddypro_rp.exe'), epc_path],
+                             on_line=rp_output, done_markers=('Note',), on_exit=rp_exit(epc_path))
+        results = supervisor.run()
+        if not all(result.ok for result in results):  # results would miss periods, nothing is merged
+            raise RuntimeError('[ {} ] of [ {} ] EddyPro runs did not complete, CHECK logs!'.format(
+                sum(not result.ok for result in results), len(results)))
+
+    @staticmethod
+    def _log_exit(result):
+        logger.log(str(result))
+
+    @logger.log_action('Merging shard results')
+    def _merge_shard_results(self):
+        # e.g. 'eddypro_ADV_essentials_2019-11-03T120000_adv.csv', the run time stamp differs between shards
+        out_path = self._ep_config.get('Project', 'out_path')
+        merged = {}
+        for shard_dir in self._shard_dirs:
+            for result_path in get_paths(target_dir=os.path.join(shard_dir, 'out'), file_init='eddypro_',
+                                         file_ext='.csv'):
+                result_name = os.path.basename(result_path)
+                if '_essentials' not in result_name:
+                    continue
+                kind = re.sub(r'_\d{4}-\d{2}-\d{2}T\d{6}', '', result_name)
+                merged.setdefault(kind, (result_name, []))[1].append(result_path)
+        for result_name, result_paths in merged.values():
+            self._merge_result_files(result_paths, os.path.join(out_path, result_name))
+            logger.log('[ {} ] shard results merged into {}'.format(len(result_paths), result_name))
+            for result_path in result_paths:  # would be found next to the merged ones by the result lookups
+                os.remove(result_path)
+        for shard_dir in self._shard_dirs:
+            shutil.rmtree(os.path.join(shard_dir, 'data'), ignore_errors=True)  # links to the period files only
+            self._keep_shard_outputs(os.path.join(shard_dir, 'out'),
+                                     os.path.join(out_path, 'shard_outputs', os.path.basename(shard_dir)))
+
+    @staticmethod
+    def _keep_shard_outputs(shard_out_dir: str, kept_dir: str):
+        # full output, fluxnet, metadata, QC details, ... of a shard, kept as the unsharded run keeps them, out of
+        # the shard dirs the next run clears; their names carry the run time stamp, so earlier runs stay too
+        for dir_path, _, file_names in os.walk(shard_out_dir):
+            for file_name in file_names:
+                kept_path = os.path.join(kept_dir, os.path.relpath(os.path.join(dir_path, file_name), shard_out_dir))
+                os.makedirs(os.path.dirname(kept_path), exist_ok=True)
+                os.replace(os.path.join(dir_path, file_name), kept_path)
+        shutil.rmtree(shard_out_dir, ignore_errors=True)
+
+    @staticmethod
+    def _merge_result_files(result_paths: list, merged_path: str):
+        # merged as text, so numbers keep the formatting EddyPro gave them
+        header = None
+        rows = []
+        for result_path in result_paths:
+            with open(result_path, 'r') as result_file:
+                header = result_file.readline()
+                rows.extend(row for row in result_file if row.strip())
+        columns = header.rstrip('\n').split(',')
+        date_col, time_col = columns.index('date'), columns.index('time')
+
+        def period_key(row):  # 'yyyy-mm-dd' and 'HH:MM' sort as text
+            values = row.split(',')
+            return values[date_col], values[time_col]
+
+        rows.sort(key=period_key)
+        with open(merged_path, 'w') as merged_file:
+            merged_file.write(header)
+            merged_file.writelines(rows)
@@ -1,24 +1,109 @@
 # coding=utf-8
 """
 Provide useful functions to obtain absolute path(s) of certain file(s)
+
+Directory trees are indexed once and shared by all callers, later lookups only re-scan directories whose
+modification time changed.
 """
 
 import os
+import re
+import threading
+
+
+def time_key(path: str):
+    # e.g. '2018-07-01_00-30.csv' -> (2018, 7, 1, 0, 30), '1807010030.grd' -> (1807010030,)
+    file_name = os.path.basename(path)
+    return tuple(int(digits) for digits in re.findall(r'\d+', file_name)), file_name, path
+
+
+class FileIndex:
+    def __init__(self, target_dir: str):
+        self.target_dir = target_dir
+        self._dirs = {}  # dir path -> (mtime_ns, file names, sub dir paths)
+        self._lookups = {}  # (file_init, file_ext) -> matching paths in time order
+        self._lock = threading.Lock()
+
+    def _scan_dir(self, dir_path: str):
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            with os.scandir(dir_path) as entries:
+                entries = list(entries)
+        except OSError:  # removed since last scan
+            return False
+        # same as os.walk: links to directories are not descended into, anything else counts as a file
+        file_names = [entry.name for entry in entries if not entry.is_dir()]
+        sub_dirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+        self._dirs[dir_path] = (mtime_ns, file_names, sub_dirs)
+        for sub_dir in sub_dirs:
+            if sub_dir not in self._dirs:
+                self._scan_dir(sub_dir)
+        return True
+
+    def refresh(self):
+        with self._lock:
+            if not self._dirs:
+                changed = self._scan_dir(self.target_dir)
+            else:
+                changed = False
+                for dir_path, (mtime_ns, _, sub_dirs) in list(self._dirs.items()):
+                    if dir_path not in self._dirs:  # dropped with its parent in this refresh
+                        continue
+                    try:
+                        current_mtime_ns = os.stat(dir_path).st_mtime_ns
+                    except OSError:
+                        current_mtime_ns = None
+                    if current_mtime_ns == mtime_ns:
+                        continue
+                    changed = True
+                    if not self._scan_dir(dir_path):  # only this dir and new sub dirs are scanned
+                        self._drop_dir(dir_path)
+                        continue
+                    for sub_dir in set(sub_dirs) - set(self._dirs[dir_path][2]):  # removed sub dirs
+                        if sub_dir in self._dirs:
+                            self._drop_dir(sub_dir)
+            if changed:
+                self._lookups.clear()
+
+    def _drop_dir(self, dir_path: str):
+        _, _, sub_dirs = self._dirs.pop(dir_path)
+        for sub_dir in sub_dirs:
+            if sub_dir in self._dirs:
+                self._drop_dir(sub_dir)
+
+    def find(self, *, file_init: str = '', file_ext: str = '') -> list:
+        self.refresh()
+        with self._lock:
+            lookup = (file_init, file_ext)
+            if lookup not in self._lookups:
+                paths = [os.path.join(dir_path, file_name)
+                         for dir_path, (_, file_names, _) in self._dirs.items()
+                         for file_name in file_names
+                         if file_name.startswith(file_init) and file_name.endswith(file_ext)]
+                self._lookups[lookup] = sorted(paths, key=time_key)
+            return list(self._lookups[lookup])
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(target_dir: str) -> FileIndex:
+    with _indexes_lock:
+        key = os.path.abspath(target_dir)
+        if key not in _indexes:
+            _indexes[key] = FileIndex(target_dir)
+        return _indexes[key]
 
 
-def get_path(*, target_dir: str = '', file_init: str, file_ext: str ) -> str:
-    for (dir_name, dirs_here, files_here) in os.walk(target_dir):
-        for file in files_here:
-            if file.endswith(file_ext) and file.startswith(file_init):
-                path = os.path.join(dir_name, file)
-                return path
+def get_path(*, target_dir: str = '', file_init: str, file_ext: str) -> str:
+    # the newest match, e.g. the essentials of the last EddyPro run, each run writes its own time stamped file
+    paths = get_paths(target_dir=target_dir, file_init=file_init, file_ext=file_ext)
+    if paths:
+        return paths[-1]
 
 
 def get_paths(*, target_dir: str = '', file_init: str = '', file_ext: str) -> list:
-    paths = []
-    for (dir_name, dirs_here, files_here) in os.walk(target_dir):
-        for file in files_here:
-            if file.endswith(file_ext) and file.startswith(file_init):
-                path = os.path.join(dir_name, file)
-                paths.append(path)
-    return paths
+    if not target_dir:  # nothing to walk, same as os.walk('')
+        return []
+    return get_index(target_dir).find(file_init=file_init, file_ext=file_ext)
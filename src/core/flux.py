@@ -0,0 +1,38 @@
+"""
+Source flux from tower concentrations and footprint weights of the source area, C = C_bg + F * fcsum
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def estimate_flux(fcsums, concs, groups=None, valid=None):
+    """
+    Least squares source flux F and background concentration C_bg of every period, the towers of a period
+    share C_bg and the periods of a group share F, all periods are solved at once
+
+    fcsums, concs: (n_periods, n_towers) footprint weights of the source area and concentrations
+    groups: group code of each period, each period is its own group by default
+    valid: boolean mask of the periods passing QC, excluded periods get NaN
+    returns (group codes, F of each group, C_bg of each period)
+    """
+    fcsums = np.asarray(fcsums, dtype=np.float64)
+    concs = np.asarray(concs, dtype=np.float64)
+    n_periods = len(fcsums)
+    codes, group_codes = pd.factorize(pd.Series(np.arange(n_periods) if groups is None else groups))
+    valid = np.ones(n_periods, dtype=bool) if valid is None else np.asarray(valid, dtype=bool)
+
+    # deviations from the tower means drop C_bg, what remains is a regression through the origin per period
+    fc_mean, conc_mean = fcsums.mean(axis=1), concs.mean(axis=1)
+    fc_dev, conc_dev = fcsums - fc_mean[:, np.newaxis], concs - conc_mean[:, np.newaxis]
+    s_xy = np.einsum('ti,ti->t', fc_dev, conc_dev)
+    s_xx = np.einsum('ti,ti->t', fc_dev, fc_dev)
+    valid = valid & np.isfinite(s_xy) & np.isfinite(s_xx) & (codes >= 0)
+
+    n_groups = len(group_codes)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        flux = (np.bincount(codes[valid], weights=s_xy[valid], minlength=n_groups) /
+                np.bincount(codes[valid], weights=s_xx[valid], minlength=n_groups))  # no spread between towers, NaN
+    flux[~np.isfinite(flux)] = np.nan
+    background = np.where(valid, conc_mean - flux[codes] * fc_mean, np.nan)
+    return np.asarray(group_codes), flux, background
@@ -1,11 +1,13 @@
 import os
 from collections import namedtuple
 
-import numpy as np
+import pandas as pd
 from matplotlib import pyplot as plt
 
 from core.base import BaseModule
-from core.file import get_paths, get_path
+from core.file import get_paths
+from core.grd import write_grd
+from core.stack import GrdStack
 
 
 class FpGrdProcessor(BaseModule):
@@ -22,42 +24,51 @@ class FpGrdProcessor(BaseModule):
 
 
 class GRDAnalyzer(BaseModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.stack = GrdStack(self.config.stack_dir)
 
     def _parse_config(self):
-        grd_config = namedtuple('grd_config', ['grd_dir', 'gl_dir'])
+        self._mod_config = self._config['GRD_Analysis']
+        grd_config = namedtuple('grd_config', ['grd_dir', 'gl_dir', 'stack_dir'])
         self.config = grd_config(self._mod_config['grd_files_directory'],
-                                 self._mod_config['group_lists_directory'])
+                                 self._mod_config['group_lists_directory'],
+                                 self._mod_config.get('fp_stack_directory',
+                                                      os.path.join(self._mod_config['grd_files_directory'], 'stack')))
+
+    def import_grds(self):
+        @self._logger.log_action('Importing Footprint Grid Files into Stack')
+        def action():
+            n_imported = self.stack.import_grd_dir(self.config.grd_dir)
+            self._logger.log('[ {} ] new grids imported, [ {} ] in stack.'.format(n_imported, len(self.stack)))
+
+        action()
 
     def _group_by_custom(self):
         custom_groups = {}
-        group_lists = get_paths(target_dir=self.config.gl_dir, file_ext='.txt')  #
+        group_lists = get_paths(target_dir=self.config.gl_dir, file_ext='.txt')
         for group_list in group_lists:
-            group_code = os.path.split(group_list)[-1]
-            custom_groups[group_code] = []
+            group_code = os.path.splitext(os.path.split(group_list)[-1])[0]
             with open(group_list, 'r') as gl:
-                for group_member_name in gl:
-                    group_member_path = get_path(target_dir=self.grd_paths, file_init=group_member_name)
-                    custom_groups[group_code].append(group_member_path)
+                member_names = [os.path.splitext(line.strip())[0] for line in gl if line.strip()]
+            time_stamps = pd.to_datetime(member_names, format=GrdStack.GRD_NAME_FORMAT)  # e.g. '1807010030'
+            custom_groups[group_code] = self.stack.positions(time_stamps)
         return custom_groups
 
     def _group_by_hour(self):
-        hour_groups = {'{:0>2d}'.format(int(b)): [] for b in list(np.linspace(0, 23, 24))}  # from '00' to '23'
-        for grd_path in self.grd_paths:
-            grd_name = os.path.splitext(os.path.split(grd_path)[1])[0]
-            hour_code = grd_name[6:8]
-            hour_groups[hour_code].append(grd_path)
-        return hour_groups
-
-    def _get_grd_paths(self):
-        self.grd_paths = get_paths(target_dir=self.config.grd_dir, file_ext='.grd')
+        hours = self.stack.time_index.hour
+        return {'{:0>2d}'.format(hour): positions  # from '00' to '23'
+                for hour, positions in self.stack.group_positions(hours).items()}
 
     def _group_by_day(self):
-        day_groups = {}
-        for grd_path in self.grd_paths:
-            grd_name = os.path.splitext(os.path.split(grd_path)[1])[0]
-            day_code = grd_name[0:6]
-            if day_code in day_groups:
-                day_groups[day_code].append(grd_path)
-            else:
-                day_groups[day_code] = [grd_path]  # create new day key
-        return day_groups
\ No newline at end of file
+        days = self.stack.time_index.strftime('%y%m%d')  # e.g. '180701'
+        return self.stack.group_positions(days)
+
+    def average_groups(self, groups: dict, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        x_range, y_range = self.stack.meta['x_range'], self.stack.meta['y_range']
+        for group_code, positions in groups.items():
+            if len(positions):
+                write_grd(os.path.join(output_dir, '{}.grd'.format(group_code)),
+                          self.stack.average(positions), x_range, y_range)
@@ -1,112 +1,165 @@
+"""
+Native Kormann-Meixner footprint model, evaluated for many half-hours at once
+"""
+
+import os
 from collections import namedtuple
+from multiprocessing import Pool
 
 import numpy as np
-from math import log
-from scipy.special import gamma
-# from res.functions import func_phi_m, func_phi_c, func_psi_m, const_kar
-from core.base import BaseModule
-from util.logger import logger
+import pandas as pd
+from scipy.special import gammaln
+
+from core.file import get_path
+from core.grd import write_grd
+from core.manifest import FpManifest, period_hashes
+from core.modules import FpGrdGenerator
+from res.functions import func_stability, const_kar
+from util.metrics import chain_initializers, metrics
+
+# per half-hour model parameters, every field is an array of shape (n_periods,)
+KMParams = namedtuple('KMParams', ['m', 'n', 'r', 'mu', 'u_const', 'k_const', 'xi', 'u_bar_cof', 'u_bar_exp'])
+# site and domain settings, same order as 'LegacyParameters' of the classic model
+SiteConf = namedtuple('SiteConf', ['z_m', 'z_0', 'x_max', 'y_max', 'dx', 'x_loc', 'y_loc'])
+MET_COLS = ['wind_dir', 'wind_speed', 'u*', 'L', 'sigma_v']  # inputs of a footprint grid
+FP_STAGE = 'fp_grds'  # half-hours with their grids written
+
+
+def read_met_data(result_path: str, extra_cols=()) -> pd.DataFrame:
+    met_cols = ['date', 'time', 'wind_dir', 'wind_speed', 'u*', 'L', 'var(v)', *extra_cols]
+    met_data = pd.read_csv(result_path, usecols=met_cols, na_values=-9999)
+    met_data.index = pd.to_datetime(met_data.pop('date') + ' ' + met_data.pop('time'))
+    met_data.dropna(inplace=True)
+    met_data['sigma_v'] = met_data.pop('var(v)') ** 0.5
+    return met_data
+
+
+def km_params(u_star, L, z_m, z_0) -> KMParams:
+    u_star = np.asarray(u_star, dtype=float)
+    L = np.asarray(L, dtype=float)
+    L = np.where(np.abs(L) < z_0, (z_0 + 0.5) * np.sign(L), L)  # avoid singular stability functions
+    stab = func_stability(L, z_m, z_0)
+    z_div_L = stab.z_div_L
+
+    with np.errstate(divide='ignore', invalid='ignore'):  # both branches are evaluated by np.where
+        n = np.where(L > 0, 1 / (1 + 5 * z_div_L), (1 - 24 * z_div_L) / (1 - 16 * z_div_L))
+    u = np.maximum(u_star / const_kar * (np.log(z_m / z_0) - stab.psi_m + stab.psi_m_0), u_star)
+    m = u_star / const_kar * stab.phi_m / u
+    u_const = u / z_m ** m
+    k_const = const_kar * u_star / stab.phi_c * z_m ** (1 - n)
+    r = 2 + m - n
+    mu = (1 + m) / r
+    xi = u_const * z_m ** r / (r ** 2 * k_const)  # length scale of the crosswind integrated footprint
+    u_bar_cof = np.exp(gammaln(mu) - gammaln(1 / r)) * (r ** 2 * k_const / u_const) ** (m / r) * u_const
+    u_bar_exp = m / r
+    return KMParams(m, n, r, mu, u_const, k_const, xi, u_bar_cof, u_bar_exp)
+
+
+def km_footprints(params: KMParams, sigma_v, wind_dir, x_rel, y_rel) -> np.ndarray:
+    """
+    Footprint density (1/m2) on the nodes given by x_rel/y_rel (2d, relative to the tower, x east, y north),
+    returns an array of shape (n_periods, ny, nx)
+    """
+    col = (slice(None), np.newaxis, np.newaxis)  # broadcast per period values over the grid
+    wd = np.radians(np.asarray(wind_dir, dtype=float))[col]
+    x_up = x_rel * np.sin(wd) + y_rel * np.cos(wd)  # upwind distance
+    y_cross = x_rel * np.cos(wd) - y_rel * np.sin(wd)  # crosswind distance
+
+    upwind = x_up > 0
+    x_up = np.where(upwind, x_up, 1.)  # placeholder to keep logs finite, masked out below
+    mu, xi = params.mu[col], params.xi[col]
+    log_f = mu * np.log(xi) - gammaln(mu) - (1 + mu) * np.log(x_up) - xi / x_up  # crosswind integrated
+    sigma = np.asarray(sigma_v, dtype=float)[col] * x_up / (params.u_bar_cof[col] * x_up ** params.u_bar_exp[col])
+    log_d = -0.5 * (y_cross / sigma) ** 2 - np.log(np.sqrt(2 * np.pi) * sigma)  # crosswind dispersion
+    return np.where(upwind, np.exp(log_f + log_d), 0.)
+
+
+def grid_nodes(site: SiteConf):
+    nx = int(round(site.x_max / site.dx))
+    ny = int(round(site.y_max / site.dx))
+    x = np.arange(nx) * site.dx
+    y = np.arange(ny) * site.dx
+    return x, y
+
+
+def relative_nodes(site: SiteConf):
+    x, y = grid_nodes(site)
+    return np.meshgrid(x - site.x_loc, y - site.y_loc)
+
+
+def write_fp_grds(site: SiteConf, time_index, fps: np.ndarray, output_dir: str):
+    x, y = grid_nodes(site)
+    for time_stamp, fp in zip(time_index, fps * site.dx ** 2):  # density to contribution of each cell
+        write_grd(os.path.join(output_dir, '{:%y%m%d%H%M}.grd'.format(time_stamp)), fp,
+                  (x[0], x[-1]), (y[0], y[-1]))
+
+
+def _generate_fp_chunk(site: SiteConf, met_chunk: pd.DataFrame, output_dir: str):
+    x_rel, y_rel = relative_nodes(site)
+    params = km_params(met_chunk['u*'].values, met_chunk['L'].values, site.z_m, site.z_0)
+    fps = km_footprints(params, met_chunk['sigma_v'].values, met_chunk['wind_dir'].values, x_rel, y_rel)
+    write_fp_grds(site, met_chunk.index, fps, output_dir)
+    metrics.meter(FP_STAGE).add(len(met_chunk))
+    return len(met_chunk)
+
+
+class FpGrdGeneratorNative(FpGrdGenerator):
+    MODEL_NAME = 'native'  # part of the manifest hashes, grids of another model are recomputed
 
-
-class FpGrdGenerator(BaseModule):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.met_data = None
+
     def _parse_config(self):
-        prj_conf = self._config['Project']
-        self._p_cores = int(prj_conf['CPU_Cores'])
-        self._io_threads = self._p_cores * 2  # seems reasonable
+        self.n_cores = int(self._config['Project']['CPU_Cores'])
+
         fpg_conf = self._config['Footprint']
         self._epr_dir = fpg_conf['Eddy_Pro_Results_Directory']
         self._fpout_dir = fpg_conf['Footprint_Data_Output_Directory']
-
-    def generate_footprint_grids(self):
-        raise NotImplementedError
-
-
-
-"""
-footprint_grid = np.zeros((100, 100))
-n_x = n_y = 0
-x_max = y_max = f_max = 0
-
-
-def read_grd_data(grd_path):
-    with open(grd_path, 'r') as f:
-        heads = []  # first 5 lines of grd file
-        for n in range(5):
-            heads.append(f.readline())
-        nx, ny = map(int, heads[1].split())
-        data_fracs = []
-        while True:
-            line = f.readline()
-            if not line:  # end of file
-                break
-            data_fracs.append(np.fromstring(line, sep=' ', dtype='f4'))
-    return np.concatenate(data_fracs).reshape(nx, ny)
-
-class FPCalculator:
-    def calc_fp(self, z_m, z_0, date_time, wind_dir, wind_spd, sigma_v, u_star, L, h_s, rho_air):
-        if abs(L) < z_0:
-            L = (z_0 + 0.5) * np.sign(L)
-
-        u = max(u_star / const_kar * (log(z_m / z_0)
-                                - func_psi_m(z_m / L)
-                                + func_psi_m(z_0 / L)),
-                u_star)
-
-        m = u_star / const_kar * func_phi_m(z_m / L) / u
-
-        n = 1 / (1 + 5 * z_m / L) if L > 0 else (1 - 24 * z_m / L) / (1 - 16 * z_m / L)
-
-        u_const = u / (z_m ** m)
-
-        k_const = const_kar * u_star / func_phi_c(z_m / L) * (z_m ** (1 - n))
-
-        r = 2 + m - n
-
-        mu = (1 + m) / r
-
-
-        A = r * gamma(2 / r) / gamma(1 / r) ** 2
-        B =gamma(2 / r) / gamma(1 / r)
-        z_bar_cof = B * (r ** 2 * const_kar / u_const) ** (1 / r)
-        z_bar_exp = 1 / r
-        u_bar_cof = gamma(mu) / gamma(1 / r) * (r ** 2 * k_const / u_const) ** (m / r) * u_const
-        u_bar_exp = m / r
-
-    def z_bar(x, B, r, k, U):
-        return B * (x ** (1 / r))
-
-
-def output_fp_grd(grd_conf, output_path):
-    with open(output_path, mode='w') as output_file:
-        output_file.write('DSAA\n'
-                          f'{grd_conf.n_x} {grd_conf.n_y}\n'
-                          f'0 {grd_conf.x_max}\n'
-                          f'0 {grd_conf.y_max}\n'
-                          f'0 {grd_conf.f_max}\n')
-
-
-def read_met_data(met_data_path):
-    with open(met_data_path, mode='r') as met_data_file:
-        met_data = met_data_file.readlines()
-        for met_datum in met_data[1:]:  # skip first line
-            date_time, wind_dir, wind_spd, sigma_v, u_star, obukhov_l, h_s, rho_air, key = met_datum.split()
-
-
-def read_site_conf(site_param_path, site_locs_path):
-    with open(site_param_path, mode='r') as site_param_file:
-        z_m, z_0 = site_param_file.readline().split(',')[:2]
-        x_max, y_max, dx = site_param_file.readline().split(',')[:3]
-    with open(site_locs_path) as site_locs_file:
-        site_locs = [site_loc.split(',') for site_loc in site_locs_file.readlines()]
-    return z_m, z_0, x_max, y_max, dx, site_locs
-
-
-
-    # if __name__ == '__main__':
-    #     read_met_data(
-    #         r'D:\Truman\Desktop\present_work\01_ammonia\00_general\03_tools\footprint\footprint\01\02metdata.dat')
-    #     read_site_conf('01paras.dat', '')
-"""
+        self._site = SiteConf(*map(float, fpg_conf['LegacyParameters'].split(',')[:7]))
+        self._chunk_size = fpg_conf.getint('Native_Chunk_Size', fallback=48)  # half-hours per vectorized batch
+
+    def _initialize_fp_model(self):
+        @self._logger.log_action('Loading Meteorological Data')
+        def action():
+            result_path = get_path(target_dir=self._epr_dir,
+                                   file_init='eddypro_ADV_essentials',
+                                   file_ext='adv.csv')
+            self.met_data = read_met_data(result_path)
+            self._logger.log('[ {} ] valid half-hours found.'.format(len(self.met_data)))
+
+        action()
+
+    def _run_fp_model(self):
+        @self._logger.log_action('Running {} Footprint Model with {} processes'.format(self.MODEL_NAME.title(),
+                                                                                     self.n_cores))
+        def action():
+            os.makedirs(self._fpout_dir, exist_ok=True)
+            manifest = FpManifest(self._fpout_dir)
+            hashes = period_hashes(self.met_data[MET_COLS], (self.MODEL_NAME, *self._site))
+            todo = manifest.pending(hashes).values
+            self._logger.log('[ {} ] of [ {} ] half-hours missing or changed.'.format(todo.sum(), len(todo)))
+            met_todo, hashes_todo = self.met_data[todo], hashes[todo]
+            chunks = [slice(n, n + self._chunk_size) for n in range(0, len(met_todo), self._chunk_size)]
+
+            def chunk_done(chunk):
+                def callback(_):
+                    manifest.commit(hashes_todo.iloc[chunk])
+
+                return callback
+
+            with metrics.stage(FP_STAGE, self.n_cores, unit='half-hours', target=len(met_todo)), \
+                    Pool(self.n_cores, *chain_initializers(self._logger.pool_initializer,
+                                                           metrics.pool_initializer(FP_STAGE))) as p:
+                fp_async = [p.apply_async(*self._chunk_task(met_todo.iloc[chunk]), callback=chunk_done(chunk))
+                            for chunk in chunks]
+                p.close()
+                p.join()
+            [fp_chunk_async.get() for fp_chunk_async in fp_async]  # re-raise errors from workers
+
+        action()
+
+    def _chunk_task(self, met_chunk: pd.DataFrame):
+        # worker function and its arguments, runs in another process
+        return _generate_fp_chunk, (self._site, met_chunk, self._fpout_dir)
@@ -0,0 +1,177 @@
+"""
+Lookup table of Kormann-Meixner footprints: with z_m and z_0 fixed, the footprint in along/crosswind coordinates
+only depends on z_m/L and sigma_v/u*, wind direction only rotates it. Canonical footprints are computed once on a
+grid of both, each half-hour is interpolated between them and rotated onto the site grid.
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.ndimage import affine_transform
+
+from core.fp import FP_STAGE, FpGrdGeneratorNative, SiteConf, km_footprints, km_params, relative_nodes, write_fp_grds
+from util.metrics import metrics
+
+ZETA_RANGE = (-2., 1.)  # z_m/L covered by the table, beyond it the nearest bin is used
+RATIO_RANGE = (.8, 4.)  # sigma_v/u* covered by the table
+
+
+class FootprintLUT:
+    def __init__(self, site: SiteConf, zeta_bins, ratio_bins, tables: np.ndarray):
+        self.site = site
+        self.zeta_bins = np.asarray(zeta_bins, dtype=np.float64)
+        self.ratio_bins = np.asarray(ratio_bins, dtype=np.float64)
+        self.tables = tables  # (n_zeta, n_ratio, n_up, n_cross) densities, rows along the wind
+
+    @staticmethod
+    def canonical_nodes(site: SiteConf):
+        # upwind distances from 0 and crosswind distances centered on 0, far enough for any corner of the grid
+        x_rel, y_rel = relative_nodes(site)
+        reach = np.hypot(x_rel, y_rel).max() + site.dx
+        n_up = int(np.ceil(reach / site.dx)) + 1
+        x_up = np.arange(n_up) * site.dx
+        y_cross = (np.arange(2 * n_up - 1) - (n_up - 1)) * site.dx
+        return x_up, y_cross
+
+    @classmethod
+    def build(cls, site: SiteConf, zeta_bins, ratio_bins):
+        x_up, y_cross = cls.canonical_nodes(site)
+        cross_rel, up_rel = np.meshgrid(y_cross, x_up)  # a northerly wind puts the upwind axis along y
+        tables = np.empty((len(zeta_bins), len(ratio_bins), len(x_up), len(y_cross)), dtype=np.float32)
+        for n, zeta in enumerate(zeta_bins):  # u* = 1, the shape does not depend on it
+            params = km_params(np.ones(len(ratio_bins)), np.full(len(ratio_bins), site.z_m / zeta), site.z_m,
+                               site.z_0)
+            tables[n] = km_footprints(params, ratio_bins, np.zeros(len(ratio_bins)), cross_rel, up_rel)
+        return cls(site, zeta_bins, ratio_bins, tables)
+
+    @staticmethod
+    def default_bins(n_zeta: int, n_ratio: int):
+        zeta_bins = np.linspace(*ZETA_RANGE, n_zeta)
+        zeta_bins[zeta_bins == 0] = 1e-6  # neutral, L = z_m / zeta stays finite
+        return zeta_bins, np.linspace(*RATIO_RANGE, n_ratio)
+
+    @staticmethod
+    def cache_path(cache_dir: str, site: SiteConf, zeta_bins, ratio_bins):
+        key = json.dumps([list(site), list(map(float, zeta_bins)), list(map(float, ratio_bins))])
+        return os.path.join(cache_dir, 'fp_lut_{}.npz'.format(hashlib.sha1(key.encode()).hexdigest()[:16]))
+
+    @classmethod
+    def cached(cls, cache_dir: str, site: SiteConf, zeta_bins, ratio_bins):
+        lut_path = cls.cache_path(cache_dir, site, zeta_bins, ratio_bins)
+        if os.path.exists(lut_path):
+            return cls.load(lut_path)
+        lut = cls.build(site, zeta_bins, ratio_bins)
+        os.makedirs(cache_dir, exist_ok=True)
+        lut.save(lut_path)
+        return lut
+
+    def save(self, lut_path: str):
+        temp_path = lut_path + '.tmp.npz'
+        np.savez(temp_path, site=np.asarray(self.site), zeta_bins=self.zeta_bins, ratio_bins=self.ratio_bins,
+                 tables=self.tables)
+        os.replace(temp_path, lut_path)
+
+    @classmethod
+    def load(cls, lut_path: str):
+        with np.load(lut_path) as npz:
+            return cls(SiteConf(*npz['site']), npz['zeta_bins'], npz['ratio_bins'], npz['tables'])
+
+    @staticmethod
+    def _bin_weights(values, bins):
+        # lower bin and weight of the upper one, values outside the bins are clamped
+        position = np.interp(values, bins, np.arange(len(bins)))
+        lower = np.minimum(position.astype(int), len(bins) - 2)
+        return lower, position - lower
+
+    def footprints(self, u_star, L, sigma_v, wind_dir, x_rel, y_rel) -> np.ndarray:
+        """
+        Same as km_footprints(km_params(u_star, L, ...), sigma_v, wind_dir, x_rel, y_rel) up to interpolation,
+        x_rel/y_rel must be a regular grid with the spacing of the table
+        """
+        u_star = np.asarray(u_star, dtype=np.float64)
+        zeta_n, zeta_w = self._bin_weights(self.site.z_m / np.asarray(L, dtype=np.float64), self.zeta_bins)
+        ratio_n, ratio_w = self._bin_weights(np.asarray(sigma_v, dtype=np.float64) / u_star, self.ratio_bins)
+        col = (slice(None), np.newaxis, np.newaxis)
+        canonical = sum(self.tables[zeta_n + dz, ratio_n + dr] *
+                        ((zeta_w if dz else 1 - zeta_w) * (ratio_w if dr else 1 - ratio_w)).astype(np.float32)[col]
+                        for dz in (0, 1) for dr in (0, 1))
+
+        # node (row j, column i) of the site grid sits at (up, cross) = (j, i) @ rotation + offset of the table
+        wd = np.radians(np.asarray(wind_dir, dtype=np.float64))
+        x_0, y_0 = x_rel[0, 0] / self.site.dx, y_rel[0, 0] / self.site.dx
+        center = (self.tables.shape[3] - 1) / 2
+        fps = np.empty((len(wd),) + x_rel.shape, dtype=np.float32)
+        for n, (sin, cos) in enumerate(zip(np.sin(wd), np.cos(wd))):  # one bilinear pass per half-hour
+            affine_transform(canonical[n], np.array([[cos, sin], [-sin, cos]]),
+                             offset=(x_0 * sin + y_0 * cos, x_0 * cos - y_0 * sin + center),
+                             output_shape=x_rel.shape, output=fps[n], order=1, mode='constant', cval=0.)
+        return fps
+
+    def errors(self, met_data: pd.DataFrame) -> pd.DataFrame:
+        """
+        Interpolated against exact footprints of the given half-hours: relative L1 error, largest node error
+        relative to the exact peak, and footprint mass on the site grid of both
+        """
+        x_rel, y_rel = relative_nodes(self.site)
+        args = met_data['u*'].values, met_data['L'].values
+        exact = km_footprints(km_params(*args, self.site.z_m, self.site.z_0), met_data['sigma_v'].values,
+                              met_data['wind_dir'].values, x_rel, y_rel)
+        approx = self.footprints(*args, met_data['sigma_v'].values, met_data['wind_dir'].values, x_rel, y_rel)
+        diff = np.abs(approx - exact).sum(axis=(1, 2))
+        cell = self.site.dx ** 2
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return pd.DataFrame({'l1_error': diff / exact.sum(axis=(1, 2)),
+                                 'peak_error': np.abs(approx - exact).max(axis=(1, 2)) / exact.max(axis=(1, 2)),
+                                 'exact_mass': exact.sum(axis=(1, 2)) * cell,
+                                 'lut_mass': approx.sum(axis=(1, 2)) * cell}, index=met_data.index)
+
+
+_luts = {}  # tables loaded by a worker process, shared by all its chunks
+
+
+def _generate_lut_chunk(lut_path: str, met_chunk: pd.DataFrame, output_dir: str):
+    if lut_path not in _luts:
+        _luts[lut_path] = FootprintLUT.load(lut_path)
+    lut = _luts[lut_path]
+    x_rel, y_rel = relative_nodes(lut.site)
+    fps = lut.footprints(met_chunk['u*'].values, met_chunk['L'].values, met_chunk['sigma_v'].values,
+                         met_chunk['wind_dir'].values, x_rel, y_rel)
+    write_fp_grds(lut.site, met_chunk.index, fps, output_dir)
+    metrics.meter(FP_STAGE).add(len(met_chunk))
+    return len(met_chunk)
+
+
+class FpGrdGeneratorLUT(FpGrdGeneratorNative):
+    MODEL_NAME = 'lut'
+
+    def _parse_config(self):
+        super()._parse_config()
+
+        fpg_conf = self._config['Footprint']
+        self._lut_dir = fpg_conf.get('LUT_Cache_Directory', fallback=self._fpout_dir)
+        self._lut_bins = FootprintLUT.default_bins(fpg_conf.getint('LUT_Stability_Bins', fallback=31),
+                                                   fpg_conf.getint('LUT_Turbulence_Bins', fallback=12))
+        self._n_validation = fpg_conf.getint('LUT_Validation_Periods', fallback=48)
+        self._lut_path = None
+
+    def _initialize_fp_model(self):
+        super()._initialize_fp_model()
+
+        @self._logger.log_action('Loading Footprint Lookup Table')
+        def action():
+            lut = FootprintLUT.cached(self._lut_dir, self._site, *self._lut_bins)
+            self._lut_path = FootprintLUT.cache_path(self._lut_dir, self._site, *self._lut_bins)
+            if self._n_validation and len(self.met_data):
+                sample = np.unique(np.linspace(0, len(self.met_data) - 1, self._n_validation).astype(int))
+                errors = lut.errors(self.met_data.iloc[sample])
+                self._logger.log('Relative L1 error against the exact model over [ {} ] half-hours: '
+                                 'median {:.2%}, max {:.2%}'.format(len(errors), errors['l1_error'].median(),
+                                                                    errors['l1_error'].max()))
+
+        action()
+
+    def _chunk_task(self, met_chunk: pd.DataFrame):
+        return _generate_lut_chunk, (self._lut_path, met_chunk, self._fpout_dir)
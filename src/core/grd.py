@@ -1,6 +1,98 @@
+"""
+Read and write Surfer ASCII (DSAA) grid files, parsed grids are cached as memory-mapped .npy sidecars
+"""
+
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
 
 from core.base import BaseData
+
+SURFER_BLANK = 1.70141e38  # value of blanked nodes in Surfer grids
+
+GrdHeader = namedtuple('GrdHeader', ['nx', 'ny', 'x_range', 'y_range', 'z_range'])
+
+
+def valid_nodes(data: np.ndarray) -> np.ndarray:
+    return np.isfinite(data) & (data < SURFER_BLANK * 0.999)  # tolerate the float32 rounding of cached grids
+
+
+def read_grd_header(grd_file) -> GrdHeader:
+    heads = [grd_file.readline() for _ in range(5)]  # first 5 lines of grd file
+    if heads[0].strip() != 'DSAA':
+        raise ValueError('Not a Surfer ASCII grid file: {}'.format(grd_file.name))
+    nx, ny = map(int, heads[1].split())
+    x_range, y_range, z_range = (tuple(map(float, head.split())) for head in heads[2:5])
+    return GrdHeader(nx, ny, x_range, y_range, z_range)
+
+
+def write_grd(grd_path: str, grid: np.ndarray, x_range, y_range):
+    ny, nx = grid.shape
+    valid = valid_nodes(grid)
+    z_range = (grid[valid].min(), grid[valid].max()) if valid.any() else (0., 0.)
+    grid = np.where(valid, grid, SURFER_BLANK)  # NaN is not understood by Surfer
+    row_fmt = ' '.join(nx * ['%.5e'])
+    with open(grd_path, mode='w') as grd_file:
+        grd_file.write('DSAA\n'
+                       f'{nx} {ny}\n'
+                       f'{x_range[0]} {x_range[1]}\n'
+                       f'{y_range[0]} {y_range[1]}\n'
+                       f'{z_range[0]:.5e} {z_range[1]:.5e}\n')
+        grd_file.write('\n'.join(row_fmt % tuple(row) for row in grid) + '\n')
+
+
 class GrdData(BaseData):
+    def __init__(self, data_path: str, *, cached=True):
+        super().__init__()
+        self.data_path = data_path
+        self._cached = cached
+
+        self.header = None
+        self.data = None  # (ny, nx) array, rows from y_min to y_max
+
+        self._load_data()
+
+    @property
+    def cache_path(self):
+        return self.data_path + '.npy'
+
+    @property
+    def _cache_key_path(self):
+        return self.data_path + '.npy.json'
+
     def _load_data(self):
-        with open(self.data_path,'r') as f:
+        grd_stat = os.stat(self.data_path)
+        cache_key = {'mtime_ns': grd_stat.st_mtime_ns, 'size': grd_stat.st_size}
+        if self._cached and self._load_cache(cache_key):
+            return
+        with open(self.data_path, 'r') as f:
+            self.header = read_grd_header(f)
+            self.data = np.fromstring(f.read(), sep=' ', dtype='f4').reshape(self.header.ny, self.header.nx)
+        if self._cached:
+            self._write_cache(cache_key)
+
+    def _load_cache(self, cache_key: dict) -> bool:
+        try:
+            with open(self._cache_key_path, 'r') as f:
+                cache_meta = json.load(f)
+            if cache_meta['key'] != cache_key:  # grd file changed since cached
+                return False
+            self.header = GrdHeader(**{k: tuple(v) if isinstance(v, list) else v
+                                       for k, v in cache_meta['header'].items()})
+            self.data = np.load(self.cache_path, mmap_mode='r')
+            return True
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
 
+    def _write_cache(self, cache_key: dict):
+        try:
+            temp_path = self.cache_path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                np.save(f, self.data)
+            os.replace(temp_path, self.cache_path)
+            with open(self._cache_key_path, 'w') as f:  # key written last, a stale key never matches new data
+                json.dump({'key': cache_key, 'header': self.header._asdict()}, f)
+        except OSError:
+            pass  # read-only location, keep the parsed data only
@@ -0,0 +1,60 @@
+"""
+Cumulative contribution levels of footprint grids, e.g. the node value enclosing 50% of the footprint
+"""
+
+from multiprocessing import Pool
+
+import numpy as np
+
+from core.grd import GrdData, valid_nodes
+
+DEFAULT_LEVELS = (.5, .7, .8, .9)
+LVL_STYLES = [('Blue', 'R0 G255 B0 A38'),  # (line color, fill color) from the outermost level inwards
+              ('Green', 'R255 G255 B0 A77'),
+              ('Yellow', 'R255 G255 B0 A115'),
+              ('Orange', 'R255 G0 B0 A153')]
+
+
+def contribution_levels(grids: np.ndarray, levels=DEFAULT_LEVELS) -> np.ndarray:
+    """
+    For each grid of a (n, ny, nx) stack, the node value at which the cumulative sum of nodes in descending
+    order first exceeds each fraction in levels, returns an array of shape (n, len(levels))
+    """
+    grids = np.asarray(grids, dtype=np.float64).reshape(len(grids), -1)
+    grids = np.where(valid_nodes(grids), grids, 0.)
+    descend = -np.sort(-grids, axis=1)
+    cum_frac = np.cumsum(descend, axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cum_frac /= cum_frac[:, -1:]
+    level_values = np.empty((len(grids), len(levels)))
+    for n, level in enumerate(levels):  # a handful of levels, the grids are handled at once
+        first_above = np.minimum((cum_frac <= level).sum(axis=1), grids.shape[1] - 1)
+        level_values[:, n] = descend[np.arange(len(grids)), first_above]
+    return level_values
+
+
+def write_lvl(lvl_path: str, level_values, levels=DEFAULT_LEVELS):
+    lvl_rows = ['LVL3',
+                "'Level Flags LColor LStyle LWidth FVersion FFGColor FBGColor FPattern OffsetX OffsetY ScaleX ScaleY "
+                "Angle Coverage"]
+    for n, level_n in enumerate(np.argsort(levels)[::-1]):  # widest contour first
+        line_color, fill_color = LVL_STYLES[n % len(LVL_STYLES)]
+        lvl_rows.append('{:8.6f} 0 "{}" "Solid" 0 1 "{}" "White" "Solid" 0 0 1 1 0 0'.format(
+            level_values[level_n], line_color, fill_color))
+    with open(lvl_path, mode='w') as lvl:
+        lvl.write('\n'.join(lvl_rows) + '\n')
+
+
+def _grd_levels_sub(grd_paths: list, levels):
+    grids = np.stack([GrdData(grd_path).data for grd_path in grd_paths])
+    return contribution_levels(grids, levels)
+
+
+def write_grd_levels(grd_paths: list, levels=DEFAULT_LEVELS, *, n_processes: int = None, batch_size=256):
+    batches = [grd_paths[n: n + batch_size] for n in range(0, len(grd_paths), batch_size)]
+    with Pool(n_processes) as p:
+        level_values = np.concatenate(
+            [np.empty((0, len(levels)))] + p.starmap(_grd_levels_sub, [(batch, levels) for batch in batches]))
+    for grd_path, grd_level_values in zip(grd_paths, level_values):  # e.g. '1807010030.grd.lvl'
+        write_lvl(grd_path + '.lvl', grd_level_values, levels)
+    return level_values
@@ -0,0 +1,56 @@
+"""
+Manifest of generated footprint grids, maps each half-hour to a hash of everything its grid was computed from
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+GRD_NAME_FORMAT = '%y%m%d%H%M'  # e.g. '1807010030.grd'
+
+
+def period_hashes(met_data: pd.DataFrame, model_params) -> pd.Series:
+    """
+    Hash of each met row together with the model parameters, indexed by grid name stem
+    """
+    param_bytes = json.dumps(list(model_params)).encode()
+    rows = met_data.to_numpy(dtype='f8')
+    hashes = [hashlib.sha1(param_bytes + row.tobytes()).hexdigest() for row in rows]
+    return pd.Series(hashes, index=met_data.index.strftime(GRD_NAME_FORMAT))
+
+
+class FpManifest:
+    FILE_NAME = 'fp_manifest.json'
+
+    def __init__(self, grd_dir: str):
+        self.grd_dir = grd_dir
+        self.path = os.path.join(grd_dir, self.FILE_NAME)
+        self.entries = {}  # grid name stem -> input hash
+
+        self._load_data()
+
+    def _load_data(self):
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):  # first run, or a manifest nobody can trust
+            self.entries = {}
+
+    def pending(self, hashes: pd.Series) -> pd.Series:
+        """
+        Boolean mask of the periods whose grid is missing or was computed from other inputs
+        """
+        grd_names = set(os.listdir(self.grd_dir)) if os.path.isdir(self.grd_dir) else set()
+        return pd.Series([self.entries.get(stem) != hash_ or stem + '.grd' not in grd_names
+                          for stem, hash_ in hashes.items()], index=hashes.index, dtype=bool)
+
+    def commit(self, hashes: pd.Series):
+        # called once the grids are in place, an interrupted run keeps everything committed so far
+        self.entries.update(hashes.to_dict())
+        os.makedirs(self.grd_dir, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_path, self.path)
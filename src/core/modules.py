@@ -1,6 +1,10 @@
 from collections import namedtuple
 
+import numpy as np
+import pandas as pd
+
 from core.base import BaseModule
+from core.flux import estimate_flux
 
 
 class FpGrdGenerator(BaseModule):
@@ -23,12 +27,58 @@ class FpGrdGenerator(BaseModule):
 
 
 class FluxEstimator(BaseModule):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.data = None
+
     def _parse_config(self):
+        self._mod_config = self._config['Flux_Estimation']
         fe_config = namedtuple('fe_config', ['fc_N_path',
                                              'C_N_path',
                                              'fc_S_path',
-                                             'C_S_path'])
+                                             'C_S_path',
+                                             'interval',
+                                             'out_path'])
         self.config = fe_config(self._mod_config['north_fcsum_file_path'],
                                 self._mod_config['north_conc_file_path'],
                                 self._mod_config['south_fcsum_file_path'],
-                                self._mod_config['south_conc_file_path'])
+                                self._mod_config['south_conc_file_path'],
+                                self._mod_config.get('estimation_interval', ''),  # one flux per period if empty
+                                self._mod_config.get('flux_output_path', ''))
+
+    @staticmethod
+    def _read_series(path: str) -> pd.Series:
+        # time stamps in the first column, values in the second
+        return pd.read_csv(path, index_col=0, parse_dates=[0], na_values=-9999).iloc[:, 0]
+
+    def load_data(self):
+        @self._logger.log_action('Loading Footprint Weights and Concentrations')
+        def action():
+            paths = self.config._asdict()
+            self.data = pd.concat({name: self._read_series(paths[name + '_path'])
+                                   for name in ['fc_N', 'C_N', 'fc_S', 'C_S']}, axis=1, join='inner')
+            self._logger.log('[ {} ] half-hours with both towers found.'.format(len(self.data)))
+
+        action()
+
+    def estimate(self, qc=None) -> pd.DataFrame:
+        """
+        Source flux of each estimation interval and background concentration of each period, data is loaded
+        once and kept, so inversions with other QC masks (boolean series or callable on the data) are cheap
+        """
+        if self.data is None:
+            self.load_data()
+        valid = self.data.notna().all(axis=1)
+        if qc is not None:
+            valid &= (qc(self.data) if callable(qc) else qc).reindex(self.data.index, fill_value=False)
+        groups = self.data.index.floor(self.config.interval) if self.config.interval else self.data.index
+        group_codes, flux, background = estimate_flux(self.data[['fc_N', 'fc_S']].values,
+                                                      self.data[['C_N', 'C_S']].values,
+                                                      groups, valid.values)
+        estimates = pd.DataFrame({'C_bg': background}, index=self.data.index)
+        estimates['F'] = pd.Series(flux, index=group_codes).reindex(groups).values
+        estimates.loc[~valid.values, 'F'] = np.nan
+        if self.config.out_path:
+            estimates.to_csv(self.config.out_path, na_rep=-9999)
+        return estimates
@@ -0,0 +1,136 @@
+"""
+Project stages as a dependency graph, independent stages run at once and a stage whose inputs did not change
+since its last completion, and whose outputs are still as it left them, is skipped
+"""
+
+import hashlib
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from core.file import get_paths
+
+# input_paths: files or directories the stage reads, output_paths: those it writes, config_sections: sections
+# of the config it depends on, params: any other arguments of the stage run, process: runs in a process of its
+# own instead of a thread, run must then be picklable
+Stage = namedtuple('Stage', ['name', 'run', 'deps', 'input_paths', 'output_paths', 'config_sections', 'params',
+                             'process'])
+
+
+def path_fingerprint(path: str):
+    # (relative path, size, mtime) of every file, changes of content, additions and removals all show up
+    if os.path.isfile(path):
+        paths, root = [path], os.path.dirname(path)
+    else:
+        paths, root = get_paths(target_dir=path, file_ext=''), path
+    entries = []
+    for file_path in paths:
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:  # removed since indexed
+            continue
+        entries.append((os.path.relpath(file_path, root), file_stat.st_size, file_stat.st_mtime_ns))
+    return sorted(entries)
+
+
+class Pipeline:
+    def __init__(self, config, checkpoint_path: str, *, logger, max_workers: int = 2):
+        self._config = config
+        self._checkpoint_path = checkpoint_path
+        self._logger = logger
+        self._max_workers = max_workers
+        self.stages = {}
+        self.checkpoints = {}  # stage name -> input and output fingerprints of its last completion
+
+        self._load_checkpoints()
+
+    def _load_checkpoints(self):
+        try:
+            with open(self._checkpoint_path, 'r') as f:
+                self.checkpoints = json.load(f)
+        except (OSError, ValueError):
+            self.checkpoints = {}
+
+    def _save_checkpoints(self):
+        temp_path = self._checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.checkpoints, f, indent=2)
+        os.replace(temp_path, self._checkpoint_path)
+
+    def add(self, name: str, run, *, deps=(), input_paths=(), output_paths=(), config_sections=(), params=(),
+            process=False):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError('Stage {} depends on unknown stage {}'.format(name, dep))
+        self.stages[name] = Stage(name, run, tuple(deps), tuple(input_paths), tuple(output_paths),
+                                   tuple(config_sections), tuple(params), process)
+
+    def fingerprint(self, stage: Stage) -> str:
+        inputs = {'paths': [(path, path_fingerprint(path)) for path in stage.input_paths],
+                  'config': [(section, sorted(self._config[section].items()) if self._config.has_section(section)
+                              else None) for section in stage.config_sections],
+                  'params': list(stage.params)}
+        return hashlib.sha1(json.dumps(inputs).encode()).hexdigest()
+
+    @staticmethod
+    def output_fingerprint(stage: Stage) -> str:
+        # removed or altered outputs make the stage run again, even with the same inputs
+        outputs = [(path, path_fingerprint(path)) for path in stage.output_paths]
+        return hashlib.sha1(json.dumps(outputs).encode()).hexdigest()
+
+    def _up_to_date(self, stage: Stage, fingerprint: str) -> bool:
+        checkpoint = self.checkpoints.get(stage.name)
+        return (isinstance(checkpoint, dict) and checkpoint.get('inputs') == fingerprint and
+                checkpoint.get('outputs') == self.output_fingerprint(stage))
+
+    def _required(self, targets) -> set:
+        required = set()
+        stack = list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in required:
+                required.add(name)
+                stack.extend(self.stages[name].deps)
+        return required
+
+    def run(self, targets=None, *, force=False) -> dict:
+        """
+        Runs the target stages and everything they depend on, returns {stage name: 'done' or 'skipped'}; a stage
+        only counts as done if it returns, stages with incomplete results have to raise
+        """
+        pending = [name for name in self.stages if name in self._required(targets or self.stages)]
+        status = {}
+        running = {}
+        # stages forking pools of their own run in processes, pools forked from threads of a busy process can
+        # inherit locks held by the other threads
+        initializer, initargs = self._logger.pool_initializer  # stages in processes log through this logger
+        n_processes = min(self._max_workers, max(sum(self.stages[name].process for name in pending), 1))
+        with ThreadPoolExecutor(self._max_workers) as executor, \
+                ProcessPoolExecutor(n_processes, initializer=initializer, initargs=initargs) as process_executor:
+            while pending or running:
+                for name in [name for name in pending if all(dep in status for dep in self.stages[name].deps)]:
+                    pending.remove(name)
+                    stage = self.stages[name]
+                    fingerprint = self.fingerprint(stage)  # upstream outputs are final by now
+                    if not force and self._up_to_date(stage, fingerprint):
+                        self._logger.log('[ {} ] inputs unchanged since last run, skipped.'.format(name))
+                        status[name] = 'skipped'
+                        continue
+                    running[(process_executor if stage.process else executor).submit(stage.run)] = (name, fingerprint)
+                if not running:
+                    continue  # stages released by skipped ones
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, fingerprint = running.pop(future)
+                    try:
+                        future.result()
+                    except BaseException:
+                        for other in running:  # finish what is running, start nothing new
+                            other.cancel()
+                        raise
+                    self.checkpoints[name] = {'inputs': fingerprint,
+                                              'outputs': self.output_fingerprint(self.stages[name])}
+                    self._save_checkpoints()
+                    status[name] = 'done'
+        return status
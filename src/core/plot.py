@@ -3,12 +3,81 @@ import json
 import os
 import sys
 from collections import namedtuple
+from multiprocessing import Pool
 
 import pandas as pd
-from matplotlib import pyplot as plt, dates as dates
+from matplotlib import pyplot as plt, dates as dates, ticker
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 from core.base import BaseModule
+from core.diurnal import box_stats, cached_hourly_stats, hourly_means
 from core.file import get_path
+from util.logger import logger
+from util.metrics import chain_initializers
+
+DAILY_PLOT_ORDER = ['wind_speed', 'wind_dir', 'T', 'rh_air', 'H']
+HOURLY_PLOT_ORDER = ['wind_speed', 'wind_dir', 'T', 'H']
+
+
+class DailyPlotRenderer:
+    """
+    Figure of one day of the variables, built with the first day and reused: later days only swap the line data
+    and the date limits. Renders on Agg without pyplot, so it works in worker processes.
+    """
+
+    def __init__(self, plot_settings: dict, plot_order: list = None):
+        self._pcs = plot_settings
+        self._plot_order = plot_order or DAILY_PLOT_ORDER
+        self._figure = None
+        self._sub_plots = []
+        self._lines = []
+
+    def _build(self, data: pd.DataFrame):
+        self._figure = Figure(figsize=(14, 20), dpi=300)
+        FigureCanvasAgg(self._figure)
+        for n, sub_name in enumerate(self._plot_order):
+            sub_plot = self._figure.add_subplot(len(self._plot_order), 1, n + 1, ylim=self._pcs[sub_name]['ylim'])
+            line, = sub_plot.plot(data[sub_name], self._pcs[sub_name]['style'], **self._pcs[sub_name]['params'])
+
+            sub_plot.tick_params(axis='both', length=10, which='major', direction='in', labelsize=14)
+            sub_plot.tick_params(axis='both', length=5, which='minor', direction='in', labelsize=14)
+
+            sub_plot.xaxis.set_major_formatter(dates.DateFormatter('%m/%d'))
+            sub_plot.xaxis.set_major_locator(dates.DayLocator())
+            sub_plot.xaxis.set_minor_locator(dates.HourLocator())
+            sub_plot.set_xlabel('Date', fontsize=18)
+
+            sub_plot.set_ylabel(self._pcs[sub_name]['label'], fontsize=18)
+            sub_plot.yaxis.set_major_locator(ticker.FixedLocator(self._pcs[sub_name]['y_ticks']))
+            self._sub_plots.append(sub_plot)
+            self._lines.append(line)
+
+    def render(self, data: pd.DataFrame, output_path: str):
+        if self._figure is None:
+            self._build(data)
+        x_lim = [data.index[0].date(), data.index[-1].date()]
+        for sub_name, sub_plot, line in zip(self._plot_order, self._sub_plots, self._lines):
+            line.set_data(data.index.values, data[sub_name].values)
+            sub_plot.set_xlim(x_lim)
+        self._figure.savefig(output_path)
+
+
+_daily_renderer = None  # of this process, reused for every day it renders
+
+
+def _init_daily_renderer(plot_settings: dict):
+    global _daily_renderer
+    _daily_renderer = DailyPlotRenderer(plot_settings)
+
+
+def _render_day(data: pd.DataFrame, output_path: str):
+    try:
+        _daily_renderer.render(data, output_path)
+    except Exception as e:  # one bad day does not stop the others
+        logger.log('Plotting [{}] failed: {!r}'.format(output_path, e))
+        return False
+    return True
 
 
 class TimeSeriesPlotter(BaseModule):
@@ -22,6 +91,9 @@ class TimeSeriesPlotter(BaseModule):
         tsp_config = self._config['TimeSeries_Plot']
         self._pdd = tsp_config['Plot_Data_Directory']
         self._pod = tsp_config['Plots_Output_Directory']
+        self._stats_dir = tsp_config.get('Statistics_Cache_Directory', fallback=self._pod)
+        self._n_processes = tsp_config.getint('Plot_Processes',
+                                              fallback=self._config.getint('Project', 'CPU_Cores', fallback=1))
         try:
             with open(tsp_config['Plot_Configurations_Path']) as pcs:
                 self._pcs = json.load(pcs)['plot_settings']
@@ -42,9 +114,8 @@ class TimeSeriesPlotter(BaseModule):
                        'rh_air']
         met_data = pd.read_csv(result_path,
                                usecols=useful_cols,
-                               parse_dates=[[0, 1]],
                                na_values=-9999)
-        met_data.set_index(met_data.columns[0], inplace=True)
+        met_data.index = pd.to_datetime(met_data.pop('date') + ' ' + met_data.pop('time'))
         # am_data = pd.read_csv(self.config.amd_path, parse_dates=[0])
         # am_data.set_index(am_data.columns[0], inplace=True)
         # self.data = am_data.join(met_data)
@@ -55,17 +126,37 @@ class TimeSeriesPlotter(BaseModule):
     def plot_windrose(self):
         pass
 
-    def plot_hourly_box(self):
-        plot_order = ['wind_speed', 'wind_dir', 'T', 'H']
-        hours = list(range(24))
-        hourly_data = self.data.resample('H').mean()
-        hourly_data['hour'] = hourly_data.index.hour
-        for plot_item in plot_order:
-            plot_data = {}
-            for hour in hours:
-                plot_data[hour] = list(pd.Series(hourly_data[hourly_data['hour'] == hour][plot_item]).values)
-            plot_data = pd.DataFrame.from_dict(plot_data, orient='index').transpose()
-            print(plot_data)
+    def hourly_stats(self, by: str = None) -> pd.DataFrame:
+        """
+        Statistics of the hourly means per hour of day, and per month or wind sector with by, see
+        core.diurnal.hourly_stats; computed once for the same data and read from the cache afterwards
+        """
+        hourly_data = hourly_means(self.data)  # wind directions as vector means
+        return cached_hourly_stats(hourly_data, self._stats_dir, HOURLY_PLOT_ORDER, by=by)
+
+    def plot_hourly_box(self, by: str = None):
+        # one figure of all variables, or one per month or wind sector with by
+        stats = self.hourly_stats(by)
+        os.makedirs(self._pod, exist_ok=True)
+        groups = [None] if by is None else stats.index.get_level_values(0).unique()
+        for group in groups:
+            multi_plot = Figure(figsize=(14, 16), dpi=300)
+            FigureCanvasAgg(multi_plot)
+            for n, sub_name in enumerate(HOURLY_PLOT_ORDER):
+                sub_plot = multi_plot.add_subplot(len(HOURLY_PLOT_ORDER), 1, n + 1, xlim=[-.5, 23.5],
+                                                  ylim=self._pcs[sub_name]['ylim'])
+                boxes = box_stats(stats, sub_name, group)
+                sub_plot.bxp(boxes, positions=[box['label'] for box in boxes], showmeans=True, showfliers=False)
+
+                sub_plot.tick_params(axis='both', length=10, which='major', direction='in', labelsize=14)
+                sub_plot.xaxis.set_major_locator(ticker.FixedLocator(range(24)))
+                sub_plot.xaxis.set_major_formatter(ticker.FormatStrFormatter('%d'))
+                sub_plot.set_xlabel('Hour', fontsize=18)
+
+                sub_plot.set_ylabel(self._pcs[sub_name]['label'], fontsize=18)
+                sub_plot.yaxis.set_major_locator(ticker.FixedLocator(self._pcs[sub_name]['y_ticks']))
+            file_name = 'hourly_box_ADV.png' if group is None else 'hourly_box_{}_{:g}_ADV.png'.format(by, group)
+            multi_plot.savefig(os.path.join(self._pod, file_name))
 
     def plot_summary(self):
         fig_size = (30, 20)
@@ -89,48 +180,28 @@ class TimeSeriesPlotter(BaseModule):
 
         # multi_plot.tight_layout()
         os.makedirs(self._pod, exist_ok=True)
-        plt.savefig(self._pod + '\\all_ADV.png')
+        plt.savefig(os.path.join(self._pod, 'all_ADV.png'))
         plt.close(multi_plot)
 
     def plot_daily_ts(self):
+        # days are spread over processes, each draws its figure once and reuses it for all its days
         data_range = pd.date_range(self.data.index[0].date(), self.data.index[-1].date() + datetime.timedelta(days=1))
-        daily_data = []
+        os.makedirs(self._pod, exist_ok=True)
+        day_tasks = []
         for n in range(len(data_range) - 1):
-            daily_data.append(self.data[data_range[n]:data_range[n + 1]])
-        for data in daily_data:
-            print(data.describe())
-            try:
-                self._plot_daily_ts(data)
-            except Exception as e:
-                print('err {}'.format(e))
+            data = self.data[data_range[n]:data_range[n + 1]]  # with the midnight closing the day
+            if not data.empty:
+                day_tasks.append((data, os.path.join(self._pod, str(data.index[0].date()) + 'ADV.png')))
+        n_processes = min(self._n_processes, len(day_tasks))
+        if n_processes > 1:
+            with Pool(n_processes, *chain_initializers(self._logger.pool_initializer,
+                                                       (_init_daily_renderer, (self._pcs,)))) as p:
+                rendered = p.starmap(_render_day, day_tasks, chunksize=max(len(day_tasks) // (n_processes * 4), 1))
+        else:
+            _init_daily_renderer(self._pcs)
+            rendered = [_render_day(*day_task) for day_task in day_tasks]
+        self._logger.log('[ {} ] of [ {} ] days plotted.'.format(sum(rendered), len(data_range) - 1))
 
     @staticmethod
     def _get_pos(sub: str, order: list):
         return int("%s1%s" % (len(order), order.index(sub) + 1))  # e.g.312 means 2nd row of 3 in single column
-
-    def _plot_daily_ts(self, data):
-        fig_size = (14, 20)
-        multi_plot = plt.figure(figsize=fig_size, dpi=300)
-        plot_order = ['wind_speed', 'wind_dir', 'T', 'rh_air', 'H']
-        for sub_name in plot_order:
-            sub_plot = multi_plot.add_subplot(self._get_pos(sub_name, plot_order),
-                                              xlim=[data.index[0].date(), data.index[-1].date()],
-                                              ylim=self._pcs[sub_name]['ylim'])
-            plt.plot(data[sub_name], self._pcs[sub_name]['style'],
-                     **self._pcs[sub_name]['params'])
-
-            sub_plot.tick_params(axis='both', length=10, which='major', direction='in', labelsize=14)
-            sub_plot.tick_params(axis='both', length=5, which='minor', direction='in', labelsize=14)
-
-            sub_plot.xaxis.set_major_formatter(dates.DateFormatter('%m/%d'))
-            sub_plot.xaxis.set_major_locator(dates.DayLocator())
-            sub_plot.xaxis.set_minor_locator(dates.HourLocator())
-            sub_plot.set_xlabel('Date', fontsize=18)
-
-            sub_plot.set_ylabel(self._pcs[sub_name]['label'], fontsize=18)
-            sub_plot.yaxis.set_major_locator(plt.FixedLocator(self._pcs[sub_name]['y_ticks']))
-
-        # multi_plot.tight_layout()
-        os.makedirs(self._pod, exist_ok=True)
-        plt.savefig(self._pod + '\\' + str(data.index[0].date()) + 'ADV.png')
-        plt.close(multi_plot)
@@ -1,11 +1,16 @@
 import sys
 from configparser import ConfigParser
+from functools import partial
 
 from core.rawcvt import SonicRawConverter, AmmoniaRawConverter
 from util.logger import logger
+from util.metrics import metrics
 from core.plot import TimeSeriesPlotter
 from core.cftpp import FpGrdGeneratorClassic
+from core.fp import FpGrdGeneratorNative
+from core.fplut import FpGrdGeneratorLUT
 from core.epproxy import EPProxy
+from core.pipeline import Pipeline
 
 
 class Project:
@@ -14,6 +19,16 @@ class Project:
         self._set = False
         self.logger = logger
 
+    @classmethod
+    def from_config(cls, config: ConfigParser):
+        """
+        A project set from a config already read, e.g. to rebuild one in another process
+        """
+        project = cls()
+        project._config = config
+        project._set = True
+        return project
+
     def init(self, config_path='configs.ini'):
         self._config = ConfigParser()
         while True:
@@ -32,20 +47,32 @@ class Project:
     def set_log_path(self, log_path: str):
         self.logger.set_log_path(log_path)
 
-    def prepare_sonic_data(self):
+    def set_span_path(self, span_path: str, *, trace_memory=False):
+        self.logger.set_span_path(span_path, trace_memory=trace_memory)
+
+    def profile(self, names, profile_dir: str, *, profiler='cprofile'):
+        self.logger.profile(names, profile_dir, profiler=profiler)
+
+    def set_metrics_path(self, snapshot_path: str, *, interval: float = 5.):
+        metrics.set_snapshot_path(snapshot_path)
+        metrics.interval = interval
+
+    def prepare_sonic_data(self, confirm=True):
         if not self._set:
             print('Project not initialized, CHECK script!')
             sys.exit(1)
         srp = SonicRawConverter(config=self._config, logger=logger)
-        srp.load_raw_data()
-        srp.convert_sonic_data()
+        srp.confirm_paths = confirm
+        if srp.streaming:
+            srp.stream_sonic_data()
+        else:
+            srp.convert_sonic_data()
 
     def prepare_ammonia_data(self):
         if not self._set:
             print('Project not initialized, CHECK script!')
             sys.exit(1)
         arp = AmmoniaRawConverter(config=self._config, logger=logger)
-        arp.load_raw_data()
         arp.prepare_ammonia_data()
 
     def generate_turb_stats(self):
@@ -63,7 +90,11 @@ class Project:
             fp_init = FpGrdGeneratorClassic(config=self._config, logger=logger)
             fp_init.initialize_and_run()
         elif method == 'new':
-            pass  # TODO
+            fp_init = FpGrdGeneratorNative(config=self._config, logger=logger)
+            fp_init.initialize_and_run()
+        elif method == 'lut':
+            fp_init = FpGrdGeneratorLUT(config=self._config, logger=logger)
+            fp_init.initialize_and_run()
         else:
             raise ValueError('Invalid method type')
 
@@ -75,3 +106,41 @@ class Project:
         ts_plotter.plot_summary()
         # ts_plotter.plot_daily_ts()
         # ts_plotter.plot_hourly_box()
+
+    def run_pipeline(self, targets=None, *, method='classic', force=False):
+        """
+        Runs the stages up to targets (all by default), stages with unchanged inputs since their last
+        completion are skipped, footprints and plots both only need the turbulence statistics and run at once;
+        stages in processes have no console input, the raw file list is logged but not confirmed
+        """
+        if not self._set:
+            print('Project not initialized, CHECK script!')
+            sys.exit(1)
+        conf = self._config
+        pipeline = Pipeline(conf, conf.get('Project', 'Pipeline_Checkpoint_Path', fallback='pipeline_checkpoints.json'),
+                            logger=logger)
+        # stages forking pools of their own overlap in processes rather than threads
+        pipeline.add('sonic_data', partial(_run_project_step, conf, 'prepare_sonic_data', False),
+                     input_paths=[conf.get('Sonic', 'Raw_Data_Directory', fallback='')],
+                     output_paths=[conf.get('Sonic', 'Converted_Data_Output_Directory', fallback='')],
+                     config_sections=['Project', 'Sonic'], process=True)
+        pipeline.add('turb_stats', self.generate_turb_stats, deps=['sonic_data'],
+                     input_paths=[conf.get('Sonic', 'Converted_Data_Output_Directory', fallback=''),
+                                  conf.get('Eddy_Pro', 'Eddy_Pro_Configuration_Path', fallback='')],
+                     output_paths=[conf.get('Footprint', 'Eddy_Pro_Results_Directory', fallback='')],
+                     config_sections=['Eddy_Pro'])
+        pipeline.add('fp_grds', partial(_run_project_step, conf, 'generate_fp_grds', method), deps=['turb_stats'],
+                     input_paths=[conf.get('Footprint', 'Eddy_Pro_Results_Directory', fallback='')],
+                     output_paths=[conf.get('Footprint', 'Footprint_Data_Output_Directory', fallback='')],
+                     config_sections=['Footprint'], params=[method], process=True)
+        pipeline.add('timeseries_plots', partial(_run_project_step, conf, 'plot_timeseries'), deps=['turb_stats'],
+                     input_paths=[conf.get('TimeSeries_Plot', 'Plot_Data_Directory', fallback=''),
+                                  conf.get('TimeSeries_Plot', 'Plot_Configurations_Path', fallback='')],
+                     output_paths=[conf.get('TimeSeries_Plot', 'Plots_Output_Directory', fallback='')],
+                     config_sections=['TimeSeries_Plot'], process=True)
+        return pipeline.run(targets, force=force)
+
+
+def _run_project_step(config: ConfigParser, step: str, *args):
+    # a pipeline stage in a process of its own, the project is rebuilt there from its config
+    getattr(Project.from_config(config), step)(*args)
@@ -1,15 +1,17 @@
 import json
 import os
 import sys
-from itertools import islice
 from multiprocessing import Pool
 
 import pandas as pd
 
 from core.base import BaseModule
+from core.cache import RawDataCache
 from core.file import get_paths
 from util.logger import logger
-from util.pgbar import ProgressBar
+from util.metrics import chain_initializers, metrics
+
+RAW_STAGE = 'raw_data'  # rows and bytes of the raw files read
 
 
 class RawConverter(BaseModule):
@@ -25,6 +27,9 @@ class RawConverter(BaseModule):
         self._raw_fmt_code = None
         self._raw_init = None
         self._raw_ext = None
+        self._raw_cache_dir = None
+        self._raw_columns = None
+        self.confirm_paths = True  # waits for Enter after listing the raw files, to check their sequence
 
         self._parse_config()
 
@@ -38,9 +43,26 @@ class RawConverter(BaseModule):
         self.data_periods = pd.date_range(prj_conf['Data_Periods_Start'],
                                           prj_conf['Data_Periods_End'],
                                           freq=prj_conf['Data_Averaging_Interval'])
+        self._raw_cache_dir = prj_conf.get('Raw_Cache_Directory', fallback='')  # no caching if empty
+
+    def _parse_raw_config(self, raw_conf):
+        self._raw_dir = raw_conf['Raw_Data_Directory']
+        self._cvt_dir = raw_conf['Converted_Data_Output_Directory']
+        self._raw_fmt_code = raw_conf['Raw_Data_Format_Code']
+        self._raw_init = raw_conf['Raw_Data_Initial']
+        self._raw_ext = raw_conf['Raw_Data_Extension']
+        raw_columns = [column.strip() for column in raw_conf.get('Raw_Data_Columns', fallback='').split(',')]
+        self._raw_columns = [column for column in raw_columns if column] or None  # cached loads only
 
     @logger.log_process('Loading Raw Data', timed=False)
     def load_raw_data(self):
+        raw_fmt = self._load_raw_format()
+        raw_paths = self._get_raw_paths(raw_dir=self._raw_dir, file_init=self._raw_init, file_ext=self._raw_ext)
+        raw_data_async = self._get_raw_data(raw_paths, raw_fmt, self._make_raw_cache(raw_fmt))
+        self._logger.log('[ {} ] raw files read.'.format(len(raw_data_async)))
+        self.raw_data = self._merge_raw_data(raw_data_async)
+
+    def _load_raw_format(self):
         try:
             with open('formats.json') as fmt:
                 raw_fmt = json.load(fmt)[self._raw_fmt_code]
@@ -48,18 +70,19 @@ class RawConverter(BaseModule):
         except Exception as e:
             print(e)
             sys.exit(1)
+        return raw_fmt
 
-        raw_paths = self._get_raw_paths(raw_dir=self._raw_dir, file_init=self._raw_init, file_ext=self._raw_ext)
-        raw_data_async = self._get_raw_data(raw_paths, raw_fmt)
-        print(len(raw_data_async))
-        self.raw_data = self._merge_raw_data(raw_data_async)
+    def _make_raw_cache(self, raw_format: dict):
+        if not self._raw_cache_dir:
+            return None
+        return RawDataCache(os.path.join(self._raw_cache_dir, self._raw_fmt_code), raw_format, self._raw_columns)
 
     @logger.log_action('Getting raw data files', timed=False)
     def _get_raw_paths(self, *, raw_dir: str, file_init: str, file_ext: str):
         logger.log("Listing files in folder: [{}]".format(raw_dir))
         logger.log("[INIT]:'{}'\t".format(file_init) + "[EXT]:'{}'".format(file_ext))
 
-        raw_paths = get_paths(target_dir=raw_dir, file_init=file_init, file_ext=file_ext)
+        raw_paths = get_paths(target_dir=raw_dir, file_init=file_init, file_ext=file_ext)  # in time order
 
         for raw_path in raw_paths[:3]:  # print heads
             logger.log(raw_path)
@@ -68,16 +91,17 @@ class RawConverter(BaseModule):
             logger.log(raw_path)
 
         logger.log('[ {} ] files found.'.format(len(raw_paths)))
-        logger.log('Check sequence of raw data files, press Enter to continue...')
-        input()
+        if self.confirm_paths:
+            logger.log('Check sequence of raw data files, press Enter to continue...')
+            input()
         return raw_paths
 
     @logger.log_action('Getting Raw data')
-    def _get_raw_data(self, raw_paths: list, raw_format: dict):
-        with Pool(self._io_threads) as p:
+    def _get_raw_data(self, raw_paths: list, raw_format: dict, raw_cache: RawDataCache = None):
+        with self._raw_stage(raw_paths, self._io_threads), \
+                Pool(self._io_threads, *self._pool_initializer()) as p:
             self._logger.log("Reading with {} processes".format(self._io_threads))
-            pgb = ProgressBar(target=len(raw_paths))
-            raw_data_async = [p.apply_async(self._get_raw_data_sub, (raw_path, raw_format), callback=pgb.update)
+            raw_data_async = [p.apply_async(self._get_raw_data_sub, (raw_path, raw_format, raw_cache))
                               for raw_path in raw_paths]
             p.close()
             p.join()
@@ -85,9 +109,25 @@ class RawConverter(BaseModule):
             return raw_data_async
 
     @staticmethod
-    def _get_raw_data_sub(raw_path, raw_format):
-        raw_datum = pd.read_csv(raw_path, **raw_format)
-        raw_datum.set_index(raw_datum.columns[0], inplace=True)
+    def _raw_stage(raw_paths: list, n_workers: int):
+        return metrics.stage(RAW_STAGE, n_workers, unit='rows',
+                             target_bytes=sum(os.path.getsize(raw_path) for raw_path in raw_paths))
+
+    def _pool_initializer(self):
+        return chain_initializers(self._logger.pool_initializer, metrics.pool_initializer(RAW_STAGE))
+
+    @staticmethod
+    def _get_raw_data_sub(raw_path, raw_format, raw_cache: RawDataCache = None):
+        try:
+            if raw_cache is not None:
+                raw_datum = raw_cache.read(raw_path)
+            else:
+                raw_datum = pd.read_csv(raw_path, **raw_format)
+                raw_datum.set_index(raw_datum.columns[0], inplace=True)
+        except Exception as e:  # also from pool workers, through the queue of the logger
+            logger.log('Failed to read [{}]: {!r}'.format(raw_path, e))
+            raise
+        metrics.meter(RAW_STAGE).add(len(raw_datum), os.path.getsize(raw_path))
         return raw_datum
 
     def _merge_raw_data(self, raw_data_async):
@@ -105,66 +145,123 @@ class SonicRawConverter(RawConverter):
         super()._parse_config()
 
         srp_conf = self._config['Sonic']
-        self._raw_dir = srp_conf['Raw_Data_Directory']
-        self._cvt_dir = srp_conf['Converted_Data_Output_Directory']
-        self._raw_fmt_code = srp_conf['Raw_Data_Format_Code']
-        self._raw_init = srp_conf['Raw_Data_Initial']
-        self._raw_ext = srp_conf['Raw_Data_Extension']
+        self._parse_raw_config(srp_conf)
+        self.streaming = srp_conf.getboolean('Streaming_Conversion', fallback=False)
 
     @logger.log_process('Splitting data for EP input')
     def convert_sonic_data(self):
-        data_and_period_fractions = self._make_fracs(self.raw_data, self.data_periods)
-        self._split_fracs(data_and_period_fractions)
-
-    @logger.log_action('Splitting data fractions')
-    def _split_fracs(self, data_and_period_fracs):
-        split_pool = Pool(self._io_threads)
-        pgb = ProgressBar(target=len(data_and_period_fracs))
-        split_path = self._cvt_dir
-        os.makedirs(split_path, exist_ok=True)
-        [split_pool.apply_async(self._split_fracs_sub, (*data_and_range_frac, split_path), callback=pgb.update) for
-         data_and_range_frac in data_and_period_fracs]
-        split_pool.close()
-        split_pool.join()
-
-    @logger.log_action('Making moduless fractions')
-    def _make_fracs(self, data: pd.DataFrame, data_range):
-        # the inner_action return a generator which needs to be converted into a list
-        def inner_action():
-            fraction_size, extra = divmod(len(data_range), self._io_threads * 8)
-            if extra:
-                fraction_size += 1
-            data_range_iter = iter(data_range)
-            while 1:
-                fraction = tuple(islice(data_range_iter, fraction_size))
-                if not fraction:
-                    return
-                start_time = fraction[0]
-                end_time = fraction[-1] + data_range.freq
-                data_range_fraction = pd.date_range(fraction[0], fraction[-1], freq=data_range.freq)
-                try:
-                    yield (data[start_time:end_time], data_range_fraction)
-                except Exception as e:
-                    print(e, start_time)
-
-        return list(inner_action())
+        # every worker reads and splits its own contiguous range of raw files, only the rows of the periods
+        # crossing range boundaries are sent back to be written here, raw data never crosses processes in bulk
+        raw_fmt = self._load_raw_format()
+        raw_paths = self._get_raw_paths(raw_dir=self._raw_dir, file_init=self._raw_init, file_ext=self._raw_ext)
+        os.makedirs(self._cvt_dir, exist_ok=True)
+        range_results = self._split_ranges(raw_paths, raw_fmt, self._make_raw_cache(raw_fmt))
+        self._merge_range_boundaries(range_results)
+
+    @logger.log_action('Splitting raw file ranges')
+    def _split_ranges(self, raw_paths: list, raw_format: dict, raw_cache: RawDataCache = None):
+        n_ranges = min(len(raw_paths), self._io_threads * 4)  # a few ranges per process to balance the load
+        range_size, extra = divmod(len(raw_paths), n_ranges)
+        bounds = [n * range_size + min(n, extra) for n in range(n_ranges + 1)]
+        with self._raw_stage(raw_paths, self._io_threads), \
+                Pool(self._io_threads, *self._pool_initializer()) as p:
+            self._logger.log("Splitting {} ranges with {} processes".format(n_ranges, self._io_threads))
+            ranges_async = [p.apply_async(self._split_range_sub,
+                                          (raw_paths[bounds[n]:bounds[n + 1]], raw_format, raw_cache,
+                                           self.data_periods, self._cvt_dir))
+                            for n in range(n_ranges)]
+            p.close()
+            p.join()
+            return [range_async.get() for range_async in ranges_async]
+
+    @logger.log_action('Writing periods across range boundaries')
+    def _merge_range_boundaries(self, range_results: list):
+        carry = None
+        next_period = 0
+        for first_period, head, last_period, tail in range_results:  # in time order
+            carry = _concat_frames([carry, head])
+            if first_period is None:  # no data in this range
+                continue
+            if carry is not None:
+                self._emit_periods(carry, self.data_periods, next_period, self._cvt_dir, until=first_period)
+            carry, next_period = tail, last_period
+        if carry is not None:
+            self._emit_periods(carry, self.data_periods, next_period, self._cvt_dir, until=len(self.data_periods))
+
+    @staticmethod
+    def _split_range_sub(raw_paths: list, raw_format: dict, raw_cache: RawDataCache, data_periods: pd.DatetimeIndex,
+                         split_path: str):
+        # periods starting before the first row of the range may hold rows of the previous range, rows they
+        # need from this range are returned as head, rows of periods still open at the end as tail
+        heads = []
+        head_end = first_period = carry = None
+        next_period = 0
+        for raw_path in raw_paths:
+            raw_datum = SonicRawConverter._get_raw_data_sub(raw_path, raw_format, raw_cache)
+            if raw_datum.empty:
+                continue
+            if not raw_datum.index.is_monotonic_increasing:
+                raw_datum.sort_index(inplace=True, kind='stable')
+            if first_period is None:
+                first_period = next_period = data_periods.searchsorted(raw_datum.index[0], side='left')
+                head_end = data_periods[first_period - 1] + data_periods.freq if first_period else None
+            if head_end is not None and raw_datum.index[0] <= head_end:
+                heads.append(raw_datum.iloc[:raw_datum.index.searchsorted(head_end, side='right')])
+            if carry is not None:
+                raw_datum = pd.concat([carry, raw_datum])
+            carry, next_period = SonicRawConverter._emit_periods(raw_datum, data_periods, next_period, split_path)
+        return first_period, _concat_frames(heads), next_period, carry
+
+    @logger.log_process('Streaming Raw Data into EP input')
+    def stream_sonic_data(self):
+        # raw files are read one by one in time order, only the periods not closed yet are carried over,
+        # so memory stays around one raw file plus one period for any campaign length
+        raw_fmt = self._load_raw_format()
+        raw_cache = self._make_raw_cache(raw_fmt)
+        raw_paths = self._get_raw_paths(raw_dir=self._raw_dir, file_init=self._raw_init, file_ext=self._raw_ext)
+        os.makedirs(self._cvt_dir, exist_ok=True)
+        carry = None
+        next_period = 0  # position in self.data_periods of the first period not written yet
+        with self._raw_stage(raw_paths, 1):
+            for raw_path in raw_paths:
+                raw_datum = self._get_raw_data_sub(raw_path, raw_fmt, raw_cache)
+                if carry is not None:
+                    raw_datum = pd.concat([carry, raw_datum])
+                if raw_datum.empty:
+                    continue
+                if not raw_datum.index.is_monotonic_increasing:
+                    raw_datum.sort_index(inplace=True, kind='stable')
+                carry, next_period = self._emit_periods(raw_datum, self.data_periods, next_period, self._cvt_dir)
+        if carry is not None:
+            self._emit_periods(carry, self.data_periods, next_period, self._cvt_dir, until=len(self.data_periods))
+
+    @staticmethod
+    def _emit_periods(data: pd.DataFrame, data_periods: pd.DatetimeIndex, next_period: int, split_path: str, *,
+                      until: int = None):
+        # writes periods from next_period up to until, by default up to the last period closed by data, i.e.
+        # data beyond its end has been read; returns rows of the periods left open and the next period to write
+        freq = data_periods.freq
+        if until is None:
+            until = next_period + data_periods[next_period:].searchsorted(data.index[-1] - freq, side='left')
+        for n in range(next_period, until):
+            start_time = data_periods[n]
+            start = data.index.searchsorted(start_time, side='left')
+            end = data.index.searchsorted(start_time + freq, side='right')  # end included, same as data[start:end]
+            data.iloc[start:end].to_csv(SonicRawConverter._period_file_path(split_path, start_time), index=False)
+        if until >= len(data_periods):
+            return None, until
+        return data.iloc[data.index.searchsorted(data_periods[until], side='left'):], until
 
     @staticmethod
-    def _split_fracs_sub(data_fraction: pd.DataFrame, data_range_fraction, split_path: str):
-        i = 0
-        while i < len(data_range_fraction):
-            start_time = data_range_fraction[i]
-            end_time = start_time + data_range_fraction.freq
-            try:
-                data_part = data_fraction[start_time:end_time]
-                # convert to "yyyy-mm-dd_HH-MM" for EddyPro input
-                part_name = str(start_time.date()) + '_' + str(start_time.time()).replace(':', '-')[:-3]
-                file_path = split_path + '\\' + part_name + '.csv'
-                data_part.to_csv(file_path, index=False)
-            except Exception as e:
-                print("%s : %s" % (str(e), start_time))
-            i += 1
-        return True
+    def _period_file_path(split_path: str, start_time):
+        # convert to "yyyy-mm-dd_HH-MM" for EddyPro input
+        part_name = str(start_time.date()) + '_' + str(start_time.time()).replace(':', '-')[:-3]
+        return os.path.join(split_path, part_name + '.csv')
+
+
+def _concat_frames(frames: list):
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    return pd.concat(frames) if frames else None
 
 
 class AmmoniaRawConverter(RawConverter):
@@ -172,16 +269,69 @@ class AmmoniaRawConverter(RawConverter):
         super()._parse_config()
 
         arp_conf = self._config['Ammonia']
-        self._raw_dir = arp_conf['Raw_Data_Directory']
-        self._cvt_dir = arp_conf['Converted_Data_Output_Directory']
-        self._raw_fmt_code = arp_conf['Raw_Data_Format_Code']
-        self._raw_init = arp_conf['Raw_Data_Initial']
-        self._raw_ext = arp_conf['Raw_Data_Extension']
+        self._parse_raw_config(arp_conf)
+        self._tz_shift = pd.Timedelta(hours=arp_conf.getfloat('Time_Zone_Shift', fallback=8))  # hours added
+        self._parallel = arp_conf.getboolean('Parallel_Averaging', fallback=False)
 
+    @logger.log_process('Averaging Ammonia Data')
     def prepare_ammonia_data(self):
-        print(">>> Averaging data")
-        self.raw_data = self.raw_data.tshift(8, freq='H')  # Time Zone Change
-        data_prep = self.raw_data.resample(self.data_periods.freq).mean()
+        # raw files are reduced to per period sums and counts one at a time, periods cut by file or range
+        # boundaries are merged by adding their partial sums, memory follows the number of periods only
+        raw_fmt = self._load_raw_format()
+        raw_paths = self._get_raw_paths(raw_dir=self._raw_dir, file_init=self._raw_init, file_ext=self._raw_ext)
+        raw_cache = self._make_raw_cache(raw_fmt)
+        if self._parallel:
+            partials = self._average_ranges(raw_paths, raw_fmt, raw_cache)
+        else:
+            with self._raw_stage(raw_paths, 1):
+                partials = [self._average_file_sub(raw_path, raw_fmt, raw_cache, self.data_periods.freq,
+                                                   self._tz_shift)
+                            for raw_path in raw_paths]
+        data_prep = self._merge_partial_averages(partials, self.data_periods.freq)
         os.makedirs(self._cvt_dir, exist_ok=True)
-        data_prep.to_csv(self._cvt_dir + r'\data_averaged.csv')
-        print("### Averaging data completed.")
+        data_prep.to_csv(os.path.join(self._cvt_dir, 'data_averaged.csv'))
+
+    @logger.log_action('Averaging raw file ranges')
+    def _average_ranges(self, raw_paths: list, raw_format: dict, raw_cache: RawDataCache = None):
+        n_ranges = min(len(raw_paths), self._io_threads * 4)  # a few ranges per process to balance the load
+        range_size, extra = divmod(len(raw_paths), n_ranges)
+        bounds = [n * range_size + min(n, extra) for n in range(n_ranges + 1)]
+        with self._raw_stage(raw_paths, self._io_threads), \
+                Pool(self._io_threads, *self._pool_initializer()) as p:
+            self._logger.log("Averaging {} ranges with {} processes".format(n_ranges, self._io_threads))
+            ranges_async = [p.apply_async(self._average_range_sub,
+                                          (raw_paths[bounds[n]:bounds[n + 1]], raw_format, raw_cache,
+                                           self.data_periods.freq, self._tz_shift))
+                            for n in range(n_ranges)]
+            p.close()
+            p.join()
+            return [range_async.get() for range_async in ranges_async]
+
+    @staticmethod
+    def _average_range_sub(raw_paths: list, raw_format: dict, raw_cache: RawDataCache, freq, tz_shift):
+        partials = [AmmoniaRawConverter._average_file_sub(raw_path, raw_format, raw_cache, freq, tz_shift)
+                    for raw_path in raw_paths]
+        return _add_partials([sums for sums, _ in partials]), _add_partials([counts for _, counts in partials])
+
+    @staticmethod
+    def _average_file_sub(raw_path: str, raw_format: dict, raw_cache: RawDataCache, freq, tz_shift):
+        raw_datum = AmmoniaRawConverter._get_raw_data_sub(raw_path, raw_format, raw_cache).select_dtypes('number')
+        # time zone change as an index offset, flooring to freq gives the bins of resample(freq)
+        periods = (raw_datum.index + tz_shift).floor(freq)
+        grouped = raw_datum.groupby(periods)
+        return grouped.sum(), grouped.count()  # count skips NaN the same way mean does
+
+    @staticmethod
+    def _merge_partial_averages(partials: list, freq) -> pd.DataFrame:
+        sums = _add_partials([sums for sums, _ in partials])
+        counts = _add_partials([counts for _, counts in partials])
+        if sums is None:
+            return pd.DataFrame()
+        data_prep = sums / counts.where(counts > 0)  # periods without values are NaN
+        return data_prep.reindex(pd.date_range(data_prep.index[0], data_prep.index[-1], freq=freq))
+
+
+def _add_partials(frames: list):
+    # partial sums or counts of the same period, e.g. a period split over two files, add up
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    return pd.concat(frames).groupby(level=0).sum() if frames else None
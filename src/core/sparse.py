@@ -0,0 +1,128 @@
+"""
+Truncated footprints in compressed sparse rows: per grid only the nodes holding the top fraction of the
+footprint, largest first, and the mass left out as residual
+"""
+
+import numpy as np
+import pandas as pd
+
+from core.base import BaseData
+from core.grd import GrdData, valid_nodes, write_grd
+
+
+def truncate_grids(grids: np.ndarray, fraction=.9):
+    """
+    Keeps the largest nodes of each grid of a (n, ny, nx) stack until their sum reaches fraction of the grid
+    total, returns (indptr, indices, values, residual) with indices into the flattened grid
+    """
+    grids = np.asarray(grids, dtype=np.float64).reshape(len(grids), -1)
+    grids = np.where(valid_nodes(grids), grids, 0.)
+    order = np.argsort(-grids, axis=1, kind='stable')
+    descend = np.take_along_axis(grids, order, axis=1)
+    cum_sum = np.cumsum(descend, axis=1)
+    total = cum_sum[:, -1:]
+    keep = (cum_sum - descend < fraction * total) & (descend > 0)  # nodes needed to reach fraction of total
+    residual = total[:, 0] - np.where(keep, descend, 0.).sum(axis=1)
+    return np.r_[0, np.cumsum(keep.sum(axis=1))].astype(np.int64), order[keep], descend[keep], residual
+
+
+class SparseFootprints(BaseData):
+    def __init__(self, indptr, indices, values, residual, *, shape, x_range, y_range, time_index=None):
+        super().__init__()
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.residual = np.asarray(residual, dtype=np.float64)
+        self.shape = tuple(shape)  # (ny, nx) of the dense grids
+        self.x_range, self.y_range = tuple(x_range), tuple(y_range)
+        self.time_index = pd.DatetimeIndex([] if time_index is None else time_index)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @classmethod
+    def from_grids(cls, grids: np.ndarray, *, fraction=.9, x_range, y_range, time_index=None):
+        grids = np.asarray(grids)
+        return cls(*truncate_grids(grids, fraction), shape=grids.shape[1:], x_range=x_range, y_range=y_range,
+                   time_index=time_index)
+
+    @classmethod
+    def from_grd_files(cls, grd_paths: list, *, fraction=.9, time_index=None, batch_size=256):
+        parts = []
+        grd = None
+        for n in range(0, len(grd_paths), batch_size):
+            grds = [GrdData(grd_path, cached=False) for grd_path in grd_paths[n: n + batch_size]]
+            parts.append(truncate_grids(np.stack([grd.data for grd in grds]), fraction))
+            grd = grds[0]
+        if grd is None:
+            raise ValueError('No grid files to convert')
+        return cls(*cls._join_parts(parts), shape=grd.data.shape, x_range=grd.header.x_range,
+                   y_range=grd.header.y_range, time_index=time_index)
+
+    @classmethod
+    def from_stack(cls, stack, *, fraction=.9, batch_size=256):
+        data = stack.data
+        parts = [truncate_grids(data[n: n + batch_size], fraction) for n in range(0, len(stack), batch_size)]
+        return cls(*cls._join_parts(parts), shape=stack.shape[1:], x_range=stack.meta['x_range'],
+                   y_range=stack.meta['y_range'], time_index=stack.time_index)
+
+    @staticmethod
+    def _join_parts(parts: list):
+        offsets = np.cumsum([0] + [part[0][-1] for part in parts[:-1]])
+        indptr = np.concatenate([[0]] + [part[0][1:] + offset for part, offset in zip(parts, offsets)])
+        return (indptr, np.concatenate([part[1] for part in parts]), np.concatenate([part[2] for part in parts]),
+                np.concatenate([part[3] for part in parts]))
+
+    def save(self, path: str):
+        np.savez(path, indptr=self.indptr, indices=self.indices, values=self.values, residual=self.residual,
+                 shape=self.shape, x_range=self.x_range, y_range=self.y_range,
+                 time_index=self.time_index.values.astype('datetime64[ns]'))
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as npz:
+            return cls(npz['indptr'], npz['indices'], npz['values'], npz['residual'], shape=npz['shape'],
+                       x_range=npz['x_range'], y_range=npz['y_range'], time_index=npz['time_index'])
+
+    def to_dense(self, position: int) -> np.ndarray:
+        start, end = self.indptr[position], self.indptr[position + 1]
+        grid = np.zeros(self.shape[0] * self.shape[1], dtype=np.float64)
+        grid[self.indices[start:end]] = self.values[start:end]
+        return grid.reshape(self.shape)
+
+    def write_grd(self, position: int, grd_path: str):
+        write_grd(grd_path, self.to_dense(position), self.x_range, self.y_range)
+
+    def _rows(self, positions) -> np.ndarray:
+        # positions of the stored nodes of the given footprints
+        starts, ends = self.indptr[positions], self.indptr[np.asarray(positions) + 1]
+        lengths = ends - starts
+        return np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+
+    def average(self, positions):
+        """
+        Mean of the given footprints without going dense, returns (indices, values, residual) of the nodes
+        present in any of them
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        rows = self._rows(positions)
+        indices, inverse = np.unique(self.indices[rows], return_inverse=True)
+        values = np.bincount(inverse, weights=self.values[rows], minlength=len(indices)) / max(len(positions), 1)
+        return indices, values, self.residual[positions].mean() if len(positions) else np.nan
+
+    def average_dense(self, positions) -> np.ndarray:
+        """
+        Mean of the given footprints as a grid. Unlike GrdStack.average, which leaves blank nodes out of the mean
+        of each node, nodes blank or truncated in a footprint count as zero there: the sparse rows do not tell them
+        apart. Without footprints every node is NaN, as from GrdStack.average
+        """
+        if not len(positions):
+            return np.full(self.shape, np.nan)
+        indices, values, _ = self.average(positions)
+        grid = np.zeros(self.shape[0] * self.shape[1], dtype=np.float64)
+        grid[indices] = values
+        return grid.reshape(self.shape)
@@ -0,0 +1,127 @@
+"""
+Consolidated footprint store: all grids of a campaign in one memory-mapped (time, ny, nx) array,
+with a datetime index and the grid geometry alongside
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from core.base import BaseData
+from core.file import get_paths
+from core.grd import GrdData, valid_nodes
+
+
+class GrdStack(BaseData):
+    DATA_FILE = 'grids.f4'
+    INDEX_FILE = 'index.npy'
+    META_FILE = 'meta.json'
+    GRD_NAME_FORMAT = '%y%m%d%H%M'  # e.g. '1807010030.grd'
+
+    def __init__(self, stack_dir: str):
+        super().__init__()
+        self.stack_dir = stack_dir
+        self.meta = None
+        self._index = np.array([], dtype='datetime64[ns]')
+
+        self._load_data()
+
+    def _path(self, file_name):
+        return os.path.join(self.stack_dir, file_name)
+
+    def _load_data(self):
+        if not os.path.exists(self._path(self.META_FILE)):
+            return  # empty stack, geometry is set by the first append
+        with open(self._path(self.META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self._index = np.load(self._path(self.INDEX_FILE))
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def shape(self):
+        return len(self), self.meta['ny'], self.meta['nx']
+
+    @property
+    def time_index(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self._index)
+
+    @property
+    def data(self) -> np.ndarray:
+        if not len(self):
+            raise ValueError('Footprint stack {} is empty'.format(self.stack_dir))
+        return np.memmap(self._path(self.DATA_FILE), dtype='f4', mode='r', shape=self.shape)
+
+    def append(self, time_stamps, grids: np.ndarray, *, x_range=None, y_range=None):
+        grids = np.asarray(grids, dtype='f4')
+        time_stamps = pd.DatetimeIndex(time_stamps).values.astype('datetime64[ns]')
+        if len(time_stamps) != len(grids):
+            raise ValueError('{} time stamps for {} grids'.format(len(time_stamps), len(grids)))
+        if not len(grids):
+            return
+        if np.isin(time_stamps, self._index).any() or len(np.unique(time_stamps)) < len(time_stamps):
+            raise ValueError('Duplicate time stamps, every half-hour is stored once')
+        if self.meta is None:
+            if x_range is None or y_range is None:
+                raise ValueError('Grid geometry is required for the first append')
+            os.makedirs(self.stack_dir, exist_ok=True)
+            meta = {'nx': grids.shape[2], 'ny': grids.shape[1],
+                    'x_range': list(map(float, x_range)), 'y_range': list(map(float, y_range))}
+        elif grids.shape[1:] != self.shape[1:]:
+            raise ValueError('Grid size {} differs from the stack {}'.format(grids.shape[1:], self.shape[1:]))
+
+        with open(self._path(self.DATA_FILE), 'ab') as f:
+            f.truncate(len(self) * grids[0].nbytes)  # drop frames of an interrupted append
+            f.write(grids.tobytes())
+        index = np.concatenate([self._index, time_stamps])
+        temp_path = self._path(self.INDEX_FILE + '.tmp')
+        with open(temp_path, 'wb') as f:
+            np.save(f, index)
+        os.replace(temp_path, self._path(self.INDEX_FILE))  # frames count only once indexed
+        self._index = index
+        if self.meta is None:  # last, without meta the stack loads as empty
+            temp_path = self._path(self.META_FILE + '.tmp')
+            with open(temp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(temp_path, self._path(self.META_FILE))
+            self.meta = meta
+
+    def import_grd_dir(self, grd_dir: str, *, batch_size=256):
+        grd_paths = get_paths(target_dir=grd_dir, file_ext='.grd')
+        time_stamps = pd.to_datetime([os.path.splitext(os.path.split(grd_path)[1])[0] for grd_path in grd_paths],
+                                     format=self.GRD_NAME_FORMAT, errors='coerce')
+        new = ~(time_stamps.isna() | time_stamps.isin(self.time_index))  # skip foreign and imported files
+        grd_paths = [grd_path for grd_path, is_new in zip(grd_paths, new) if is_new]
+        time_stamps = time_stamps[new]
+        order = np.argsort(time_stamps.values, kind='stable')
+        for n in range(0, len(order), batch_size):
+            batch = order[n: n + batch_size]
+            grds = [GrdData(grd_paths[i], cached=False) for i in batch]
+            self.append(time_stamps[batch], np.stack([grd.data for grd in grds]),
+                        x_range=grds[0].header.x_range, y_range=grds[0].header.y_range)
+        return len(grd_paths)
+
+    def positions(self, time_stamps) -> np.ndarray:
+        positions = self.time_index.get_indexer(pd.DatetimeIndex(time_stamps))
+        return positions[positions >= 0]
+
+    def group_positions(self, keys) -> dict:
+        # keys holds one group code per frame, e.g. time_index.hour
+        keys = np.asarray(keys)
+        return {key: np.flatnonzero(keys == key) for key in np.unique(keys)}
+
+    def average(self, positions, *, batch_size=256) -> np.ndarray:
+        grid_sum = np.zeros(self.shape[1:], dtype=np.float64)
+        grid_count = np.zeros(self.shape[1:], dtype=np.int64)
+        data = self.data
+        positions = np.sort(positions)  # read the memory map front to back
+        for n in range(0, len(positions), batch_size):
+            grids = np.asarray(data[positions[n: n + batch_size]], dtype=np.float64)
+            valid = valid_nodes(grids)
+            grid_sum += np.where(valid, grids, 0.).sum(axis=0)
+            grid_count += valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return grid_sum / grid_count
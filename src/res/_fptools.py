@@ -1,22 +1,41 @@
-import pandas as pd
+import os
+from multiprocessing import Pool
 
+import numpy as np
 
-def grid_average(grid_groups, output_dir: str):
-    for grid_group in grid_groups:
-        average_grid = pd.DataFrame()
-        i = 0
-        for grid_file in grid_groups[grid_group]:
-            if i == 0:
-                average_grid = pd.read_csv(grid_file, skiprows=list(range(4)), sep='\s+', header=None, index_col=False)
-            else:
-                average_grid += pd.read_csv(grid_file, skiprows=list(range(4)), sep='\s+', header=None,
-                                            index_col=False)
-            i += 1
-        average_grid /= i
-        os.makedirs(output_dir, exist_ok=True)
-        out_path = output_dir + '\\' + grid_group + '.grd'
-        average_grid.to_csv(out_path, sep=' ', header=False, index=False)
-        with open(out_path, 'r+') as f:
-            content = f.read()
-            f.seek(0, 0)
-            f.write('DSAA\n150 150\n0 0.7500001\n0 0.7500001\n0 1.000000\n' + content)
+from core.grd import GrdData, valid_nodes, write_grd
+
+
+def _grid_average_sub(grid_files: list, out_path: str):
+    # one pass over the group, only the running sum/count and the current grid are held in memory
+    header = grid_sum = grid_count = None
+    for grid_file in grid_files:
+        grd = GrdData(grid_file)
+        if header is None:
+            header = grd.header
+            grid_sum = np.zeros((header.ny, header.nx), dtype=np.float64)
+            grid_count = np.zeros((header.ny, header.nx), dtype=np.int64)
+        elif (grd.header.nx, grd.header.ny) != (header.nx, header.ny):
+            raise ValueError('Grid size of {} differs from the group'.format(grid_file))
+        grid = np.asarray(grd.data, dtype=np.float64)
+        valid = valid_nodes(grid)  # skip NaN and blanked nodes
+        np.add(grid_sum, grid, out=grid_sum, where=valid)
+        grid_count += valid
+    if header is None:  # empty group
+        return None
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average_grid = grid_sum / grid_count  # nodes without valid data become NaN and are written blanked
+    write_grd(out_path, average_grid, header.x_range, header.y_range)
+    return out_path
+
+
+def grid_average(grid_groups: dict, output_dir: str, n_processes: int = None):
+    os.makedirs(output_dir, exist_ok=True)
+    with Pool(n_processes) as p:
+        averaged_async = {grid_group: p.apply_async(_grid_average_sub,
+                                                    (grid_groups[grid_group],
+                                                     os.path.join(output_dir, grid_group + '.grd')))
+                          for grid_group in grid_groups}
+        p.close()
+        p.join()
+    return {grid_group: averaged_async[grid_group].get() for grid_group in averaged_async}
@@ -1,33 +1,66 @@
-from math import log, atan, pi
-from scipy.special import gamma
+from collections import namedtuple
+from math import atan, log, pi
+
+import numpy as np
 
 const_kar = 0.4
 
+# phi/psi of a whole met table, see func_stability
+Stability = namedtuple('Stability', ['z_div_L', 'phi_m', 'phi_c', 'psi_m', 'psi_m_0'])
+
+
+def _branched(z_div_L, stable, unstable):
+    # scalars and arrays share the numpy code path, so results are identical element by element;
+    # float_power is used instead of np.power since it matches the builtin ** bit by bit
+    z_div_L = np.asarray(z_div_L, dtype=float)
+    is_stable = z_div_L > 0
+    result = np.empty_like(z_div_L)
+    result[is_stable] = stable(z_div_L[is_stable])
+    result[~is_stable] = unstable(z_div_L[~is_stable])
+    return result if result.ndim else float(result)
+
 
 def func_phi_m(z_div_L):
-    if z_div_L > 0:
-        return 1 + 5 * z_div_L
-    else:
-        return (1 - 16 * z_div_L) ** (-1 / 4)
+    return _branched(z_div_L,
+                     lambda z: 1 + 5 * z,
+                     lambda z: np.float_power(1 - 16 * z, -1 / 4))
 
 
 def func_phi_c(z_div_L):
-    if z_div_L > 0:
-        return 1 + 5 * z_div_L
-    else:
-        return (1 - 16 * z_div_L) ** (-1 / 2)
+    return _branched(z_div_L,
+                     lambda z: 1 + 5 * z,
+                     lambda z: np.float_power(1 - 16 * z, -1 / 2))
 
 
 def func_xi(z_div_L):
-    return (1 - 16 * z_div_L) ** (1 / 4)
+    xi = np.float_power(1 - 16 * np.asarray(z_div_L, dtype=float), 1 / 4)
+    return xi if xi.ndim else float(xi)
 
 
-def func_psi_m(z_div_L):
-    if z_div_L > 0:
-        return -5 * z_div_L
+def _psi_m_unstable(z_div_L):
+    # the SIMD np.log and np.arctan may differ from libm in the last bit, so these go through math
+    xi = func_xi(z_div_L)
+    return np.fromiter((2 * log((1 + x) / 2) + log((1 + x ** 2) / 2) - 2 * atan(x) + pi / 2 for x in xi.tolist()),
+                       dtype=float, count=len(xi))
+
 
-    else:
-        return 2 * log((1 + func_xi(z_div_L)) / 2) + log((1 + func_xi(z_div_L) ** 2) / 2) - 2 * atan(func_xi(z_div_L)) + pi / 2
+def func_psi_m(z_div_L):
+    return _branched(z_div_L,
+                     lambda z: -5 * z,
+                     _psi_m_unstable)
+
+
+def func_stability(L, z_m, z_0):
+    """
+    phi_m, phi_c and psi_m at z_m (and psi_m at z_0) for every Obukhov length of a met table in one call
+    """
+    L = np.asarray(L, dtype=float)
+    z_div_L = z_m / L
+    return Stability(z_div_L,
+                     func_phi_m(z_div_L),
+                     func_phi_c(z_div_L),
+                     func_psi_m(z_div_L),
+                     func_psi_m(z_0 / L))
 
 def kormaanf(u_star, L, z_m, x_range, z_0):
     kar = 0.35
@@ -0,0 +1,22 @@
+import json
+import os
+import tempfile
+from unittest import TestCase, skipIf
+
+from benchmarks.run import run_suite
+
+
+@skipIf(os.name == 'nt', 'stand-in executables are scripts')
+class TestBenchmarks(TestCase):
+    def test_tiny_suite(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            results_path = os.path.join(tmp_dir, 'results.jsonl')
+            cases = ['turb_stats', 'fp_classic', 'stack_average']
+            run_suite('tiny', results_path, case_names=cases, work_dir=tmp_dir, isolated=False)
+            with open(results_path) as results:
+                records = [json.loads(line) for line in results]
+            self.assertEqual([record['case'] for record in records], cases)
+            for record in records:
+                self.assertGreater(record['items'], 0)
+                self.assertGreater(record['items_per_s'], 0)
+                self.assertIn('peak_rss_mb', record)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase, skipIf
+
+import pandas as pd
+
+from benchmarks.fixtures import CFTP01, make_stand_in
+from core.cftpp import FpGrdGeneratorClassic
+
+# the cftp01.exe stand-in, but the model process of the chunk holding 1807010230 quits with an error before its grid
+GRID_WRITE = "    open(time_stamp + '.grd', 'w').close()\n"
+FAILING_MODEL = CFTP01.replace(GRID_WRITE,
+                               "    if time_stamp == '1807010230':\n"
+                               "        raise SystemExit(1)\n" + GRID_WRITE)
+
+
+@skipIf(os.name == 'nt', 'stand-in model is a script')
+class TestClassicWorkQueue(TestCase):
+    def _make_project(self, tmp_dir, fake_model):
+        epr_dir = os.path.join(tmp_dir, 'epr')
+        out_dir = os.path.join(tmp_dir, 'fp')
+        os.makedirs(epr_dir)
+        os.makedirs(out_dir)
+        periods = pd.date_range('2018-07-01 00:30', periods=11, freq='30min')
+        pd.DataFrame({'date': periods.strftime('%Y-%m-%d'),
+                      'time': periods.strftime('%H:%M'),
+                      'wind_dir': 90., 'wind_speed': 2., 'u*': .3, 'L': -50., 'H': 10., 'rho_air': 1.2,
+                      'var(v)': .4}).to_csv(os.path.join(epr_dir, 'eddypro_ADV_essentials_test_adv.csv'),
+                                            index=False)
+        model_path = make_stand_in(os.path.join(tmp_dir, 'cftp01.exe'), fake_model)
+        config = ConfigParser()
+        config.read_dict({'Project': {'CPU_Cores': '2'},
+                          'Footprint': {'Eddy_Pro_Results_Directory': epr_dir,
+                                        'Footprint_Model_Path': model_path,
+                                        'Footprint_Data_Output_Directory': out_dir,
+                                        'LegacyParameters': '3,0.05,1000,1000,5,500,500',
+                                        'Idle_Timeout': '20',
+                                        'Classic_Chunk_Size': '3'}})
+        return config, out_dir, periods
+
+    def test_chunks_and_grids(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config, out_dir, periods = self._make_project(tmp_dir, CFTP01)
+            FpGrdGeneratorClassic(config=config).initialize_and_run()
+
+            grd_files = sorted(name for name in os.listdir(out_dir) if name.endswith('.grd'))
+            self.assertEqual(grd_files, ['{:%y%m%d%H%M}.grd'.format(period) for period in periods])
+            self.assertFalse(os.path.exists(os.path.join(out_dir, 'proc0')))
+
+            generator = FpGrdGeneratorClassic(config=config)
+            generator.initialize_and_run()  # everything committed, nothing left to run
+            self.assertEqual(generator.total, 0)
+
+    def test_failed_chunk(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config, out_dir, periods = self._make_project(tmp_dir, FAILING_MODEL)
+            with self.assertRaises(RuntimeError):
+                FpGrdGeneratorClassic(config=config).initialize_and_run()
+            generator = FpGrdGeneratorClassic(config=config)
+            generator._initialize_fp_model()
+            self.assertEqual(generator.total, 2)  # the failed half-hour and the one after it in its chunk
@@ -0,0 +1,69 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from core.diurnal import box_stats, cached_hourly_stats, hourly_means, hourly_stats
+
+
+class TestHourlyStats(TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(0)
+        time_index = pd.date_range('2018-06-01', periods=24 * 75, freq='h')
+        self.data = pd.DataFrame({'T': rng.normal(25., 5., len(time_index)),
+                                  'wind_dir': rng.uniform(0., 360., len(time_index))}, index=time_index)
+        self.data.iloc[::17, 0] = np.nan
+
+    def test_against_hour_masks(self):
+        stats = hourly_stats(self.data, by='month')
+        for month, hour in [(6, 0), (7, 13), (8, 23)]:
+            values = self.data.loc[(self.data.index.month == month) & (self.data.index.hour == hour), 'T'].dropna()
+            row = stats.loc[(month, hour, 'T')]
+            q1, q3 = values.quantile([.25, .75])
+            inside = values[(values >= q1 - 1.5 * (q3 - q1)) & (values <= q3 + 1.5 * (q3 - q1))]
+            self.assertEqual(row['count'], len(values))
+            self.assertAlmostEqual(row['mean'], values.mean())
+            self.assertAlmostEqual(row['q05'], values.quantile(.05))
+            self.assertAlmostEqual(row['q50'], values.median())
+            self.assertAlmostEqual(row['whislo'], inside.min())
+            self.assertAlmostEqual(row['whishi'], inside.max())
+            self.assertEqual(row['n_outliers'], len(values) - len(inside))
+
+        sectors = hourly_stats(self.data, by='sector')
+        wind_dir = self.data['wind_dir']
+        north = self.data.loc[((wind_dir >= 337.5) | (wind_dir < 22.5)) & (self.data.index.hour == 6), 'T']
+        self.assertEqual(sectors.loc[(0., 6, 'T'), 'count'], north.count())
+        self.assertEqual(len(box_stats(hourly_stats(self.data), 'T')), 24)
+
+    def test_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            stats = cached_hourly_stats(self.data, tmp_dir, by='month')
+            with patch('core.diurnal.hourly_stats') as compute:
+                cached = cached_hourly_stats(self.data, tmp_dir, by='month')
+            compute.assert_not_called()
+            pd.testing.assert_frame_equal(cached, stats, check_index_type=False)
+            self.data.iloc[1, 0] += 1.
+            changed = cached_hourly_stats(self.data, tmp_dir, by='month')
+            self.assertNotEqual(changed.loc[(6, 1, 'T'), 'mean'], stats.loc[(6, 1, 'T'), 'mean'])
+            self.assertEqual(len(os.listdir(tmp_dir)), 2)
+
+    def test_cache_sector_directions(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.data['wind_dir'] = 0.
+            north = cached_hourly_stats(self.data, tmp_dir, ['T'], by='sector')
+            self.data['wind_dir'] = 180.
+            south = cached_hourly_stats(self.data, tmp_dir, ['T'], by='sector')
+            self.assertEqual(list(north.index.unique(level=0)), [0.])
+            self.assertEqual(list(south.index.unique(level=0)), [180.])
+
+    def test_direction_means(self):
+        time_index = pd.date_range('2018-07-01 00:00', periods=4, freq='30min')
+        data = pd.DataFrame({'wind_dir': [350., 10., 80., 100.], 'T': [20., 22., 24., 26.]}, index=time_index)
+        means = hourly_means(data)
+        np.testing.assert_allclose(means['wind_dir'].values % 360 - np.array([0., 90.]), 0., atol=1e-9)
+        self.assertEqual(list(means['T']), [21., 25.])
+        sectors = hourly_stats(means, by='sector')
+        self.assertEqual(sectors.loc[(0., 0, 'T'), 'count'], 1)  # north, not south
@@ -0,0 +1,133 @@
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase
+from unittest.mock import patch
+
+import pandas as pd
+
+from benchmarks.fixtures import EDDYPRO_RP, make_stand_in
+from core.epproxy import EPProxy
+from core.file import get_paths
+
+EDDYPRO_FCC = '''#!{python}
+import os, sys
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'fcc_runs.txt'), 'a') as runs:
+    runs.write(sys.argv[1] + '\\n')
+print('Note: nothing to correct', flush=True)
+sys.stdin.read()
+'''
+EDDYPRO_RP_FAILING = '''#!{python}
+print('Re-calculating nothing', flush=True)
+raise SystemExit(2)
+'''
+
+
+def _fake_ep_runs(self, epc_paths):
+    for epc_path in epc_paths:
+        _fake_ep_run(epc_path)
+    _fake_ep_runs.epc_paths = epc_paths
+
+
+def _fake_ep_run(epc_path):
+    # writes one essentials row per period file, the way eddypro_rp/fcc would
+    shard_config = EPProxy._read_ep_project(epc_path)
+    data_path = shard_config.get('RawProcess_General', 'data_path')
+    out_path = shard_config.get('Project', 'out_path')
+    rows = ['{},{},{}\n'.format(period_file[:10], period_file[11:16].replace('-', ':'), len(period_file))
+            for period_file in sorted(os.listdir(data_path), reverse=True)]
+    with open(os.path.join(out_path, 'eddypro_ADV_essentials_2019-11-0{}T120000_adv.csv'.format(len(rows))),
+              'w') as essentials:
+        essentials.write('date,time,wind_speed\n')
+        essentials.writelines(rows)
+    os.makedirs(os.path.join(out_path, 'stats'))
+    open(os.path.join(out_path, 'stats', 'eddypro_ADV_st1_2019-11-03T120000_adv.csv'), 'w').close()
+    open(os.path.join(out_path, 'eddypro_ADV_full_output_2019-11-03T120000_adv.csv'), 'w').close()
+
+
+class TestShardedEPProxy(TestCase):
+    @patch.object(EPProxy, '_run_ep_projects', _fake_ep_runs)
+    def test_shards_and_merge(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            data_path = os.path.join(tmp_dir, 'split')
+            os.makedirs(data_path)
+            periods = pd.date_range('2018-07-01 00:00', periods=10, freq='30min')
+            for period in periods:
+                open(os.path.join(data_path, '{:%Y-%m-%d_%H-%M}.csv'.format(period)), 'w').close()
+            epc_path = os.path.join(tmp_dir, 'ADV.eddypro')
+            with open(epc_path, 'w') as epc:
+                epc.write('[Project]\nfile_name={}\nout_path={}\nproject_id=ADV\n'
+                          '[RawProcess_General]\ndata_path={}\n'.format(epc_path, tmp_dir, data_path))
+            config = ConfigParser()
+            config.read_dict({'Eddy_Pro': {'Eddy_Pro_Binaries_Directory': tmp_dir,
+                                           'Eddy_Pro_Configuration_Path': epc_path,
+                                           'Keep_Eddy_Pro_Logs': '',
+                                           'Eddy_Pro_Shards': '3'}})
+            EPProxy(config=config).modify_and_run()
+
+            shard_config = EPProxy._read_ep_project(os.path.join(tmp_dir, 'shards', 'shard2', 'shard.eddypro'))
+            self.assertEqual(shard_config.get('Project', 'project_id'), 'ADV')
+            self.assertEqual(shard_config.get('Project', 'out_path'), os.path.join(tmp_dir, 'shards', 'shard2', 'out'))
+            merged = pd.read_csv(os.path.join(tmp_dir, 'eddypro_ADV_essentials_2019-11-04T120000_adv.csv'))
+            self.assertEqual(list(pd.to_datetime(merged['date'] + ' ' + merged['time'])), list(periods))
+            self.assertFalse(os.path.exists(os.path.join(tmp_dir, 'shards', 'shard2', 'out')))  # partial results
+            self.assertEqual(get_paths(target_dir=tmp_dir, file_init='eddypro_ADV_essentials', file_ext='adv.csv'),
+                             [os.path.join(tmp_dir, 'eddypro_ADV_essentials_2019-11-04T120000_adv.csv')])
+            kept_dir = os.path.join(tmp_dir, 'shard_outputs', 'shard2')  # the other outputs are kept
+            for kept_name in ['eddypro_ADV_full_output_2019-11-03T120000_adv.csv',
+                              os.path.join('stats', 'eddypro_ADV_st1_2019-11-03T120000_adv.csv')]:
+                self.assertTrue(os.path.exists(os.path.join(kept_dir, kept_name)))
+
+            for period_file in os.listdir(data_path):  # nothing to shard, the project runs as it is
+                os.remove(os.path.join(data_path, period_file))
+            EPProxy(config=config).modify_and_run()
+            self.assertEqual(_fake_ep_runs.epc_paths, [epc_path])
+
+
+class TestEPRuns(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        tmp_dir = self.tmp_dir.name
+        self.data_path = os.path.join(tmp_dir, 'split')
+        os.makedirs(self.data_path)
+        for period in pd.date_range('2018-07-01 00:00', periods=6, freq='30min'):
+            open(os.path.join(self.data_path, '{:%Y-%m-%d_%H-%M}.csv'.format(period)), 'w').close()
+        epc_path = os.path.join(tmp_dir, 'ADV.eddypro')
+        with open(epc_path, 'w') as epc:
+            epc.write('[Project]\nfile_name={}\nout_path={}\nproject_id=ADV\n'
+                      '[RawProcess_General]\ndata_path={}\n'.format(epc_path, tmp_dir, self.data_path))
+        self.bin_dir = os.path.join(tmp_dir, 'bin')
+        os.makedirs(self.bin_dir)
+        make_stand_in(os.path.join(self.bin_dir, 'eddypro_fcc.exe'), EDDYPRO_FCC)
+        self.config = ConfigParser()
+        self.config.read_dict({'Eddy_Pro': {'Eddy_Pro_Binaries_Directory': self.bin_dir,
+                                            'Eddy_Pro_Configuration_Path': epc_path,
+                                            'Keep_Eddy_Pro_Logs': '',
+                                            'Eddy_Pro_Shards': '2',
+                                            'Idle_Timeout': '10'}})
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def _fcc_runs(self):
+        fcc_runs_path = os.path.join(self.bin_dir, 'fcc_runs.txt')
+        if not os.path.exists(fcc_runs_path):
+            return []
+        with open(fcc_runs_path) as fcc_runs:
+            return sorted(fcc_runs.read().split())
+
+    def test_rp_then_fcc(self):
+        make_stand_in(os.path.join(self.bin_dir, 'eddypro_rp.exe'), EDDYPRO_RP)
+        EPProxy(config=self.config).modify_and_run()
+        shards_dir = os.path.join(self.tmp_dir.name, 'shards')
+        self.assertEqual(self._fcc_runs(), [os.path.join(shards_dir, 'shard{}'.format(n), 'shard.eddypro')
+                                            for n in range(2)])
+        merged = pd.read_csv(os.path.join(self.tmp_dir.name, 'eddypro_ADV_essentials_2019-11-03T120000_adv.csv'))
+        self.assertEqual(len(merged), 6)
+
+    def test_failed_rp(self):
+        make_stand_in(os.path.join(self.bin_dir, 'eddypro_rp.exe'), EDDYPRO_RP_FAILING)
+        with self.assertRaises(RuntimeError):
+            EPProxy(config=self.config).modify_and_run()
+        self.assertEqual(self._fcc_runs(), [])  # no fcc after an rp error code
+        self.assertFalse([name for name in os.listdir(self.tmp_dir.name) if name.startswith('eddypro_')])
@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase, skipIf
+
+from core.file import get_index, get_path, get_paths
+
+
+class TestFileIndex(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        os.makedirs(os.path.join(self.root, 'b'))
+        for file_name in ['2018-07-01_10-00.csv', '2018-07-01_09-30.csv', 'notes.txt']:
+            open(os.path.join(self.root, file_name), 'w').close()
+        open(os.path.join(self.root, 'b', '2018-07-01_09-00.csv'), 'w').close()
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def _names(self, paths):
+        return [os.path.basename(path) for path in paths]
+
+    def test_lookup_in_time_order(self):
+        paths = get_paths(target_dir=self.root, file_init='2018', file_ext='.csv')
+        self.assertEqual(self._names(paths), ['2018-07-01_09-00.csv', '2018-07-01_09-30.csv', '2018-07-01_10-00.csv'])
+        self.assertEqual(os.path.basename(get_path(target_dir=self.root, file_init='notes', file_ext='.txt')),
+                         'notes.txt')
+        self.assertIsNone(get_path(target_dir=self.root, file_init='missing', file_ext='.csv'))
+        self.assertIs(get_index(self.root), get_index(self.root + os.sep))
+
+    def test_newest_result(self):
+        results_dir = os.path.join(self.root, 'results')
+        os.makedirs(results_dir)
+        for time_stamp in ['2020-01-05T093000', '2019-11-03T120000']:
+            open(os.path.join(results_dir, 'eddypro_ADV_essentials_{}_adv.csv'.format(time_stamp)), 'w').close()
+        self.assertEqual(os.path.basename(get_path(target_dir=results_dir, file_init='eddypro_ADV_essentials',
+                                                   file_ext='adv.csv')),
+                         'eddypro_ADV_essentials_2020-01-05T093000_adv.csv')
+
+    def test_incremental_refresh(self):
+        get_paths(target_dir=self.root, file_ext='.csv')
+        os.makedirs(os.path.join(self.root, 'c'))
+        open(os.path.join(self.root, 'c', '2018-07-01_08-30.csv'), 'w').close()
+        os.remove(os.path.join(self.root, 'b', '2018-07-01_09-00.csv'))
+        os.utime(os.path.join(self.root, 'b'), ns=(0, 0))  # make sure the change is seen on coarse mtime clocks
+        os.utime(self.root, ns=(0, 0))
+        self.assertEqual(self._names(get_paths(target_dir=self.root, file_ext='.csv')),
+                         ['2018-07-01_08-30.csv', '2018-07-01_09-30.csv', '2018-07-01_10-00.csv'])
+
+    @skipIf(os.name == 'nt', 'symlinks need privileges on Windows')
+    def test_symlinks_not_followed(self):
+        os.symlink(os.path.join(self.root, 'b'), os.path.join(self.root, 'b_link'))
+        os.symlink(self.root, os.path.join(self.root, 'b', 'loop'))
+        os.symlink(os.path.join(self.root, 'notes.txt'), os.path.join(self.root, 'linked_notes.txt'))
+        paths = get_paths(target_dir=self.root, file_init='2018', file_ext='.csv')
+        self.assertEqual(self._names(paths), ['2018-07-01_09-00.csv', '2018-07-01_09-30.csv', '2018-07-01_10-00.csv'])
+        self.assertEqual(self._names(get_paths(target_dir=self.root, file_ext='.txt')),
+                         ['linked_notes.txt', 'notes.txt'])  # links to files are listed, as by os.walk
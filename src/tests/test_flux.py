@@ -0,0 +1,54 @@
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from core.flux import estimate_flux
+from core.modules import FluxEstimator
+
+
+class TestFluxEstimator(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(2)
+        self.index = pd.date_range('2018-07-01 00:00', periods=96, freq='30min')
+        self.flux = np.where(self.index.day == 1, 2., 5.)  # one source flux per day
+        self.background = rng.uniform(5., 10., len(self.index))
+        fc_n, fc_s = rng.uniform(0., 0.4, len(self.index)), rng.uniform(0., 0.4, len(self.index))
+        series = {'fc_N': fc_n, 'fc_S': fc_s,
+                  'C_N': self.background + self.flux * fc_n, 'C_S': self.background + self.flux * fc_s}
+        for name, values in series.items():
+            pd.Series(values, index=self.index).to_csv(os.path.join(self.tmp_dir.name, name + '.csv'))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def _estimator(self, interval=''):
+        config = ConfigParser()
+        config.read_dict({'Flux_Estimation': {
+            'north_fcsum_file_path': os.path.join(self.tmp_dir.name, 'fc_N.csv'),
+            'north_conc_file_path': os.path.join(self.tmp_dir.name, 'C_N.csv'),
+            'south_fcsum_file_path': os.path.join(self.tmp_dir.name, 'fc_S.csv'),
+            'south_conc_file_path': os.path.join(self.tmp_dir.name, 'C_S.csv'),
+            'estimation_interval': interval}})
+        return FluxEstimator(config=config)
+
+    def test_per_period(self):
+        estimates = self._estimator().estimate()
+        np.testing.assert_allclose(estimates['F'], self.flux)
+        np.testing.assert_allclose(estimates['C_bg'], self.background)
+
+    def test_daily_with_qc(self):
+        estimator = self._estimator('1D')
+        estimates = estimator.estimate(qc=lambda data: data['fc_N'] > 0.1)
+        passed = (estimator.data['fc_N'] > 0.1).values
+        np.testing.assert_allclose(estimates['F'][passed], self.flux[passed])
+        self.assertTrue(estimates['F'][~passed].isna().all())
+
+    def test_no_spread(self):
+        _, flux, background = estimate_flux([[0.1, 0.1], [0.1, 0.3]], [[5., 5.], [5., 5.4]])
+        self.assertTrue(np.isnan(flux[0]) and np.isnan(background[0]))
+        np.testing.assert_allclose([flux[1], background[1]], [2., 4.8])
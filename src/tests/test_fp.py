@@ -0,0 +1,63 @@
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from core.fp import FpGrdGeneratorNative, SiteConf, grid_nodes, km_footprints, km_params
+
+
+class TestKMFootprint(TestCase):
+    def setUp(self) -> None:
+        self.site = SiteConf(3., 0.05, 2000., 2000., 5., 1000., 1000.)
+        x, y = grid_nodes(self.site)
+        self.x_rel, self.y_rel = np.meshgrid(x - self.site.x_loc, y - self.site.y_loc)
+
+    def test_mass_and_direction(self):
+        params = km_params([0.3, 0.4, 0.2], [-1000., 50., -20.], self.site.z_m, self.site.z_0)
+        fps = km_footprints(params, [0.6, 0.8, 0.5], [0., 90., 225.], self.x_rel, self.y_rel)
+        total = fps.sum(axis=(1, 2)) * self.site.dx ** 2
+        self.assertTrue(np.all(total > 0.9) and np.all(total <= 1.))
+        peak = [np.unravel_index(fp.argmax(), fp.shape) for fp in fps]
+        self.assertGreater(self.y_rel[peak[0]], 0)  # northerly wind, source area north of the tower
+        self.assertGreater(self.x_rel[peak[1]], 0)  # easterly wind
+        self.assertLess(self.x_rel[peak[2]], 0)  # south-westerly wind
+        self.assertLess(self.y_rel[peak[2]], 0)
+
+    def test_generate_grd_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            epr_dir = os.path.join(tmp_dir, 'epr')
+            os.makedirs(epr_dir)
+            essentials = pd.DataFrame({'date': ['2018-07-01'] * 3,
+                                       'time': ['00:30', '01:00', '01:30'],
+                                       'wind_dir': [10., 120., -9999],
+                                       'wind_speed': [2., 3., 1.],
+                                       'u*': [0.2, 0.3, 0.1],
+                                       'L': [30., -80., 10.],
+                                       'var(v)': [0.3, 0.5, 0.2]})
+            essentials.to_csv(os.path.join(epr_dir, 'eddypro_ADV_essentials_test_adv.csv'), index=False)
+            config = ConfigParser()
+            config.read_dict({'Project': {'CPU_Cores': '2'},
+                              'Footprint': {'Eddy_Pro_Results_Directory': epr_dir,
+                                            'Footprint_Data_Output_Directory': os.path.join(tmp_dir, 'fp'),
+                                            'LegacyParameters': '3,0.05,750,750,5,375,375',
+                                            'Native_Chunk_Size': '1'}})
+            FpGrdGeneratorNative(config=config).initialize_and_run()
+            self.assertEqual(sorted(os.listdir(os.path.join(tmp_dir, 'fp'))),
+                             ['1807010030.grd', '1807010100.grd', 'fp_manifest.json'])
+            with open(os.path.join(tmp_dir, 'fp', '1807010030.grd')) as grd:
+                self.assertEqual(grd.readline().strip(), 'DSAA')
+                self.assertEqual(grd.readline().split(), ['150', '150'])
+
+            # a rerun only recomputes periods whose inputs changed
+            grd_mtimes = {name: os.stat(os.path.join(tmp_dir, 'fp', name)).st_mtime_ns
+                          for name in ['1807010030.grd', '1807010100.grd']}
+            essentials.loc[1, 'wind_dir'] = 200.
+            essentials.to_csv(os.path.join(epr_dir, 'eddypro_ADV_essentials_test_adv.csv'), index=False)
+            FpGrdGeneratorNative(config=config).initialize_and_run()
+            self.assertEqual(os.stat(os.path.join(tmp_dir, 'fp', '1807010030.grd')).st_mtime_ns,
+                             grd_mtimes['1807010030.grd'])
+            self.assertNotEqual(os.stat(os.path.join(tmp_dir, 'fp', '1807010100.grd')).st_mtime_ns,
+                                grd_mtimes['1807010100.grd'])
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from core.fp import SiteConf
+from core.fplut import FootprintLUT, FpGrdGeneratorLUT
+from core.grd import GrdData
+
+
+class TestFootprintLUT(TestCase):
+    def setUp(self) -> None:
+        self.site = SiteConf(3., 0.05, 500., 400., 5., 250., 150.)
+        rng = np.random.default_rng(3)
+        n = 12
+        self.met = pd.DataFrame({'u*': rng.uniform(.1, .6, n),
+                                 'L': rng.choice([-1, 1], n) * rng.uniform(10., 500., n),
+                                 'wind_dir': rng.uniform(0., 360., n)},
+                                index=pd.date_range('2018-07-01 00:30', periods=n, freq='30min'))
+        self.met['sigma_v'] = self.met['u*'] * rng.uniform(1., 3.5, n)
+
+    def test_errors_against_exact_model(self):
+        lut = FootprintLUT.build(self.site, *FootprintLUT.default_bins(31, 12))
+        errors = lut.errors(self.met)
+        self.assertLess(errors['l1_error'].max(), .1)
+        np.testing.assert_allclose(errors['lut_mass'], errors['exact_mass'], atol=.02)
+
+    def test_exact_on_bins(self):
+        zeta_bins, ratio_bins = np.array([-.5, .2]), np.array([1., 2.])
+        lut = FootprintLUT.build(self.site, zeta_bins, ratio_bins)
+        met = pd.DataFrame({'u*': [.3, .2], 'L': self.site.z_m / zeta_bins, 'sigma_v': [.3, .4],
+                            'wind_dir': [0., 90.]})
+        self.assertLess(lut.errors(met)['l1_error'].max(), 1e-5)  # no rotation or bin interpolation involved
+
+    def test_generator_and_cache(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            epr_dir = os.path.join(tmp_dir, 'epr')
+            os.makedirs(epr_dir)
+            essentials = pd.DataFrame({'date': self.met.index.strftime('%Y-%m-%d'),
+                                       'time': self.met.index.strftime('%H:%M'),
+                                       'wind_dir': self.met['wind_dir'].values,
+                                       'wind_speed': 2.,
+                                       'u*': self.met['u*'].values,
+                                       'L': self.met['L'].values,
+                                       'var(v)': self.met['sigma_v'].values ** 2})
+            essentials.to_csv(os.path.join(epr_dir, 'eddypro_ADV_essentials_test_adv.csv'), index=False)
+            config = ConfigParser()
+            config.read_dict({'Project': {'CPU_Cores': '2'},
+                              'Footprint': {'Eddy_Pro_Results_Directory': epr_dir,
+                                            'Footprint_Data_Output_Directory': os.path.join(tmp_dir, 'fp'),
+                                            'LegacyParameters': ','.join(map(str, self.site)),
+                                            'Native_Chunk_Size': '5',
+                                            'LUT_Cache_Directory': os.path.join(tmp_dir, 'lut'),
+                                            'LUT_Stability_Bins': '16',
+                                            'LUT_Turbulence_Bins': '6'}})
+            FpGrdGeneratorLUT(config=config).initialize_and_run()
+            self.assertEqual(len(os.listdir(os.path.join(tmp_dir, 'lut'))), 1)
+            grd = GrdData(os.path.join(tmp_dir, 'fp', '{:%y%m%d%H%M}.grd'.format(self.met.index[0])))
+            self.assertEqual(grd.data.shape, (80, 100))
+            self.assertGreater(grd.data.sum(), .5)
@@ -0,0 +1,48 @@
+from math import atan, log, pi
+from unittest import TestCase
+
+import numpy as np
+
+from res.functions import func_phi_c, func_phi_m, func_psi_m, func_stability, func_xi
+
+
+def _xi_reference(z_div_L):
+    return (1 - 16 * z_div_L) ** (1 / 4)
+
+
+def _psi_m_reference(z_div_L):  # scalar formula the array version replaces
+    if z_div_L > 0:
+        return -5 * z_div_L
+    return (2 * log((1 + _xi_reference(z_div_L)) / 2) + log((1 + _xi_reference(z_div_L) ** 2) / 2) -
+            2 * atan(_xi_reference(z_div_L)) + pi / 2)
+
+
+class TestStabilityFunctions(TestCase):
+    def setUp(self) -> None:
+        self.z_div_L = np.concatenate([np.random.default_rng(0).uniform(-5, 5, 1000), [0., -1e-9, 1e-9]])
+
+    def test_array_matches_scalar(self):
+        for func in (func_phi_m, func_phi_c, func_psi_m):
+            batched = func(self.z_div_L)
+            scalars = np.array([func(z) for z in self.z_div_L])
+            np.testing.assert_array_equal(batched, scalars)
+        self.assertIsInstance(func_phi_m(0.1), float)
+
+    def test_scalar_reference(self):
+        for z in self.z_div_L:
+            self.assertEqual(func_phi_m(z), 1 + 5 * z if z > 0 else (1 - 16 * z) ** (-1 / 4))
+            self.assertEqual(func_phi_c(z), 1 + 5 * z if z > 0 else (1 - 16 * z) ** (-1 / 2))
+        self.assertEqual(func_xi(-1.), 17 ** (1 / 4))
+
+    def test_psi_m_exact(self):
+        # both sides of the branch at 0 and down to strongly unstable
+        z_div_L = np.concatenate([self.z_div_L, -np.logspace(-12, 3, 2000), np.logspace(-12, 3, 200),
+                                  [-0., 5e-324, -5e-324, np.nextafter(0., 1.), np.nextafter(0., -1.)]])
+        np.testing.assert_array_equal(func_psi_m(z_div_L), [_psi_m_reference(z) for z in z_div_L.tolist()])
+
+    def test_stability_table(self):
+        L = np.array([-50., 20., np.nan])
+        stab = func_stability(L, 3., 0.05)
+        np.testing.assert_array_equal(stab.phi_m, func_phi_m(3. / L))
+        np.testing.assert_array_equal(stab.psi_m_0, func_psi_m(0.05 / L))
+        self.assertTrue(np.isnan(stab.psi_m[-1]))
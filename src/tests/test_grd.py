@@ -0,0 +1,58 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from core.grd import SURFER_BLANK, GrdData, write_grd
+from res._fptools import grid_average
+
+
+class TestGrdData(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.grd_path = os.path.join(self.tmp_dir.name, '1807010030.grd')
+        self.grid = np.random.default_rng(0).random((4, 6))
+        write_grd(self.grd_path, self.grid, (0., 25.), (0., 15.))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_parse_and_cache(self):
+        grd = GrdData(self.grd_path)
+        self.assertEqual((grd.header.nx, grd.header.ny), (6, 4))
+        self.assertEqual(grd.header.x_range, (0., 25.))
+        np.testing.assert_allclose(grd.data, self.grid, rtol=1e-5)
+        self.assertTrue(os.path.exists(grd.cache_path))
+
+        cached = GrdData(self.grd_path)
+        self.assertIsInstance(cached.data, np.memmap)
+        self.assertEqual(cached.header, grd.header)
+        np.testing.assert_array_equal(cached.data, grd.data)
+
+    def test_stale_cache(self):
+        GrdData(self.grd_path)
+        write_grd(self.grd_path, np.zeros((2, 3)), (0., 10.), (0., 5.))
+        os.utime(self.grd_path, ns=(0, 0))  # make sure the key changes even on coarse mtime clocks
+        grd = GrdData(self.grd_path)
+        self.assertEqual(grd.data.shape, (2, 3))
+        self.assertFalse(np.any(grd.data))
+
+
+class TestGridAverage(TestCase):
+    def test_blanks_and_nan(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            grids = [np.full((3, 4), 1.), np.full((3, 4), 3.)]
+            grids[1][0, 0] = np.nan
+            grids[0][1, 1] = grids[1][1, 1] = SURFER_BLANK
+            grd_paths = [os.path.join(tmp_dir, '180701000{}.grd'.format(n)) for n in range(2)]
+            for grd_path, grid in zip(grd_paths, grids):
+                write_grd(grd_path, grid, (0., 15.), (0., 10.))
+
+            out_paths = grid_average({'day': grd_paths, 'empty': []}, os.path.join(tmp_dir, 'out'), 2)
+            self.assertIsNone(out_paths['empty'])
+            average = GrdData(out_paths['day'], cached=False)
+            self.assertEqual(average.header.x_range, (0., 15.))
+            self.assertEqual(average.data[0, 0], 1.)
+            self.assertGreater(average.data[1, 1], 1e38)
+            self.assertEqual(average.data[2, 3], 2.)
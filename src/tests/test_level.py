@@ -0,0 +1,32 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from core.grd import write_grd
+from core.level import contribution_levels, write_grd_levels
+
+
+class TestContributionLevels(TestCase):
+    def test_levels(self):
+        grid = np.array([[[.5, .3], [.15, .05]]])
+        np.testing.assert_array_equal(contribution_levels(grid, (.45, .75, .9, .97)), [[.5, .3, .15, .05]])
+        grid_with_blank = np.array([[[.4, np.nan], [.2, 1.70141e38]]])
+        np.testing.assert_array_equal(contribution_levels(grid_with_blank, (.5,)), [[.4]])
+
+    def test_write_grd_levels(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            rng = np.random.default_rng(0)
+            grd_paths = [os.path.join(tmp_dir, '180701000{}.grd'.format(n)) for n in range(5)]
+            grids = rng.random((5, 20, 20)) ** 4
+            for grd_path, grid in zip(grd_paths, grids):
+                write_grd(grd_path, grid, (0., 95.), (0., 95.))
+            level_values = write_grd_levels(grd_paths, n_processes=2, batch_size=2)
+            self.assertEqual(level_values.shape, (5, 4))
+            self.assertTrue(np.all(np.diff(level_values, axis=1) <= 0))  # wider contours have lower values
+            with open(grd_paths[0] + '.lvl') as lvl:
+                lvl_rows = lvl.read().splitlines()
+            self.assertEqual(lvl_rows[0], 'LVL3')
+            self.assertAlmostEqual(float(lvl_rows[2].split()[0]), level_values[0, 3], places=6)
+            self.assertEqual(lvl_rows[2].split()[0], '{:8.6f}'.format(level_values[0, 3]))  # as the baseline wrote
@@ -0,0 +1,136 @@
+import json
+import os
+import tempfile
+import threading
+import tracemalloc
+from multiprocessing import Pool
+from unittest import TestCase
+
+from util.logger import ConsoleLogger, logger as default_logger
+
+
+def _log_from_worker(n):
+    @default_logger.log_action('Worker action')
+    def action():
+        default_logger.log('worker message {}'.format(n))
+
+    action()
+    return n
+
+
+class TestSpans(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.span_path = os.path.join(self.tmp_dir.name, 'spans.jsonl')
+        self.logger = ConsoleLogger()
+        self.logger.set_span_path(self.span_path, trace_memory=True)
+
+    def tearDown(self) -> None:
+        self.logger.close()
+        tracemalloc.stop()
+        self.tmp_dir.cleanup()
+
+    def _spans(self):
+        self.logger.flush()
+        with open(self.span_path) as spans:
+            return {span['name']: span for span in map(json.loads, spans)}
+
+    def test_nesting_and_memory(self):
+        @self.logger.log_action('Allocate')
+        def allocate():
+            return bytearray(8 * 1024 ** 2)
+
+        @self.logger.log_action('Allocate and free')
+        def allocate_and_free():
+            bytearray(4 * 1024 ** 2)
+
+        @self.logger.log_process('Outer')
+        def outer():
+            kept = allocate()
+            allocate_and_free()
+            return kept
+
+        outer()
+        spans = self._spans()
+        self.assertIsNone(spans['Outer']['parent_id'])
+        self.assertEqual(spans['Allocate']['parent_id'], spans['Outer']['span_id'])
+        self.assertEqual(spans['Allocate and free']['parent_id'], spans['Outer']['span_id'])
+        self.assertEqual({span['kind'] for span in spans.values()}, {'process', 'action'})
+        self.assertGreaterEqual(spans['Allocate']['tm_delta_mb'], 8)
+        self.assertLess(spans['Allocate and free']['tm_delta_mb'], 1)
+        self.assertGreaterEqual(spans['Allocate and free']['tm_peak_mb'], 4)
+        self.assertGreaterEqual(spans['Outer']['tm_peak_mb'], 12)  # child peaks count for the parent
+        self.assertGreaterEqual(spans['Outer']['wall_s'], spans['Allocate']['wall_s'])
+
+    def test_threads_overlapping(self):
+        opened, release = threading.Event(), threading.Event()
+
+        def other_thread():
+            with self.logger.span('action', 'Other thread'):
+                opened.set()
+                release.wait()
+
+        with self.logger.span('action', 'Alone'):
+            bytearray(1024 ** 2)
+        with self.logger.span('action', 'Overlapped'):
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            opened.wait()
+            release.set()
+            thread.join()
+        spans = self._spans()
+        self.assertIsNotNone(spans['Alone']['tm_peak_mb'])
+        for name in ['Overlapped', 'Other thread']:  # the process-wide peak is not theirs alone
+            self.assertIsNone(spans[name]['tm_delta_mb'])
+            self.assertIsNone(spans[name]['tm_peak_mb'])
+
+    def test_failed_span_and_profile(self):
+        profile_dir = os.path.join(self.tmp_dir.name, 'profiles')
+        self.logger.profile(['Broken'], profile_dir)
+
+        @self.logger.log_action('Broken')
+        def broken():
+            sum(range(1000))
+            raise ValueError('broken')
+
+        with self.assertRaises(ValueError):
+            broken()
+        self.assertEqual(self._spans()['Broken']['status'], 'error')
+        self.assertEqual([os.path.splitext(name)[1] for name in os.listdir(profile_dir)], ['.prof'])
+
+
+class TestQueuedLogging(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp_dir.name, 'project.log')
+        self.span_path = os.path.join(self.tmp_dir.name, 'spans.jsonl')
+        self.logger = ConsoleLogger(self.log_path)
+        self.logger.set_span_path(self.span_path)
+
+    def tearDown(self) -> None:
+        self.logger.close()
+        self.tmp_dir.cleanup()
+
+    def test_batched_writes(self):
+        self.logger.flush_interval = 60.
+        for n in range(100):
+            self.logger.log('message {}'.format(n))
+        self.assertFalse(os.path.exists(self.log_path))  # nothing written before the interval or a flush
+        self.logger.flush()
+        with open(self.log_path) as log_file:
+            lines = log_file.readlines()
+        self.assertEqual(len(lines), 100)
+        self.assertTrue(lines[-1].endswith('message 99\n'))
+
+    def test_pool_workers(self):
+        with Pool(2, *self.logger.pool_initializer) as p:
+            self.assertEqual(p.map(_log_from_worker, range(4)), list(range(4)))
+        self.logger.flush()
+        with open(self.log_path) as log_file:
+            log = log_file.read()
+        for n in range(4):
+            self.assertIn('worker message {}'.format(n), log)
+        with open(self.span_path) as span_file:
+            spans = [json.loads(line) for line in span_file]
+        self.assertEqual(len(spans), 4)
+        self.assertTrue(all(span['name'] == 'Worker action' and span['pid'] != os.getpid() for span in spans))
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+from multiprocessing import Pool
+from unittest import TestCase
+
+from util.logger import ConsoleLogger
+from util.metrics import StageMeter, chain_initializers, metrics
+
+
+def _count_records(n):
+    for _ in range(100):
+        metrics.meter('test_stage').add(1, 1024)
+    return n
+
+
+class TestMetrics(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tmp_dir.name, 'metrics.jsonl')
+        metrics.set_snapshot_path(self.snapshot_path)
+        self.default_logger = metrics.logger
+        metrics.logger = ConsoleLogger()
+
+    def tearDown(self) -> None:
+        metrics.set_snapshot_path('')
+        metrics.logger.close()
+        metrics.logger = self.default_logger
+        self.tmp_dir.cleanup()
+
+    def test_pool_workers(self):
+        with metrics.stage('test_stage', 2, target=800) as stage_meter:
+            with Pool(2, *chain_initializers(metrics.logger.pool_initializer,
+                                             metrics.pool_initializer('test_stage'))) as p:
+                p.map(_count_records, range(8), chunksize=1)
+            snapshot = stage_meter.snapshot()
+        self.assertEqual(snapshot['records'], 800)
+        self.assertAlmostEqual(snapshot['mb'], 800 / 1024, places=3)
+        self.assertEqual(snapshot['percent'], 100.)
+        self.assertEqual(sum(worker['records'] for worker in snapshot['workers']), 800)
+        self.assertNotIn(os.getpid(), [worker['pid'] for worker in snapshot['workers']])
+        with open(self.snapshot_path) as snapshot_file:
+            final = json.loads(snapshot_file.readlines()[-1])
+        self.assertTrue(final['final'])
+        self.assertEqual(final['records'], 800)
+        metrics.meter('test_stage').add()  # the stage is over, nothing to count into
+
+    def test_slots_and_stragglers(self):
+        stage_meter = StageMeter('subprocesses', 3, unit='grids', target_bytes=4000)
+        for _ in range(10):
+            stage_meter.add(nbytes=100, slot=0)
+            stage_meter.add(nbytes=100, slot=1)
+        stage_meter.add(slot=2)
+        snapshot = stage_meter.snapshot()
+        self.assertEqual([worker['records'] for worker in snapshot['workers']], [10, 10, 1])
+        self.assertEqual([worker['straggler'] for worker in snapshot['workers']], [False, False, True])
+        self.assertEqual(snapshot['percent'], 50.)
+        self.assertIn('stragglers [2]', StageMeter.format_snapshot(snapshot))
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import threading
+from configparser import ConfigParser
+from functools import partial
+from unittest import TestCase
+
+from core.pipeline import Pipeline
+from util.logger import ConsoleLogger
+
+
+def _write_pid(out_path):
+    with open(out_path, 'w') as f:
+        f.write(str(os.getpid()))
+
+
+class TestPipeline(TestCase):
+    def setUp(self) -> None:
+        self._tmp_dir = tempfile.TemporaryDirectory()
+        self.tmp_dir = self._tmp_dir.name
+        self.raw_path = os.path.join(self.tmp_dir, 'raw.txt')
+        with open(self.raw_path, 'w') as f:
+            f.write('raw')
+        self.config = ConfigParser()
+        self.config.read_dict({'Plot': {'Style': 'line'}})
+        self.runs = []
+        self.both_started = threading.Barrier(2, timeout=5)
+
+    def tearDown(self) -> None:
+        self._tmp_dir.cleanup()
+
+    def _pipeline(self):
+        pipeline = Pipeline(self.config, os.path.join(self.tmp_dir, 'checkpoints.json'), logger=ConsoleLogger())
+        pipeline.add('convert', lambda: self.runs.append('convert'), input_paths=[self.raw_path])
+        pipeline.add('stats', lambda: self.runs.append('stats'), deps=['convert'], input_paths=[self.raw_path])
+        pipeline.add('fp', self._overlapped('fp'), deps=['stats'])
+        pipeline.add('plot', self._overlapped('plot'), deps=['stats'], config_sections=['Plot'])
+        return pipeline
+
+    def _overlapped(self, name):
+        def run():
+            self.both_started.wait()  # only returns once the other stage runs at the same time
+            self.runs.append(name)
+
+        return run
+
+    def test_order_overlap_and_skip(self):
+        status = self._pipeline().run()
+        self.assertEqual(self.runs[:2], ['convert', 'stats'])
+        self.assertEqual(sorted(self.runs[2:]), ['fp', 'plot'])
+        self.assertEqual(set(status.values()), {'done'})
+
+        self.runs = []
+        status = self._pipeline().run()
+        self.assertEqual(self.runs, [])
+        self.assertEqual(set(status.values()), {'skipped'})
+
+        self.config.set('Plot', 'Style', 'bar')
+        self.both_started = threading.Barrier(1)
+        status = self._pipeline().run()
+        self.assertEqual(self.runs, ['plot'])
+        self.assertEqual(status['plot'], 'done')
+
+        self.runs = []
+        with open(self.raw_path, 'a') as f:
+            f.write('more raw')
+        self._pipeline().run(['stats'])
+        self.assertEqual(self.runs, ['convert', 'stats'])
+
+    def test_failed_stage_stops_dependents(self):
+        pipeline = self._pipeline()
+        pipeline.add('broken', lambda: 1 / 0, deps=['convert'])
+        pipeline.add('after_broken', lambda: self.runs.append('after_broken'), deps=['broken'])
+        with self.assertRaises(ZeroDivisionError):
+            pipeline.run(['after_broken'])
+        self.assertNotIn('after_broken', self.runs)
+        self.assertNotIn('broken', pipeline.checkpoints)
+
+    def test_outputs_and_processes(self):
+        out_path = os.path.join(self.tmp_dir, 'out.txt')
+
+        def pipeline():
+            stages = Pipeline(self.config, os.path.join(self.tmp_dir, 'checkpoints.json'), logger=ConsoleLogger())
+            stages.add('write', partial(_write_pid, out_path), input_paths=[self.raw_path], output_paths=[out_path],
+                       process=True)
+            return stages
+
+        self.assertEqual(pipeline().run(), {'write': 'done'})
+        with open(out_path) as f:
+            self.assertNotEqual(int(f.read()), os.getpid())
+        self.assertEqual(pipeline().run(), {'write': 'skipped'})
+        os.remove(out_path)  # same inputs, but the result is gone
+        self.assertEqual(pipeline().run(), {'write': 'done'})
+        self.assertTrue(os.path.exists(out_path))
@@ -0,0 +1,30 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+from matplotlib import image
+
+from core.plot import DailyPlotRenderer
+
+PLOT_SETTINGS = {name: {'ylim': ylim, 'style': '-', 'params': {'linewidth': 1}, 'label': name,
+                        'y_ticks': list(np.linspace(*ylim, 5))}
+                 for name, ylim in [('wind_speed', [0, 10]), ('wind_dir', [0, 360]), ('T', [0, 40]),
+                                    ('rh_air', [0, 100]), ('H', [-100, 400])]}
+
+
+class TestDailyPlotRenderer(TestCase):
+    def test_reused_figure_matches_fresh(self):
+        rng = np.random.default_rng(0)
+        time_index = pd.date_range('2018-07-01 00:30', periods=96, freq='30min')
+        data = pd.DataFrame({name: rng.uniform(*settings['ylim'], len(time_index))
+                             for name, settings in PLOT_SETTINGS.items()}, index=time_index)
+        second_day = data['2018-07-02':'2018-07-03']
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reused = DailyPlotRenderer(PLOT_SETTINGS)
+            reused.render(data['2018-07-01':'2018-07-02'], os.path.join(tmp_dir, 'first.png'))
+            reused.render(second_day, os.path.join(tmp_dir, 'reused.png'))
+            DailyPlotRenderer(PLOT_SETTINGS).render(second_day, os.path.join(tmp_dir, 'fresh.png'))
+            np.testing.assert_array_equal(image.imread(os.path.join(tmp_dir, 'reused.png')),
+                                          image.imread(os.path.join(tmp_dir, 'fresh.png')))
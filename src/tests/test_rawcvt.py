@@ -0,0 +1,156 @@
+import json
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from core.cache import RawDataCache
+from core.rawcvt import AmmoniaRawConverter, SonicRawConverter
+
+
+class TestSonicRawConverter(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)  # formats.json is looked up in the working directory
+        with open('formats.json', 'w') as fmt:
+            json.dump({'SONIC': {'parse_dates': [0]}}, fmt)
+        os.makedirs('raw')
+        rng = np.random.default_rng(0)
+        time_index = pd.date_range('2018-07-01 00:00', '2018-07-01 03:20', freq='1s')  # 1 Hz, files cut mid-period
+        raw = pd.DataFrame({'time': time_index, 'u': rng.random(len(time_index)), 'w': rng.random(len(time_index))})
+        for n, start in enumerate(range(0, len(raw), 2500)):
+            raw.iloc[start: start + 2500].to_csv(os.path.join('raw', 'sonic_{:0>3d}.csv'.format(n)), index=False)
+        self.raw = pd.concat([pd.read_csv(os.path.join('raw', raw_file), parse_dates=[0], index_col=0)
+                              for raw_file in sorted(os.listdir('raw'))])  # parsed the same way as the converter
+
+    def tearDown(self) -> None:
+        os.chdir(self._cwd)
+        self.tmp_dir.cleanup()
+
+    def _converter(self, out_dir, streaming, cache_dir=''):
+        config = ConfigParser()
+        config.read_dict({'Project': {'CPU_Cores': '1',
+                                      'Data_Periods_Start': '2018-07-01 00:00',
+                                      'Data_Periods_End': '2018-07-01 03:30',
+                                      'Data_Averaging_Interval': '30min',
+                                      'Raw_Cache_Directory': cache_dir},
+                          'Sonic': {'Raw_Data_Directory': 'raw',
+                                    'Converted_Data_Output_Directory': out_dir,
+                                    'Raw_Data_Format_Code': 'SONIC',
+                                    'Raw_Data_Initial': 'sonic',
+                                    'Raw_Data_Extension': '.csv',
+                                    'Streaming_Conversion': str(streaming)}})
+        return SonicRawConverter(config=config)
+
+    def _assert_periods(self, out_dir):
+        period_files = sorted(os.listdir(out_dir))
+        self.assertEqual(len(period_files), 8)
+        for start_time in pd.date_range('2018-07-01 00:00', periods=8, freq='30min'):
+            period_file = '{:%Y-%m-%d_%H-%M}.csv'.format(start_time)
+            with open(os.path.join(out_dir, period_file)) as converted:
+                expected = self.raw[start_time:start_time + pd.Timedelta('30min')].to_csv(index=False)
+                self.assertEqual(converted.read(), expected, period_file)
+
+    @patch('builtins.input', return_value='')
+    def test_parallel_ranges(self, _):
+        self._converter('split_parallel', False).convert_sonic_data()  # 5 single-file ranges
+        self._assert_periods('split_parallel')
+
+    @patch('builtins.input', return_value='')
+    def test_streaming(self, _):
+        streaming = self._converter('split_streaming', True)
+        self.assertTrue(streaming.streaming)
+        streaming.stream_sonic_data()
+        self._assert_periods('split_streaming')
+
+    @patch('builtins.input', return_value='')
+    def test_cached_runs(self, _):
+        self._converter('split_first', False, 'cache').convert_sonic_data()
+        with patch('pandas.read_csv', side_effect=AssertionError('raw file parsed again')):
+            self._converter('split_cached', False, 'cache').convert_sonic_data()
+        self._assert_periods('split_cached')
+
+
+class TestAmmoniaRawConverter(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+        with open('formats.json', 'w') as fmt:
+            json.dump({'NH3': {'parse_dates': [0]}}, fmt)
+        os.makedirs('raw')
+        rng = np.random.default_rng(1)
+        time_index = pd.date_range('2018-07-01 00:00:00', '2018-07-01 02:59:58', freq='2s')
+        nh3 = rng.random(len(time_index))
+        nh3[900:1800] = np.nan  # 00:30 to 01:00 without values
+        raw = pd.DataFrame({'time': time_index, 'nh3': nh3, 'h2o': rng.random(len(time_index)), 'flag': 'ok'})
+        for n, start in enumerate(range(0, len(raw), 700)):  # periods cut by file boundaries
+            raw.iloc[start: start + 700].to_csv(os.path.join('raw', 'nh3_{:0>3d}.csv'.format(n)), index=False)
+        raw = pd.concat([pd.read_csv(os.path.join('raw', raw_file), parse_dates=[0], index_col=0)
+                         for raw_file in sorted(os.listdir('raw'))])
+        self.expected = raw[['nh3', 'h2o']].shift(freq='8h').resample('30min').mean()
+
+    def tearDown(self) -> None:
+        os.chdir(self._cwd)
+        self.tmp_dir.cleanup()
+
+    def _averaged(self, parallel):
+        config = ConfigParser()
+        config.read_dict({'Project': {'CPU_Cores': '1',
+                                      'Data_Periods_Start': '2018-07-01 08:00',
+                                      'Data_Periods_End': '2018-07-01 11:00',
+                                      'Data_Averaging_Interval': '30min'},
+                          'Ammonia': {'Raw_Data_Directory': 'raw',
+                                      'Converted_Data_Output_Directory': 'averaged',
+                                      'Raw_Data_Format_Code': 'NH3',
+                                      'Raw_Data_Initial': 'nh3',
+                                      'Raw_Data_Extension': '.csv',
+                                      'Parallel_Averaging': str(parallel)}})
+        AmmoniaRawConverter(config=config).prepare_ammonia_data()
+        return pd.read_csv(os.path.join('averaged', 'data_averaged.csv'), parse_dates=[0], index_col=0)
+
+    @patch('builtins.input', return_value='')
+    def test_sequential(self, _):
+        pd.testing.assert_frame_equal(self._averaged(False), self.expected, check_names=False, check_freq=False)
+
+    @patch('builtins.input', return_value='')
+    def test_parallel_ranges(self, _):
+        pd.testing.assert_frame_equal(self._averaged(True), self.expected, check_names=False, check_freq=False)
+
+
+class TestRawDataCache(TestCase):
+    def test_keys_and_projection(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raw_path = os.path.join(tmp_dir, 'raw.csv')
+            pd.DataFrame({'time': pd.date_range('2018-07-01', periods=5, freq='1s'),
+                          'u': np.arange(5.), 'flag': list('abcde')}).to_csv(raw_path, index=False)
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            parsed = RawDataCache(cache_dir, {'parse_dates': [0]}).read(raw_path)
+
+            with patch('pandas.read_csv', side_effect=AssertionError('raw file parsed again')):
+                cached = RawDataCache(cache_dir, {'parse_dates': [0]}).read(raw_path)
+                projected = RawDataCache(cache_dir, {'parse_dates': [0]}, columns=['u']).read(raw_path)
+            pd.testing.assert_frame_equal(cached, parsed, check_dtype=False, check_index_type=False)
+            self.assertEqual(list(projected.columns), ['u'])
+            self.assertTrue(isinstance(cached.index, pd.DatetimeIndex))
+
+            self.assertIsNone(RawDataCache(cache_dir, {'parse_dates': [0], 'nrows': 3}).load(raw_path))
+            os.utime(raw_path, ns=(0, 0))
+            self.assertIsNone(RawDataCache(cache_dir, {'parse_dates': [0]}).load(raw_path))
+
+    def test_missing_text_values(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            raw_path = os.path.join(tmp_dir, 'raw.csv')
+            with open(raw_path, 'w') as raw_file:
+                raw_file.write('time,u,flag\n2018-07-01 00:00:00,1.0,a\n2018-07-01 00:00:01,,\n'
+                               '2018-07-01 00:00:02,3.0,c\n')
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            parsed = RawDataCache(cache_dir, {'parse_dates': [0]}).read(raw_path)
+            cached = RawDataCache(cache_dir, {'parse_dates': [0]}).load(raw_path)
+            self.assertTrue(pd.isna(cached['flag'].iloc[1]))
+            pd.testing.assert_frame_equal(cached, parsed, check_index_type=False)
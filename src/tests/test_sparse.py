@@ -0,0 +1,66 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from core.grd import GrdData, write_grd
+from core.sparse import SparseFootprints, truncate_grids
+from core.stack import GrdStack
+
+
+class TestSparseFootprints(TestCase):
+    def setUp(self) -> None:
+        y, x = np.mgrid[0:30, 0:40]
+        centres = [(10, 12), (20, 25), (15, 30)]
+        grids = np.stack([np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / 8.) for cy, cx in centres])
+        self.grids = grids / grids.sum(axis=(1, 2), keepdims=True)
+        self.time_index = pd.date_range('2018-07-01 00:30', periods=3, freq='30min')
+
+    def test_truncation(self):
+        indptr, indices, values, residual = truncate_grids(self.grids, .9)
+        for n, grid in enumerate(self.grids):
+            kept = grid.ravel()[indices[indptr[n]:indptr[n + 1]]]
+            np.testing.assert_allclose(kept, values[indptr[n]:indptr[n + 1]])
+            self.assertGreaterEqual(kept.sum(), .9)
+            self.assertLess(kept.sum() - kept.min(), .9)  # the smallest kept node is needed
+            self.assertAlmostEqual(kept.sum() + residual[n], 1.)
+            self.assertLess(len(kept), grid.size // 10)
+        empty = truncate_grids(np.zeros((1, 3, 3)))
+        self.assertEqual(list(empty[0]), [0, 0])
+
+    def test_grd_round_trip_and_average(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            grd_paths = []
+            for time_stamp, grid in zip(self.time_index, self.grids):
+                grd_paths.append(os.path.join(tmp_dir, '{:%y%m%d%H%M}.grd'.format(time_stamp)))
+                write_grd(grd_paths[-1], grid, (0., 195.), (0., 145.))
+            sparse = SparseFootprints.from_grd_files(grd_paths, fraction=1., time_index=self.time_index, batch_size=2)
+            sparse.save(os.path.join(tmp_dir, 'fps.npz'))
+            sparse = SparseFootprints.load(os.path.join(tmp_dir, 'fps.npz'))
+            self.assertEqual(len(sparse), 3)
+            self.assertEqual(sparse.x_range, (0., 195.))
+            self.assertTrue(sparse.time_index.equals(self.time_index))
+            np.testing.assert_allclose(sparse.to_dense(1), self.grids[1], rtol=1e-5, atol=1e-12)
+
+            sparse.write_grd(2, os.path.join(tmp_dir, 'dense.grd'))
+            np.testing.assert_allclose(GrdData(os.path.join(tmp_dir, 'dense.grd')).data, self.grids[2],
+                                       rtol=1e-5, atol=1e-12)
+
+            stack = GrdStack(os.path.join(tmp_dir, 'stack'))
+            stack.import_grd_dir(tmp_dir)
+            from_stack = SparseFootprints.from_stack(stack, fraction=1., batch_size=2)
+            np.testing.assert_allclose(from_stack.average_dense([0, 2]), stack.average([0, 2]), rtol=1e-5,
+                                       atol=1e-12)
+            self.assertTrue(np.isnan(from_stack.average_dense([])).all())
+            self.assertTrue(np.isnan(stack.average([])).all())
+            indices, values, residual = from_stack.average([1])
+            np.testing.assert_allclose(values, self.grids[1].ravel()[indices], rtol=1e-5)
+            self.assertAlmostEqual(residual, 0., places=5)
+
+    def test_blank_nodes(self):
+        grids = self.grids.copy()
+        grids[0, 10, 12] = np.nan  # blank in one of three footprints
+        sparse = SparseFootprints.from_grids(grids, fraction=1., x_range=(0., 195.), y_range=(0., 145.))
+        self.assertAlmostEqual(sparse.average_dense([0, 1, 2])[10, 12], self.grids[1:, 10, 12].sum() / 3)
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from configparser import ConfigParser
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+from core.footprint import GRDAnalyzer
+from core.grd import GrdData, write_grd
+from core.stack import GrdStack
+
+
+class TestGrdStack(TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.grd_dir = os.path.join(self.tmp_dir.name, 'grd')
+        os.makedirs(self.grd_dir)
+        self.time_stamps = pd.date_range('2018-07-01 00:30', periods=96, freq='30min')
+        for n, time_stamp in enumerate(self.time_stamps):
+            write_grd(os.path.join(self.grd_dir, '{:%y%m%d%H%M}.grd'.format(time_stamp)),
+                      np.full((3, 4), float(n)), (0., 15.), (0., 10.))
+        self.stack_dir = os.path.join(self.tmp_dir.name, 'stack')
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_import_and_append(self):
+        stack = GrdStack(self.stack_dir)
+        self.assertEqual(stack.import_grd_dir(self.grd_dir, batch_size=10), 96)
+        self.assertEqual(stack.import_grd_dir(self.grd_dir), 0)  # nothing new
+
+        reopened = GrdStack(self.stack_dir)
+        self.assertEqual(reopened.shape, (96, 3, 4))
+        self.assertTrue(reopened.time_index.equals(self.time_stamps))
+        self.assertEqual(reopened.data[5, 0, 0], 5.)
+
+        reopened.append([self.time_stamps[-1] + pd.Timedelta('30min')], np.ones((1, 3, 4)))
+        self.assertEqual(len(GrdStack(self.stack_dir)), 97)
+        with self.assertRaises(ValueError):
+            reopened.append([self.time_stamps[0]], np.ones((1, 3, 4)))
+
+    def test_interrupted_first_append(self):
+        stack = GrdStack(self.stack_dir)
+        with patch('core.stack.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                stack.append(self.time_stamps[:2], np.ones((2, 3, 4)), x_range=(0., 15.), y_range=(0., 10.))
+        self.assertFalse(os.path.exists(os.path.join(self.stack_dir, GrdStack.META_FILE)))
+        reopened = GrdStack(self.stack_dir)  # loads as empty, not with meta but no index
+        self.assertEqual(len(reopened), 0)
+        reopened.append(self.time_stamps[:2], np.ones((2, 3, 4)), x_range=(0., 15.), y_range=(0., 10.))
+        self.assertEqual(GrdStack(self.stack_dir).shape, (2, 3, 4))
+
+    def test_analyzer_groups(self):
+        group_dir = os.path.join(self.tmp_dir.name, 'groups')
+        os.makedirs(group_dir)
+        with open(os.path.join(group_dir, 'night.txt'), 'w') as gl:
+            gl.write('1807010030.grd\n1807020100\n')
+        config = ConfigParser()
+        config.read_dict({'GRD_Analysis': {'GRD_Files_Directory': self.grd_dir,
+                                           'Group_Lists_Directory': group_dir,
+                                           'FP_Stack_Directory': self.stack_dir}})
+        analyzer = GRDAnalyzer(config=config)
+        analyzer.import_grds()
+
+        hour_groups = analyzer._group_by_hour()
+        self.assertEqual(len(hour_groups), 24)
+        np.testing.assert_array_equal(hour_groups['01'], [1, 2, 49, 50])
+        day_groups = analyzer._group_by_day()
+        self.assertEqual(sorted(day_groups), ['180701', '180702', '180703'])
+        np.testing.assert_array_equal(analyzer._group_by_custom()['night'], [0, 49])
+
+        analyzer.average_groups(hour_groups, os.path.join(self.tmp_dir.name, 'hour'))
+        average = GrdData(os.path.join(self.tmp_dir.name, 'hour', '01.grd'), cached=False)
+        self.assertEqual(average.data[0, 0], np.mean([1, 2, 49, 50]))
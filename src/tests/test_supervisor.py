@@ -0,0 +1,67 @@
+import os
+import sys
+from time import time
+from unittest import TestCase
+
+from util.supervisor import Supervisor
+
+
+def _child(code):
+    return [sys.executable, '-u', '-c', code]
+
+
+class TestSupervisor(TestCase):
+    def test_statuses(self):
+        lines = []
+        supervisor = Supervisor(idle_timeout=1, kill_timeout=1)
+        supervisor.spawn('exits', _child('print("a"); print("b")'), on_line=lines.append)
+        supervisor.spawn('hangs', _child('import time; print("Note: done"); time.sleep(60)'), done_markers=('Note',))
+        supervisor.spawn('quiet', _child('import time; time.sleep(60)'))
+        supervisor.spawn('fails', _child('raise SystemExit(3)'))
+        supervisor.spawn('missing', ['/nonexistent/eddypro_rp.exe'])
+        start_time = time()
+        results = {result.name: result for result in supervisor.run()}
+        self.assertLess(time() - start_time, 10)
+        self.assertEqual(lines, ['a', 'b'])
+        self.assertEqual((results['exits'].status, results['exits'].returncode), ('exited', 0))
+        self.assertEqual(results['hangs'].status, 'finished')
+        self.assertTrue(results['hangs'].ok)
+        self.assertEqual(results['quiet'].status, 'hung')
+        self.assertEqual((results['fails'].status, results['fails'].returncode), ('exited', 3))
+        self.assertFalse(results['fails'].ok)
+        self.assertEqual(results['missing'].status, 'failed')
+
+    def test_concurrent_and_chained(self):
+        supervisor = Supervisor()
+        order = []
+
+        def first_exit(result):
+            order.append(result.name)
+            supervisor.spawn('second', _child('print("x")'), on_exit=lambda second: order.append(second.name))
+
+        start_time = time()
+        for n in range(4):
+            supervisor.spawn('sleep{}'.format(n), _child('import time; time.sleep(1)'))
+        supervisor.spawn('first', _child('pass'), on_exit=first_exit)
+        results = supervisor.run()
+        self.assertLess(time() - start_time, 3)  # run side by side, not one after another
+        self.assertEqual(len(results), 6)
+        self.assertEqual(order, ['first', 'second'])
+
+    def test_failed_callback_stops_children(self):
+        pids = []
+
+        def failing_exit(result):
+            raise OSError('cannot write results')
+
+        supervisor = Supervisor()
+        supervisor.spawn('sibling', _child('import os, time; print(os.getpid()); time.sleep(60)'),
+                         on_line=lambda line: pids.append(int(line)))
+        supervisor.spawn('failing', _child('import time; time.sleep(.5)'), on_exit=failing_exit)
+        start_time = time()
+        with self.assertRaises(OSError):
+            supervisor.run()
+        self.assertLess(time() - start_time, 10)
+        self.assertEqual(len(pids), 1)
+        with self.assertRaises(ProcessLookupError):  # stopped and reaped, not left running
+            os.kill(pids[0], 0)
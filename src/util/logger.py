@@ -1,7 +1,31 @@
-from time import strftime, localtime, time
+import atexit
+import cProfile
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from time import strftime, localtime, time, process_time
 
 from util.consle import console
 
+try:
+    import resource
+except ImportError:  # not available on Windows, no peak memory figures there
+    resource = None
+
+
+def peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024  # bytes on macOS, kilobytes elsewhere
+    return round(resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss /
+                 scale, 1)
+
 
 class Logger:
     def log(self, *args, **kwargs):
@@ -14,6 +38,18 @@ class Logger:
         raise NotImplementedError
 
 
+class _Span:
+    def __init__(self, span_id, parent, kind, name):
+        self.span_id = span_id
+        self.parent = parent
+        self.kind = kind
+        self.name = name
+        self.start_time = time()
+        self.start_cpu = process_time()
+        self.tm_start = self.tm_peak = None  # traced bytes at the start and highest since, if tracing
+        self.tm_overlaps = 0  # overlaps of spans of several threads counted when opened
+
+
 class ConsoleLogger(Logger):
     def __init__(self, log_path: str = ''):
         self._log_path = ''
@@ -22,15 +58,229 @@ class ConsoleLogger(Logger):
         self._logs = []
         self._process_phase = self._action_phase = 0
 
+        self._span_path = ''
+        self._span_ids = itertools.count(1)
+        self._local = threading.local()  # open spans of each thread, innermost last
+        # tracemalloc counts and resets the peak for the whole process, so traced memory is only given for spans
+        # during which no other thread had spans open
+        self._span_lock = threading.Lock()
+        self._span_threads = {}  # open spans per thread id
+        self._tm_overlaps = 0
+        self._profiled = set()
+        self._profile_dir = ''
+        self._profiler = 'cprofile'
+        self._profiling = False  # one profiled span at a time in the process, in any thread
+
+        self._queue = None  # records from this and worker processes, written by one thread of the main process
+        self._writer = None
+        self._flushed = threading.Event()
+        self._worker = False
+        self.flush_interval = 1.  # seconds between file writes
+
     def set_log_path(self, log_path: str):
         self._log_path = log_path
 
+    def set_span_path(self, span_path: str, *, trace_memory=False):
+        """
+        Every process and action also writes a JSON line span record to span_path: ids of itself and its parent,
+        wall and CPU time, peak RSS and, with trace_memory, the traced Python allocations
+        """
+        self._span_path = span_path
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def profile(self, names, profile_dir: str, *, profiler='cprofile'):
+        """
+        Processes and actions with one of the given names run under a profiler, cProfile by default or
+        pyinstrument if installed, stats go to profile_dir named after the span
+        """
+        self._profiled = set(names)
+        self._profile_dir = profile_dir
+        self._profiler = profiler
+
     def log(self, log_msg):
+        if self._worker:  # printed and written by the main process
+            self._queue.put(('log', strftime('[%Y-%m-%d %H:%M]', localtime(time())), log_msg))
+            return
         if self._log_path:
-            with open(self._log_path, 'a') as log_file:
-                log_file.write(strftime('[%Y-%m-%d %H:%M]', localtime(time())) + log_msg + '\n')
+            self._put(('file', self._log_path, strftime('[%Y-%m-%d %H:%M]', localtime(time())) + log_msg + '\n'))
         console.output(log_msg)
 
+    def _put(self, record):
+        if self._writer is None or not self._writer.is_alive():
+            self._start_writer()
+        self._queue.put(record)
+
+    def _start_writer(self):
+        if self._queue is None:
+            self._queue = multiprocessing.Queue()
+            atexit.register(self.close)
+        self._writer = threading.Thread(target=self._write_records, name='log-writer', daemon=True)
+        self._writer.start()
+
+    def _write_records(self):
+        # lines are collected per file and written in one go every flush_interval, or when asked to flush
+        buffers = {}
+        last_write = time()
+        while True:
+            try:
+                record = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                record = None
+            kind = record[0] if record else None
+            if kind == 'file':
+                buffers.setdefault(record[1], []).append(record[2])
+            elif kind == 'log':  # from a worker
+                console.output(record[2])
+                if self._log_path:
+                    buffers.setdefault(self._log_path, []).append(record[1] + record[2] + '\n')
+            elif kind == 'span' and self._span_path:
+                buffers.setdefault(self._span_path, []).append(record[1])
+            if kind in ('flush', 'stop') or time() - last_write >= self.flush_interval:
+                for path, lines in buffers.items():
+                    with open(path, 'a') as log_file:
+                        log_file.write(''.join(lines))
+                buffers.clear()
+                last_write = time()
+            if kind in ('flush', 'stop'):
+                self._flushed.set()
+            if kind == 'stop':
+                return
+
+    def flush(self, timeout=10.):
+        # waits until everything logged so far, by this and the worker processes, is in the files
+        if self._worker:
+            return
+        if self._writer is None or not self._writer.is_alive():
+            return
+        self._flushed.clear()
+        self._queue.put(('flush',))
+        self._flushed.wait(timeout)
+
+    def close(self, timeout=10.):
+        if self._worker or self._writer is None or not self._writer.is_alive():
+            return
+        self._flushed.clear()
+        self._queue.put(('stop',))
+        self._writer.join(timeout)
+
+    @property
+    def pool_initializer(self):
+        """
+        (initializer, initargs) for multiprocessing.Pool, workers then log and record spans through this logger
+        """
+        if self._writer is None or not self._writer.is_alive():
+            self._start_writer()
+        return _init_worker_logger, (self._queue, bool(self._span_path), self._profiled, self._profile_dir,
+                                     self._profiler)
+
+    @property
+    def _spans(self) -> list:
+        if not hasattr(self._local, 'spans'):
+            self._local.spans = []
+        return self._local.spans
+
+    @contextmanager
+    def span(self, kind: str, name: str):
+        spans = self._spans
+        span = _Span('{}-{}'.format(os.getpid(), next(self._span_ids)), spans[-1] if spans else None, kind, name)
+        thread_id = threading.get_ident()
+        with self._span_lock:
+            self._span_threads[thread_id] = self._span_threads.get(thread_id, 0) + 1
+            if len(self._span_threads) > 1:
+                self._tm_overlaps += 1
+            span.tm_overlaps = self._tm_overlaps
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            for open_span in spans:  # the peak is reset for this span, the open ones keep what they saw so far
+                if open_span.tm_peak is not None:
+                    open_span.tm_peak = max(open_span.tm_peak, peak)
+            tracemalloc.reset_peak()
+            span.tm_start = span.tm_peak = current
+        spans.append(span)
+        status = 'error'
+        try:
+            with self._profiled_span(span):
+                yield span
+            status = 'ok'
+        finally:
+            spans.pop()
+            self._close_span(span, status)
+            with self._span_lock:
+                self._span_threads[thread_id] -= 1
+                if not self._span_threads[thread_id]:
+                    del self._span_threads[thread_id]
+
+    @contextmanager
+    def _profiled_span(self, span: _Span):
+        if span.name not in self._profiled:
+            yield
+            return
+        with self._span_lock:
+            profiling, self._profiling = self._profiling, True
+        if profiling:  # profilers do not nest
+            yield
+            return
+        try:
+            os.makedirs(self._profile_dir, exist_ok=True)
+            profile_path = os.path.join(self._profile_dir, '{}_{}'.format(
+                ''.join(c if c.isalnum() else '_' for c in span.name), span.span_id))
+            profiler = self._profiler
+            if profiler == 'pyinstrument':
+                try:
+                    from pyinstrument import Profiler
+                except ImportError:
+                    console.warning_msg('pyinstrument not installed, profiling with cProfile')
+                    profiler = 'cprofile'
+            if profiler == 'pyinstrument':
+                with Profiler() as pyi_profile:
+                    yield
+                with open(profile_path + '.html', 'w') as html:
+                    html.write(pyi_profile.output_html())
+            else:
+                c_profile = cProfile.Profile()
+                c_profile.enable()
+                try:
+                    yield
+                finally:
+                    c_profile.disable()
+                    c_profile.dump_stats(profile_path + '.prof')
+        finally:
+            self._profiling = False
+
+    def _close_span(self, span: _Span, status: str):
+        tm_delta = tm_peak = None
+        if span.tm_start is not None and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            span.tm_peak = max(span.tm_peak, peak)
+            tm_delta, tm_peak = current - span.tm_start, span.tm_peak - span.tm_start
+            if span.parent is not None and span.parent.tm_peak is not None:
+                span.parent.tm_peak = max(span.parent.tm_peak, span.tm_peak)
+            tracemalloc.reset_peak()
+            with self._span_lock:
+                shared = len(self._span_threads) > 1 or self._tm_overlaps != span.tm_overlaps
+            if shared:  # other threads allocated in between, the figures are not this span's alone
+                tm_delta = tm_peak = None
+        if not self._span_path:
+            return
+        record = {'span_id': span.span_id,
+                  'parent_id': span.parent.span_id if span.parent else None,
+                  'kind': span.kind,
+                  'name': span.name,
+                  'status': status,
+                  'pid': os.getpid(),
+                  'thread': threading.current_thread().name,
+                  'start': round(span.start_time, 6),
+                  'wall_s': round(time() - span.start_time, 6),
+                  'cpu_s': round(process_time() - span.start_cpu, 6),  # the whole process, not only this thread
+                  'peak_rss_mb': peak_rss_mb(),
+                  'tm_delta_mb': None if tm_delta is None else round(tm_delta / 1024 ** 2, 3),
+                  'tm_peak_mb': None if tm_peak is None else round(tm_peak / 1024 ** 2, 3)}
+        if self._worker:
+            self._queue.put(('span', json.dumps(record) + '\n'))
+        else:
+            self._put(('file', self._span_path, json.dumps(record) + '\n'))
+
     def log_process(self, process_name, *, timed=True):
         def wrapper(process):
             def inner_wrapper(*args, **kwargs):
@@ -41,7 +291,8 @@ class ConsoleLogger(Logger):
 
                 self.log(self._process_header(self._process_phase, process_name))
                 start_time = time()
-                returned = process(*args, **kwargs)
+                with self.span('process', process_name):
+                    returned = process(*args, **kwargs)
                 run_time = time() - start_time
 
                 if timed:
@@ -64,7 +315,8 @@ class ConsoleLogger(Logger):
 
                 self.log(self._action_header(self._action_phase, action_name))
                 start_time = time()
-                returned = action(*args, **kwargs)
+                with self.span('action', action_name):
+                    returned = action(*args, **kwargs)
                 run_time = time() - start_time
 
                 if timed:
@@ -124,3 +376,14 @@ class ConsoleLogger(Logger):
 
 
 logger = ConsoleLogger()
+
+
+def _init_worker_logger(log_queue, spans, profiled, profile_dir, profiler):
+    logger._queue = log_queue
+    logger._worker = True
+    # forked workers only have the thread that forked, with the spans it had open
+    logger._span_lock = threading.Lock()
+    logger._span_threads = {threading.get_ident(): len(logger._spans)} if logger._spans else {}
+    logger._profiling = False
+    logger._span_path = 'main' if spans else ''  # records go to the span file of the main process
+    logger.profile(profiled, profile_dir, profiler=profiler)
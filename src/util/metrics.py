@@ -0,0 +1,186 @@
+"""
+Throughput of processing stages: workers, pool processes or callbacks watching subprocesses, add records and bytes
+to their own slot of a shared counter, a reporting thread of the main process prints the rates every few seconds
+and appends JSON line snapshots for tools to read
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from multiprocessing import RawArray, Value
+from statistics import median
+from time import time
+
+from util.consle import console
+from util.logger import logger as default_logger
+
+
+class StageMeter:
+    def __init__(self, name: str, n_slots: int, *, unit='records', target=None, target_bytes=None):
+        self.name = name
+        self.unit = unit
+        self.n_slots = max(int(n_slots), 1)
+        self.target = target  # records or bytes expected, either gives percent and ETA
+        self.target_bytes = target_bytes
+        self.start_time = time()
+        self._counts = RawArray('d', 2 * self.n_slots)  # records and bytes of each slot, one writer per slot
+        self._updated = RawArray('d', self.n_slots)  # time of the last update of each slot
+        self._pids = RawArray('q', self.n_slots)
+        self._n_claimed = Value('i', 0)
+        self._slot = self._pid = None
+
+    def add(self, records=1, nbytes=0, *, slot: int = None):
+        """
+        Counts records and bytes for the calling process, or for slot, e.g. one per watched subprocess
+        """
+        if slot is None:
+            if self._pid != os.getpid():
+                self._claim()
+            slot = self._slot
+        self._counts[2 * slot] += records
+        self._counts[2 * slot + 1] += nbytes
+        self._updated[slot] = time()
+
+    def _claim(self):
+        with self._n_claimed.get_lock():
+            self._slot = self._n_claimed.value % self.n_slots  # replaced pool workers share slots
+            self._n_claimed.value += 1
+        self._pid = self._pids[self._slot] = os.getpid()
+
+    def snapshot(self) -> dict:
+        now = time()
+        elapsed = max(now - self.start_time, 1e-9)
+        counts = self._counts[:]
+        workers = [{'slot': n,
+                    'pid': self._pids[n] or None,
+                    'records': int(counts[2 * n]),
+                    'mb': round(counts[2 * n + 1] / 1024 ** 2, 3),
+                    'records_per_s': round(counts[2 * n] / elapsed, 2),
+                    'idle_s': round(now - self._updated[n], 2) if self._updated[n] else None}
+                   for n in range(self.n_slots)]
+        active = [worker['records_per_s'] for worker in workers if worker['idle_s'] is not None]
+        typical = median(active) if len(active) > 1 else None
+        for worker in workers:  # well behind the others, or not started while they run
+            worker['straggler'] = typical is not None and worker['records_per_s'] < typical / 2
+        records, n_bytes = sum(counts[0::2]), sum(counts[1::2])
+        if self.target_bytes:
+            done = n_bytes / self.target_bytes
+        elif self.target:
+            done = records / self.target
+        else:
+            done = None
+        return {'stage': self.name,
+                'unit': self.unit,
+                'time': round(now, 3),
+                'elapsed_s': round(elapsed, 3),
+                'records': int(records),
+                'mb': round(n_bytes / 1024 ** 2, 3),
+                'records_per_s': round(records / elapsed, 2),
+                'mb_per_s': round(n_bytes / 1024 ** 2 / elapsed, 3),
+                'percent': None if done is None else round(min(done, 1.) * 100, 1),
+                'eta_s': round(elapsed / done * (1 - done), 1) if done and done < 1 else None,
+                'workers': workers}
+
+    @staticmethod
+    def format_snapshot(snapshot: dict) -> str:
+        # e.g. '[raw_data]  45.0% 120,000 records 40,000.0 records/s 3.2 MB/s ETA 4 s, workers 4/4, stragglers [2]'
+        line = '[{}] '.format(snapshot['stage'])
+        if snapshot['percent'] is not None:
+            line += '{:5.1f}% '.format(snapshot['percent'])
+        line += '{:,} {unit} {:,.1f} {unit}/s {:.2f} MB/s'.format(snapshot['records'], snapshot['records_per_s'],
+                                                                   snapshot['mb_per_s'], unit=snapshot['unit'])
+        if snapshot['eta_s'] is not None:
+            line += ' ETA {:.0f} s'.format(snapshot['eta_s'])
+        workers = snapshot['workers']
+        if len(workers) > 1:
+            line += ', workers {}/{}'.format(sum(worker['idle_s'] is not None for worker in workers), len(workers))
+            stragglers = [worker['slot'] for worker in workers if worker['straggler']]
+            if stragglers:
+                line += ', stragglers {}'.format(stragglers)
+        return line
+
+
+class _NullMeter:
+    def add(self, records=1, nbytes=0, *, slot: int = None):
+        pass
+
+
+_null_meter = _NullMeter()
+
+
+class Metrics:
+    def __init__(self):
+        self._meters = {}  # meters of the running stages, in workers those handed over by the pool initializer
+        self._snapshot_path = ''
+        self.interval = 5.  # seconds between reports
+        self.logger = default_logger
+
+    def set_snapshot_path(self, snapshot_path: str):
+        """
+        Every report of a running stage, and the summary at its end, is appended to snapshot_path as a JSON line
+        """
+        self._snapshot_path = snapshot_path
+
+    def meter(self, name: str):
+        # cheap to call anywhere, stages not being measured get a meter that does nothing
+        return self._meters.get(name, _null_meter)
+
+    @contextmanager
+    def stage(self, name: str, n_slots: int = 1, *, unit='records', target=None, target_bytes=None):
+        """
+        Measures a stage while inside, reporting its throughput from a thread until it ends with a summary
+        """
+        stage_meter = StageMeter(name, n_slots, unit=unit, target=target, target_bytes=target_bytes)
+        self._meters[name] = stage_meter
+        stopped = threading.Event()
+        reporter = threading.Thread(target=self._report, args=(stage_meter, stopped), name='metrics-' + name,
+                                    daemon=True)
+        reporter.start()
+        try:
+            yield stage_meter
+        finally:
+            stopped.set()
+            reporter.join()
+            self._meters.pop(name, None)
+            snapshot = stage_meter.snapshot()
+            snapshot['final'] = True
+            self._write_snapshot(snapshot)
+            self.logger.log(StageMeter.format_snapshot(snapshot))
+
+    def _report(self, stage_meter: StageMeter, stopped: threading.Event):
+        while not stopped.wait(self.interval):
+            snapshot = stage_meter.snapshot()
+            self._write_snapshot(snapshot)
+            console.output(StageMeter.format_snapshot(snapshot))
+
+    def _write_snapshot(self, snapshot: dict):
+        if self._snapshot_path:
+            with open(self._snapshot_path, 'a') as snapshot_file:
+                snapshot_file.write(json.dumps(snapshot) + '\n')
+
+    def pool_initializer(self, name: str):
+        """
+        (initializer, initargs) for multiprocessing.Pool, metrics.meter(name) of the workers then counts into the
+        running stage
+        """
+        return _init_worker_meter, (self._meters[name],)
+
+
+def chain_initializers(*initializers):
+    """
+    One (initializer, initargs) for multiprocessing.Pool out of several, e.g. of the logger and of a stage
+    """
+    return _run_initializers, (initializers,)
+
+
+def _run_initializers(initializers):
+    for initializer, initargs in initializers:
+        initializer(*initargs)
+
+
+def _init_worker_meter(stage_meter: StageMeter):
+    metrics._meters[stage_meter.name] = stage_meter
+
+
+metrics = Metrics()
@@ -0,0 +1,112 @@
+import asyncio
+from collections import namedtuple
+from time import time
+
+
+class ChildResult(namedtuple('ChildResult', ['name', 'status', 'returncode', 'run_time'])):
+    # status: 'exited' on its own, 'finished' after printing a done marker, 'hung' without output for
+    # longer than the idle timeout, 'failed' to start at all
+    @property
+    def ok(self):
+        return self.status == 'finished' or self.status == 'exited' and self.returncode == 0
+
+    def __str__(self):
+        return '[{}] {} (exit code {}) after {} seconds'.format(self.name, self.status, self.returncode,
+                                                                round(self.run_time, 2))
+
+
+class Supervisor:
+    """
+    Runs many child processes at once and reads their output as it comes, a quiet child never blocks the others
+    """
+
+    def __init__(self, *, idle_timeout: float = None, kill_timeout: float = 5):
+        self._idle_timeout = idle_timeout
+        self._kill_timeout = kill_timeout
+        self._pending = []
+        self._tasks = set()
+        self._loop = None
+        self.results = []
+
+    def spawn(self, name: str, args: list, *, cwd: str = None, on_line=None, done_markers=(), idle_timeout=None,
+              on_exit=None):
+        # may be called before run() or from on_line/on_exit callbacks while running
+        child = (name, args, cwd, on_line, tuple(done_markers), idle_timeout or self._idle_timeout, on_exit)
+        if self._loop is not None:
+            self._tasks.add(self._loop.create_task(self._supervise(*child)))
+        else:
+            self._pending.append(child)
+
+    def run(self) -> list:
+        asyncio.run(self._run())
+        return self.results
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        try:
+            for child in self._pending:
+                self._tasks.add(self._loop.create_task(self._supervise(*child)))
+            self._pending = []
+            while self._tasks:  # children spawned by callbacks join the set while waiting
+                done, _ = await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+                self._tasks -= done
+                for task in done:
+                    task.result()  # re-raise errors from callbacks
+        except BaseException:  # a failed callback or Ctrl-C, the other children are stopped before leaving
+            self._loop = None  # children spawned meanwhile are not started
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            raise
+        finally:
+            self._loop = None
+            self._tasks = set()
+            self._pending = []
+
+    async def _supervise(self, name, args, cwd, on_line, done_markers, idle_timeout, on_exit):
+        start_time = time()
+        try:
+            process = await asyncio.create_subprocess_exec(*args, cwd=cwd, stdout=asyncio.subprocess.PIPE,
+                                                           stderr=asyncio.subprocess.STDOUT)
+        except OSError:
+            self._complete(ChildResult(name, 'failed', None, time() - start_time), on_exit)
+            return
+
+        try:
+            status = 'exited'
+            while True:
+                try:
+                    line = await asyncio.wait_for(process.stdout.readline(), timeout=idle_timeout)
+                except asyncio.TimeoutError:
+                    status = 'hung'
+                    break
+                if not line:  # end of output, the child is exiting
+                    break
+                output = line.decode('utf8', errors='replace').strip()
+                if on_line is not None:
+                    on_line(output)
+                if done_markers and output.startswith(done_markers):
+                    status = 'finished'  # the programs report completion but do not quit, they are killed below
+                    break
+            if status != 'exited':
+                await self._stop(process)
+            returncode = await process.wait()
+            self._complete(ChildResult(name, status, returncode, time() - start_time), on_exit)
+        except BaseException:  # cancelled or a callback failed, the programs would never quit by themselves
+            await self._stop(process)
+            raise
+
+    async def _stop(self, process):
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), timeout=self._kill_timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+        except ProcessLookupError:  # exited meanwhile
+            pass
+
+    def _complete(self, result: ChildResult, on_exit):
+        self.results.append(result)
+        if on_exit is not None:
+            on_exit(result)